@@ -5,6 +5,7 @@ import os
 from django.conf import settings
 
 from celery import Celery
+from celery.signals import worker_process_init
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'apps.config.settings')
@@ -18,6 +19,13 @@ app.config_from_object('django.conf:settings')
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
 
 
+@worker_process_init.connect
+def warm_up_worker(**kwargs):
+    """Compile response templates before the first task is received"""
+    from apps.web.templating import warm_up_templates
+    warm_up_templates()
+
+
 @app.task(bind=True)
 def debug_task(self):
     print('Request: {0!r}'.format(self.request))
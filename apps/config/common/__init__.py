@@ -1,3 +1,6 @@
 from .constance import *
+from .database import *
 from .admin import *
 from .templates import *
+from .webhooks import *
+from .telegram import *
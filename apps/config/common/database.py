@@ -0,0 +1,27 @@
+"""SQLite connection profiles
+
+PRAGMAs of the ``SQLITE_PROFILE`` are executed on every new connection.
+``tuned`` profile switches the database to the write-ahead log, so
+readers don't block the writer and a commit doesn't wait for the full
+fsync; ``default`` restores settings SQLite uses out of the box.
+
+"""
+import os
+
+SQLITE_DEFAULT = 'default'
+SQLITE_TUNED = 'tuned'
+
+SQLITE_PROFILES = {
+    SQLITE_DEFAULT: {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+    },
+    SQLITE_TUNED: {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+    },
+}
+
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', SQLITE_TUNED)
@@ -0,0 +1,79 @@
+"""Telegram Bot API clients
+
+Clients of all bots of the process share the pool of keep-alive
+connections, ``TELEGRAM_CON_POOL_SIZE`` connections are kept per host.
+``TELEGRAM_API_URL`` may point to a local Bot API server or a fake one
+for benchmarks.
+
+"""
+import os
+
+TELEGRAM_API_URL = os.environ.get(
+    'TELEGRAM_API_URL',
+    'https://api.telegram.org/bot',
+)
+TELEGRAM_FILE_API_URL = os.environ.get(
+    'TELEGRAM_FILE_API_URL',
+    'https://api.telegram.org/file/bot',
+)
+
+TELEGRAM_CON_POOL_SIZE = int(os.environ.get('TELEGRAM_CON_POOL_SIZE', 8))
+
+# seconds
+TELEGRAM_CONNECT_TIMEOUT = 5
+TELEGRAM_READ_TIMEOUT = 5
+
+# outgoing messages are delayed to keep within Telegram limits, the limits
+# are shared by all workers with ``redis`` backend
+OUTBOUND_MEMORY = 'memory'
+OUTBOUND_REDIS = 'redis'
+
+OUTBOUND_BACKEND = os.environ.get('OUTBOUND_BACKEND', OUTBOUND_MEMORY)
+OUTBOUND_REDIS_URL = os.environ.get(
+    'OUTBOUND_REDIS_URL',
+    'redis://redis:6379/2',
+)
+
+# messages, period in seconds and burst of every limit
+OUTBOUND_BOT_LIMIT = (30, 1, 1)
+OUTBOUND_CHAT_LIMIT = (1, 1, 3)
+OUTBOUND_GROUP_LIMIT = (20, 60, 3)
+
+# worker waits for the shorter delay, the message is postponed otherwise
+OUTBOUND_MAX_WAIT = 2
+
+# messages are sent by celery workers or by the asyncio delivery service,
+# ``python manage.py run_delivery``, which takes them from Redis
+DELIVERY_CELERY = 'celery'
+DELIVERY_ASYNCIO = 'asyncio'
+
+MESSAGE_DELIVERY = os.environ.get('MESSAGE_DELIVERY', DELIVERY_CELERY)
+DELIVERY_REDIS_URL = os.environ.get(
+    'DELIVERY_REDIS_URL',
+    'redis://redis:6379/3',
+)
+# unfinished jobs of the service are kept by its name, host name by
+# default, it has to be the same after restart
+DELIVERY_WORKER_NAME = os.environ.get('DELIVERY_WORKER_NAME')
+
+# messages in flight and connections to the Bot API of the service
+DELIVERY_CONCURRENCY = int(os.environ.get('DELIVERY_CONCURRENCY', 200))
+DELIVERY_POOL_SIZE = int(os.environ.get('DELIVERY_POOL_SIZE', 50))
+# threads of the service for database and Redis calls
+DELIVERY_THREADS = int(os.environ.get('DELIVERY_THREADS', 10))
+
+# chunk failed because of network is sent again after exponential backoff
+# with jitter, seconds; it's moved to dead letters after the last attempt
+DELIVERY_ATTEMPTS = 5
+DELIVERY_BACKOFF = 1
+DELIVERY_BACKOFF_MAX = 300
+
+# sent chunks are kept while their update can be handled again and are
+# purged by ``purge_deliveries`` task or command afterwards, days
+DELIVERY_RETENTION = int(os.environ.get('DELIVERY_RETENTION', 7))
+
+# messages of the chat are routed to one of the ``messages.<n>`` celery
+# queues by the chat id, each consumed by a worker with concurrency 1, so
+# they are sent strictly in order; 0 keeps them in the default queue
+DELIVERY_CHAT_QUEUES = int(os.environ.get('DELIVERY_CHAT_QUEUES', 0))
+DELIVERY_QUEUE_PREFIX = 'messages.'
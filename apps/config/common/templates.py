@@ -1 +1,16 @@
+import os
+import tempfile
+
 JINJA2_EXTENTIONS = ('jinja2_time.TimeExtension',)
+
+# compiled response templates kept by every process
+RESPONSE_TEMPLATES_CACHE_SIZE = 2048
+
+# parsed chat template contexts kept by every process
+CHAT_CONTEXT_CACHE_SIZE = 4096
+
+# directory shared by workers to keep templates bytecode, empty to disable
+JINJA2_BYTECODE_CACHE_DIR = os.environ.get(
+    'JINJA2_BYTECODE_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'questbot-jinja2'),
+)
@@ -0,0 +1,36 @@
+"""Webhooks processing settings
+
+``inline`` - update is handled within the webhook request
+``queued`` - raw update is put to the celery queue, the request is
+acknowledged right away and the update is processed by a worker
+
+"""
+import os
+
+WEBHOOK_INLINE = 'inline'
+WEBHOOK_QUEUED = 'queued'
+
+WEBHOOK_PROCESSING_MODE = os.environ.get(
+    'WEBHOOK_PROCESSING_MODE',
+    WEBHOOK_INLINE,
+)
+
+# bots are kept by every process and reloaded after this number of seconds
+BOT_REGISTRY_TTL = 60
+
+# known users and chats kept by every process to skip queries for them
+INGEST_IDENTITY_CACHE_SIZE = 10000
+
+# updates redelivered by Telegram are rejected by the seen-set, it's shared
+# by all processes with ``redis`` backend
+DEDUP_MEMORY = 'memory'
+DEDUP_REDIS = 'redis'
+
+UPDATES_DEDUP_BACKEND = os.environ.get('UPDATES_DEDUP_BACKEND', DEDUP_MEMORY)
+UPDATES_DEDUP_REDIS_URL = os.environ.get(
+    'UPDATES_DEDUP_REDIS_URL',
+    'redis://redis:6379/1',
+)
+# Telegram keeps undelivered updates for 24 hours
+UPDATES_DEDUP_TTL = 24 * 60 * 60
+UPDATES_DEDUP_MEMORY_SIZE = 100000
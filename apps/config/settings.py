@@ -45,6 +45,13 @@ CELERY_RESULT_BACKEND = 'django-db'
 
 BROKER_URL = 'redis://redis:6379/0'
 
+CELERYBEAT_SCHEDULE = {
+    'purge-deliveries': {
+        'task': 'apps.web.tasks.purge_deliveries_task',
+        'schedule': 60 * 60,
+    },
+}
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -14,6 +14,8 @@ from apps.web.models import (
     CallbackQuery,
     Chat,
     Condition,
+    DeadLetter,
+    Delivery,
     Event,
     Handler,
     Message,
@@ -91,6 +93,27 @@ class BotAdmin(admin.ModelAdmin):
     list_filter = ('enabled', 'owner',)
 
 
+@admin.register(Delivery)
+class DeliveryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'bot', 'chat_id', 'status', 'failures', 'sent_at',)
+    list_filter = ('status', 'bot',)
+    readonly_fields = ('created', 'modified', 'sent_at',)
+
+
+@admin.register(DeadLetter)
+class DeadLetterAdmin(admin.ModelAdmin):
+    list_display = ('delivery', 'error', 'created',)
+    list_select_related = ('delivery',)
+    readonly_fields = ('delivery', 'error', 'created',)
+    actions = ('replay',)
+
+    def replay(self, request, queryset):
+        count = queryset.replay()
+        self.message_user(request, f'{count} messages are queued again')
+
+    replay.short_description = 'Send selected messages again'
+
+
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ('message_id', 'from_user', 'date',)
@@ -183,6 +206,7 @@ class HandlerAdmin(admin.ModelAdmin):
             'fields': (
                 'step_on_success',
                 'step_on_error',
+                'context_update',
             )
         }),
         ('Extra', {
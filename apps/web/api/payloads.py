@@ -0,0 +1,246 @@
+"""Fast parsing of Telegram updates
+
+Raw update is turned into plain records with only the stored fields,
+without serializers and model instances. Parser accepts only payloads it
+is sure about and raises ``PayloadError`` otherwise, such payloads are
+validated by ``UpdateModelSerializer`` as before.
+
+"""
+from django.utils import timezone
+
+from apps.web.models.chat import Chat
+
+CHAT_TYPES = frozenset(i for i, _ in Chat.CHOICES)
+
+
+class PayloadError(ValueError):
+    """Payload can't be parsed by the fast path"""
+
+
+class Record(object):
+    """Plain record, fields absent in the payload get ``defaults``"""
+    __slots__ = ()
+    defaults = {}
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name, self.defaults.get(name)))
+
+    def __eq__(self, other):
+        return (
+            type(self) is type(other) and self.as_tuple() == other.as_tuple()
+        )
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(i, getattr(self, i)) for i in self.__slots__
+        ))
+
+    def as_tuple(self) -> tuple:
+        return tuple(getattr(self, i) for i in self.__slots__)
+
+    def as_dict(self) -> dict:
+        return {i: getattr(self, i) for i in self.__slots__}
+
+
+class UserRecord(Record):
+    __slots__ = ('username', 'first_name', 'last_name', 'is_bot',
+                 'language_code')
+    defaults = {'first_name': '', 'last_name': '', 'is_bot': False}
+
+
+class ChatRecord(Record):
+    __slots__ = ('id', 'type', 'title', 'username', 'first_name', 'last_name')
+
+
+class PhotoRecord(Record):
+    __slots__ = ('file_id', 'width', 'height', 'file_size')
+
+
+class MessageRecord(Record):
+    __slots__ = ('message_id', 'date', 'chat', 'from_user', 'text', 'photos')
+    defaults = {'photos': ()}
+
+
+class CallbackQueryRecord(Record):
+    __slots__ = ('id', 'data', 'from_user', 'message')
+
+
+class UpdateRecord(Record):
+    __slots__ = ('update_id', 'bot', 'message', 'callback_query')
+
+
+def get_object(data, name, required=True):
+    value = data.get(name)
+    if value is None and not required:
+        return None
+    if not isinstance(value, dict):
+        raise PayloadError('{} must be an object'.format(name))
+    return value
+
+
+def get_integer(data, name):
+    value = data.get(name)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise PayloadError('{} must be an integer'.format(name))
+    return value
+
+
+def get_string(data, name, max_length=None, required=False,
+               allow_blank=True, allow_null=True):
+    """Get string trimmed like by serializer's ``CharField``, absent
+    optional field is ``None``"""
+    if name not in data:
+        if required:
+            raise PayloadError('{} is required'.format(name))
+        return None
+
+    value = data[name]
+    if value is None:
+        if not allow_null:
+            raise PayloadError('{} must not be null'.format(name))
+        return None
+    if not isinstance(value, str):
+        raise PayloadError('{} must be a string'.format(name))
+
+    value = value.strip()
+    if not value and not allow_blank:
+        raise PayloadError('{} must not be blank'.format(name))
+    if max_length is not None and len(value) > max_length:
+        raise PayloadError('{} is too long'.format(name))
+    return value
+
+
+def parse_user(data) -> UserRecord:
+    values = dict(
+        username=get_string(data, 'username', required=True,
+                            allow_blank=False, allow_null=False),
+        first_name=get_string(data, 'first_name', 30, allow_null=False),
+        last_name=get_string(data, 'last_name', 150, allow_null=False),
+        language_code=get_string(data, 'language_code', 10),
+    )
+    if 'is_bot' in data:
+        if not isinstance(data['is_bot'], bool):
+            raise PayloadError('is_bot must be a boolean')
+        values['is_bot'] = data['is_bot']
+
+    # absent names get defaults of the model
+    return UserRecord(**{k: v for k, v in values.items() if v is not None})
+
+
+def parse_chat(data) -> ChatRecord:
+    chat_type = data.get('type')
+    if chat_type not in CHAT_TYPES:
+        raise PayloadError('Unknown chat type {}'.format(chat_type))
+
+    return ChatRecord(
+        id=get_integer(data, 'id'),
+        type=chat_type,
+        title=get_string(data, 'title', 255),
+        username=get_string(data, 'username', 255),
+        first_name=get_string(data, 'first_name', 255),
+        last_name=get_string(data, 'last_name', 255),
+    )
+
+
+def parse_photo(data) -> PhotoRecord:
+    if not isinstance(data, dict):
+        raise PayloadError('photo must be an object')
+
+    return PhotoRecord(
+        file_id=get_string(data, 'file_id', 1000, required=True,
+                           allow_blank=False, allow_null=False),
+        width=get_integer(data, 'width'),
+        height=get_integer(data, 'height'),
+        file_size=get_integer(data, 'file_size'),
+    )
+
+
+def parse_message(data) -> MessageRecord:
+    photos = data.get('photo', ())
+    if not isinstance(photos, (list, tuple)):
+        raise PayloadError('photo must be an array')
+
+    return MessageRecord(
+        message_id=get_integer(data, 'message_id'),
+        date=timezone.datetime.fromtimestamp(get_integer(data, 'date')),
+        chat=parse_chat(get_object(data, 'chat')),
+        from_user=parse_user(get_object(data, 'from')),
+        text=get_string(data, 'text', 2500),
+        photos=tuple(parse_photo(i) for i in photos),
+    )
+
+
+def parse_callback_query(data) -> CallbackQueryRecord:
+    try:
+        callback_id = int(data.get('id'))
+    except (TypeError, ValueError):
+        raise PayloadError('id must be an integer')
+
+    return CallbackQueryRecord(
+        id=callback_id,
+        data=get_string(data, 'data', 1000, required=True,
+                        allow_blank=False, allow_null=False),
+        from_user=parse_user(get_object(data, 'from')),
+        message=parse_message(get_object(data, 'message')),
+    )
+
+
+def parse_update(data) -> UpdateRecord:
+    """Parse raw update, raise ``PayloadError`` if it's not supported"""
+    if not isinstance(data, dict):
+        raise PayloadError('Update must be an object')
+
+    message = get_object(data, 'message', required=False)
+    callback_query = get_object(data, 'callback_query', required=False)
+
+    if (message is None) == (callback_query is None):
+        raise PayloadError('Either message or callback query is expected')
+
+    return UpdateRecord(
+        update_id=get_integer(data, 'update_id'),
+        message=parse_message(message) if message is not None else None,
+        callback_query=(
+            parse_callback_query(callback_query)
+            if callback_query is not None else None
+        ),
+    )
+
+
+def from_validated_data(data) -> UpdateRecord:
+    """Build records from data validated by ``UpdateModelSerializer``"""
+
+    def user(values):
+        return UserRecord(**values)
+
+    def message(values):
+        return MessageRecord(
+            message_id=int(values['message_id']),
+            date=values['date'],
+            chat=ChatRecord(**dict(values['chat'], id=int(
+                values['chat']['id']))),
+            from_user=user(values['from_user']),
+            text=values.get('text'),
+            photos=tuple(
+                PhotoRecord(**i) for i in values.get('photo') or ()
+            ),
+        )
+
+    callback_query = data.get('callback_query')
+    if callback_query:
+        callback_query = CallbackQueryRecord(
+            id=callback_query['id'],
+            data=callback_query['data'],
+            from_user=user(callback_query['from_user']),
+            message=message(callback_query['message']),
+        )
+
+    return UpdateRecord(
+        update_id=data['update_id'],
+        bot=data['bot'],
+        message=message(data['message']) if data.get('message') else None,
+        callback_query=callback_query,
+    )
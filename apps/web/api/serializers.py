@@ -7,15 +7,16 @@ from rest_framework import serializers
 
 from constance import config
 
-from apps.web.models import AppUser, Bot, CallbackQuery, Chat, Message, Update
+from apps.web.bots import get_bot
+from apps.web.models import AppUser, CallbackQuery, Chat, Message, Update
 from apps.web.models.message import Photo
 
 
 class TelegramBot(object):
     def set_context(self, serializer_field):
-        bot_id = serializer_field.context['request'].data['hook_id']
+        bot_id = serializer_field.context['hook_id']
 
-        self.bot = Bot.objects.get(id=bot_id)
+        self.bot = get_bot(bot_id)
 
     def __call__(self):
         return self.bot
@@ -1,13 +1,22 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
 from rest_framework import status
 from rest_framework.generics import CreateAPIView
 from rest_framework.response import Response
 
 from apps.web.api.serializers import UpdateModelSerializer
-from apps.web.models import AppUser, CallbackQuery, Chat, Message, Update
-from apps.web.models.message import Photo
+from apps.web.bots import get_enabled_bot
+from apps.web.dedup import forget, is_duplicate
+from apps.web.ingest import deserialize_update, save_update
+from apps.web.models import Update
 from apps.web.utils import allowed_hooks
 
-from ..tasks import handle_message_task
+from ..tasks import handle_message_task, process_update_task
+
+logger = logging.getLogger(__name__)
 
 
 class ProcessWebHookAPIView(CreateAPIView):
@@ -18,120 +27,64 @@ class ProcessWebHookAPIView(CreateAPIView):
         2) Extract message or callback_query.message
         3) Handle this message by celery task creation
 
+    Depending on ``WEBHOOK_PROCESSING_MODE`` the update is either handled
+    within the request (``inline``) or the raw payload is put to the queue
+    and the request is acknowledged immediately (``queued``).
+
+    Update is saved and handled in a single transaction, messages are sent
+    after it's committed. Requests of unknown and disabled bots and
+    updates redelivered by Telegram are rejected before deserialization,
+    common payloads are parsed without the serializer, see
+    ``apps.web.api.payloads``.
+
     """
     serializer_class = UpdateModelSerializer
     queryset = Update.objects.all()
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['hook_id'] = self.kwargs.get('hook_id', None)
+        return context
+
     @allowed_hooks
     def post(self, request, *args, **kwargs):
-        bot_id = kwargs.get('hook_id', None)
-        self.request.data['hook_id'] = bot_id
+        hook_id = kwargs.get('hook_id')
 
-        serializer = self.get_serializer(data=request.data)
-        is_valid = serializer.is_valid()
+        if not isinstance(request.data, dict):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        if is_valid:
-            update = self.perform_create(serializer)
-        else:
-            # TODO: implement errors handling
-            print("Error has been occurred. Format is not valid.")
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        update_id = request.data.get('update_id')
 
-        headers = self.get_success_headers(serializer.data)
+        if get_enabled_bot(hook_id) is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
 
-        # handle_message_task.delay(update.id)
+        if is_duplicate(hook_id, update_id):
+            return Response(status=status.HTTP_200_OK)
 
-        handle_message_task(update.id)
+        try:
+            return self.process(request, hook_id)
+        except Exception:
+            # Telegram repeats failed request, it must not be rejected
+            forget(hook_id, update_id)
+            raise
 
-        return Response(
-            serializer.data,
-            headers=headers,
-            status=status.HTTP_201_CREATED,
-        )
-
-    def handle_message(self, data):
-        bot = data['bot']
-        user, _ = AppUser.objects.get_or_create(**data['message']['from_user'])
-        chat, _ = Chat.objects.get_or_create(**data['message']['chat'])
-        message, _ = Message.objects.get_or_create(
-            from_user=user,
-            chat=chat,
-            date=data['message']['date'],
-            text=data['message'].get('text'),
-            message_id=data['message']['message_id'],
-        )
-
-        self.attach_photo_to_message(data=data['message'], message=message)
+    def process(self, request, hook_id):
+        if settings.WEBHOOK_PROCESSING_MODE == settings.WEBHOOK_QUEUED:
+            process_update_task.delay(hook_id, request.data)
+            return Response(status=status.HTTP_202_ACCEPTED)
 
-        update, _ = Update.objects.get_or_create(
-            bot=bot,
-            message=message,
-            update_id=data['update_id'],
-        )
-        return update
+        record = deserialize_update(hook_id, request.data)
 
-    @staticmethod
-    def extract_callback_message(callback):
-        user, _ = AppUser.objects.get_or_create(
-            **callback['message']['from_user']
-        )
-        chat, _ = Chat.objects.get_or_create(
-            **callback['message']['chat']
-        )
-
-        message, _ = Message.objects.get_or_create(
-            message_id=callback['message']['message_id'],
-            from_user=user,
-            chat=chat,
-            date=callback['message']['date'],
-            text=callback['message'].get('text'),
-        )
-        return message
-
-    @staticmethod
-    def attach_photo_to_message(data, message):
-        photos = data.get('photo', [])
-        for photo in photos:
-            photo.pop('message', None)
-            Photo.objects.get_or_create(**photo, message=message)
-
-    def handle_callback(self, data):
-        bot = data['bot']
-        user, _ = AppUser.objects.get_or_create(
-            **data['callback_query']['from_user']
-        )
-        chat, _ = Chat.objects.get_or_create(
-            **data['callback_query']['message']['chat']
-        )
+        if record is None:
+            logger.warning('Update of bot {} has invalid format: {}'.format(
+                hook_id, request.data))
+            return Response(status=status.HTTP_204_NO_CONTENT)
 
-        message = data['callback_query'].get('message')
-        if message:
-            message = self.extract_callback_message(data['callback_query'])
-            self.attach_photo_to_message(
-                data=data['callback_query']['message'],
-                message=message
-            )
-
-        callback_query, _ = CallbackQuery.objects.get_or_create(
-            from_user=user,
-            message=message,
-            data=data['callback_query']['data'],
-            id=data['callback_query']['id'],
-        )
+        with transaction.atomic():
+            update, created = save_update(record)
+            if created:
+                handle_message_task(update.id)
 
-        update, _ = Update.objects.get_or_create(
-            bot=bot,
-            callback_query=callback_query,
-            update_id=data['update_id'],
+        return Response(
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
         )
-        return update
-
-    def perform_create(self, serializer):
-        data = serializer.validated_data
-
-        if 'message' in data:
-            update = self.handle_message(data)
-        else:
-            update = self.handle_callback(data)
-
-        return update
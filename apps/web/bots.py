@@ -0,0 +1,85 @@
+"""Bots resolved by hook id
+
+Bots are few and read by every webhook request and every sent message,
+so all of them are loaded at once and kept by the process. The registry
+is reloaded after ``BOT_REGISTRY_TTL`` seconds or right after a bot is
+saved or deleted in this process, other processes see the change after
+the timeout. Clients of rotated tokens are discarded on reloading.
+
+Unknown hook ids are answered by the loaded registry, so their requests
+cause no queries.
+
+"""
+import time
+import uuid
+
+from django.conf import settings
+
+from apps.web.clients import discard_client
+from apps.web.models.bot import Bot
+
+
+def normalize_hook_id(hook_id):
+    """Return canonical hook id or ``None`` if it's not a valid one"""
+    try:
+        return str(uuid.UUID(str(hook_id)))
+    except ValueError:
+        return None
+
+
+class BotRegistry(object):
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.bots = None
+        self.expires = 0
+
+    def load(self):
+        previous = self.bots or {}
+        bots = {}
+
+        for bot in Bot.objects.all():
+            bots[bot.hook_id] = bot
+
+        # clients of rotated tokens and removed bots are not needed anymore
+        tokens = {bot.token for bot in bots.values()}
+        for bot in previous.values():
+            if bot.token not in tokens:
+                discard_client(bot.token)
+
+        self.bots = bots
+        self.expires = time.monotonic() + self.ttl
+
+    def get(self, hook_id):
+        """Return the bot or ``None`` if it's unknown"""
+        hook_id = normalize_hook_id(hook_id)
+        if hook_id is None:
+            return None
+
+        if self.bots is None or time.monotonic() >= self.expires:
+            self.load()
+        return self.bots.get(hook_id)
+
+    def clear(self):
+        self.expires = 0
+
+
+_registry = BotRegistry(settings.BOT_REGISTRY_TTL)
+
+
+def get_bot(hook_id) -> Bot:
+    """Return the bot by its hook id or ``None`` if it's unknown"""
+    return _registry.get(hook_id)
+
+
+def get_enabled_bot(hook_id) -> Bot:
+    """Return the bot if it's known and enabled, ``None`` otherwise"""
+    bot = _registry.get(hook_id)
+    if bot is None or not bot.enabled:
+        return None
+    return bot
+
+
+def forget_bots():
+    """Reload bots on the next request"""
+    _registry.clear()
@@ -0,0 +1,131 @@
+"""Variables of the chat available in response templates
+
+Context is stored as JSON in ``Chat.template_context``. It's parsed once
+per distinct value and changed by operations of handlers:
+
+    {"$inc": {"score": 10}, "$set": {"level": "cave"}}
+
+Operations are applied to the local copy right away, so the following
+responses render new values, and are written at the end of the update
+handling together with other changes of the chat. Stored context is
+re-read under the row lock on writing, so increments of concurrent
+updates of the chat are not lost.
+
+"""
+import json
+import logging
+from functools import lru_cache
+from types import MappingProxyType
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from apps.web.models.chat import Chat
+from apps.web.utils import jinja2_template_context
+
+logger = logging.getLogger(__name__)
+
+INCREMENT = '$inc'
+SET = '$set'
+
+OPERATORS = (INCREMENT, SET)
+
+
+@lru_cache(maxsize=settings.CHAT_CONTEXT_CACHE_SIZE)
+def parse_template_context(raw) -> MappingProxyType:
+    """Parse stored context, the result is shared so it's read-only"""
+    return MappingProxyType(jinja2_template_context(raw or '{}'))
+
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def apply_operations(data, operations) -> dict:
+    """Return copy of the context with applied ``(operator, key, value)``"""
+    data = dict(data)
+
+    for operator, key, value in operations:
+        if operator == INCREMENT:
+            current = data.get(key, 0)
+            if not is_number(current):
+                logger.warning('Context value {} is not a number: {}'.format(
+                    key, current))
+                current = 0
+            data[key] = current + value
+        elif operator == SET:
+            data[key] = value
+
+    return data
+
+
+class ChatContext(object):
+    __slots__ = ('chat', 'data', 'operations')
+
+    def __init__(self, chat: Chat):
+        self.chat = chat
+        self.data = parse_template_context(chat.template_context)
+        self.operations = []
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    @property
+    def is_changed(self) -> bool:
+        return bool(self.operations)
+
+    def update(self, operations: dict):
+        """Apply handler operations, i.e. ``{'$inc': {'score': 1}}``"""
+        operations = [
+            (operator, key, value)
+            for operator in OPERATORS
+            for key, value in operations.get(operator, {}).items()
+        ]
+
+        self.data = apply_operations(self.data, operations)
+        self.operations.extend(operations)
+
+    def set(self, key, value):
+        self.update({SET: {key: value}})
+
+    def increment(self, key, amount=1):
+        self.update({INCREMENT: {key: amount}})
+
+    def flush(self, **fields) -> bool:
+        """Write changed keys and other ``fields`` of the chat at once
+
+        Return if the chat was written
+
+        """
+        if not self.operations and not fields:
+            return False
+
+        with transaction.atomic(savepoint=False):
+            if self.operations:
+                raw = Chat.objects.select_for_update().values_list(
+                    'template_context',
+                    flat=True,
+                ).get(id=self.chat.id)
+
+                data = apply_operations(
+                    parse_template_context(raw),
+                    self.operations,
+                )
+                fields['template_context'] = json.dumps(
+                    data,
+                    ensure_ascii=False,
+                )
+
+            fields['modified'] = timezone.now()
+            Chat.objects.filter(id=self.chat.id).update(**fields)
+
+        if self.operations:
+            self.chat.template_context = fields['template_context']
+            self.data = parse_template_context(self.chat.template_context)
+            self.operations = []
+
+        return True
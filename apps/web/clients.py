@@ -0,0 +1,79 @@
+"""Telegram clients kept by the process
+
+Client is created once per bot token and all clients share a single
+``Request``, i.e. the pool of keep-alive connections to the Bot API, so
+sent messages don't pay TCP and TLS setup. Forked worker processes create
+their own pool, connections of the parent are not used.
+
+"""
+import os
+
+from django.conf import settings
+
+from telegram.bot import Bot as TelegramBot
+from telegram.utils.request import Request
+
+
+class ClientPool(object):
+
+    def __init__(self, base_url=None, base_file_url=None, con_pool_size=None):
+        self.base_url = base_url
+        self.base_file_url = base_file_url
+        self.con_pool_size = con_pool_size
+        self.request = None
+        self.pid = None
+        self.clients = {}
+
+    def create_request(self) -> Request:
+        return Request(
+            con_pool_size=(
+                self.con_pool_size or settings.TELEGRAM_CON_POOL_SIZE
+            ),
+            connect_timeout=settings.TELEGRAM_CONNECT_TIMEOUT,
+            read_timeout=settings.TELEGRAM_READ_TIMEOUT,
+        )
+
+    def get(self, token) -> TelegramBot:
+        """Return client of the token, raise ``InvalidToken`` if it's not
+        valid"""
+        if self.pid != os.getpid():
+            self.clients = {}
+            self.request = self.create_request()
+            self.pid = os.getpid()
+
+        client = self.clients.get(token)
+        if client is None:
+            client = TelegramBot(
+                token,
+                base_url=self.base_url or settings.TELEGRAM_API_URL,
+                base_file_url=(
+                    self.base_file_url or settings.TELEGRAM_FILE_API_URL
+                ),
+                request=self.request,
+            )
+            self.clients[token] = client
+
+        return client
+
+    def discard(self, token):
+        self.clients.pop(token, None)
+
+    def close(self):
+        """Drop clients and close connections"""
+        if self.request is not None and self.pid == os.getpid():
+            self.request.stop()
+        self.clients = {}
+        self.request = None
+        self.pid = None
+
+
+_pool = ClientPool()
+
+
+def get_client(token) -> TelegramBot:
+    return _pool.get(token)
+
+
+def discard_client(token):
+    """Forget client of the rotated or removed token"""
+    _pool.discard(token)
@@ -0,0 +1,113 @@
+"""Values derived from the update, computed once per its handling
+
+``UpdateContext`` is passed through handlers, conditions and responses
+instead of the update, so related objects, normalized texts and template
+variables are resolved a single time and conditions results are shared
+between all handlers of the step.
+
+Changes of the chat and the session are collected by the context and
+written once at the end of the handling, in a single transaction, and
+outgoing messages are collected by its ``Outbox``.
+
+"""
+from django.db import transaction
+
+from apps.web.chat_context import ChatContext
+from apps.web.delivery import Outbox
+from apps.web.models.condition import (
+    ANY_MESSAGE,
+    CALLBACK_DATA,
+    CALLBACK_MESSAGE_TEXT,
+    MESSAGE_TEXT,
+)
+from apps.web.models.update import Update
+
+
+def normalize_text(text) -> str:
+    return (text or '').strip().lower()
+
+
+class UpdateContext(object):
+    __slots__ = (
+        'update',
+        'bot',
+        'message',
+        'callback_query',
+        'chat',
+        'sender',
+        'callback_data',
+        'action_type',
+        'has_photos',
+        'received',
+        'texts',
+        'chat_context',
+        'results',
+        'changes',
+        'writes',
+        'outbox',
+    )
+
+    def __init__(self, update: Update):
+        self.update = update
+        self.bot = update.bot
+        self.message = update.get_message
+        self.callback_query = update.callback_query
+        self.chat = self.message.chat
+        self.sender = update.get_sender
+        self.callback_data = (
+            self.callback_query.data if self.callback_query else None
+        )
+        self.action_type = update.action_type
+        self.has_photos = update.has_photos
+        self.received = update.modified
+
+        message_text = normalize_text(self.message.text)
+        is_message = update.message_id is not None
+        self.texts = {
+            ANY_MESSAGE: message_text,
+            MESSAGE_TEXT: message_text if is_message else '',
+            CALLBACK_MESSAGE_TEXT: '' if is_message else message_text,
+            CALLBACK_DATA: normalize_text(self.callback_data),
+        }
+
+        self.chat_context = ChatContext(self.chat)
+
+        # results of conditions checked during the update handling
+        self.results = {}
+
+        # changed fields by instance and number of written rows
+        self.changes = {}
+        self.writes = 0
+
+        # messages are sent after the handling is committed
+        self.outbox = Outbox(self.bot.id)
+
+    def get_text(self, matched_field) -> str:
+        """Return normalized text of the field checked by conditions"""
+        return self.texts.get(matched_field, '')
+
+    def mark_changed(self, instance, *fields):
+        """Remember changed fields of the chat or session to write later"""
+        self.changes.setdefault(instance, set()).update(fields)
+
+    def flush(self) -> int:
+        """Write all collected changes, return number of written rows"""
+        if not self.changes and not self.chat_context.is_changed:
+            return self.writes
+
+        chat_fields = {
+            name: getattr(self.chat, name)
+            for name in self.changes.pop(self.chat, ())
+        }
+
+        with transaction.atomic(savepoint=False):
+            if self.chat_context.flush(**chat_fields):
+                self.writes += 1
+
+            for instance, fields in self.changes.items():
+                instance.save(update_fields=sorted(fields) + ['modified'])
+                self.writes += 1
+
+        self.changes = {}
+
+        return self.writes
@@ -1,253 +1,246 @@
-_version__ = '11.7.17'
-# See license text in pyparsing.py
-
-# Modifications by Glenn Linderman, same license
-#
-# Python 3.2
-# Eliminate LE and friends, stick with Python comparison ops
-# Merge separate precedence lists
-# Make a single class Arith to be the interface
-# Keep vars_ in Arith instances, so multiple instances could have
-#   different vars/values
-# Add // and % to multOp & EvalMultOp
-# Keep integer values as integers until something converts them
-# Allow longer var names
-
-# Based on:
-#
-# eval_arith.py
-#
-# Copyright 2009, Paul McGuire
-#
-# Expansion on the pyparsing example simpleArith.py, to include evaluation
-# of the parsed tokens.
-
-from pyparsing import Word, nums, alphas, Combine, oneOf, Optional, \
-    opAssoc, operatorPrecedence
-
-
-class EvalConstant():
-    "Class to evaluate a parsed constant or variable"
-
-    def __init__(self, tokens):
-        self.value = tokens[0]
+"""Safe evaluation of arithmetic expressions with comparisons
+
+Operators from the highest precedence to the lowest one:
+    sign: ``+ -``
+    multiplication: ``* / // %``
+    addition: ``+ -``
+    comparison: ``< <= > >= == != <>``, chained like in Python
+
+Operands are integers, reals (``1.5``, ``12e2``), variables consisting of
+letters and expressions in parentheses. Integer values are kept integers
+until something converts them.
+
+Expression is parsed by a hand-written Pratt parser into a tree of
+closures, so compiled expression is evaluated without any parsing.
+Evaluation is short-circuited: chained comparison stops at the first
+false one and the right operand of multiplication isn't evaluated if the
+left one is integer zero.
+
+"""
+import operator
+import re
+from functools import lru_cache
+
+TOKENS = re.compile(r'''
+    \s*(?:
+        (?P<real>\d+(?:\.\d+)?[eE][-+]?\d+|\d+\.\d+)
+        |(?P<integer>\d+)
+        |(?P<variable>[a-zA-Z]+)
+        |(?P<operator>//|<=|>=|==|!=|<>|[-+*/%<>()])
+    )
+''', re.VERBOSE)
+
+SIGN_OPERATORS = {
+    '+': operator.pos,
+    '-': operator.neg,
+}
+
+BINARY_OPERATORS = {
+    '*': operator.mul,
+    '/': operator.truediv,
+    '//': operator.floordiv,
+    '%': operator.mod,
+    '+': operator.add,
+    '-': operator.sub,
+}
+
+COMPARISON_OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<>': operator.ne,
+}
+
+COMPARISON_POWER = 10
+ADDITION_POWER = 20
+MULTIPLICATION_POWER = 30
+SIGN_POWER = 40
+
+BINDING_POWER = {
+    '*': MULTIPLICATION_POWER,
+    '/': MULTIPLICATION_POWER,
+    '//': MULTIPLICATION_POWER,
+    '%': MULTIPLICATION_POWER,
+    '+': ADDITION_POWER,
+    '-': ADDITION_POWER,
+}
+BINDING_POWER.update({i: COMPARISON_POWER for i in COMPARISON_OPERATORS})
+
+
+class ParseException(ValueError):
+    """Expression is not valid"""
+
+
+def tokenize(string):
+    """Split expression into ``(kind, value)`` pairs"""
+    tokens = []
+    position = 0
+    end = len(string.rstrip())
+
+    while position < end:
+        match = TOKENS.match(string, position)
+        if not match:
+            raise ParseException(
+                'Unexpected symbol at {}: {}'.format(position, string))
+        position = match.end()
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+
+    return tokens
+
+
+def constant_node(value):
+    return lambda vars_: value
+
+
+def variable_node(name):
+    def variable(vars_):
+        if name in vars_:
+            return vars_[name]
+        raise ValueError('Variable {} is not defined'.format(name))
+    return variable
+
+
+def sign_node(fn, operand):
+    return lambda vars_: fn(operand(vars_))
+
+
+def binary_node(fn, left, right):
+    if fn is operator.mul:
+        return multiplication_node(left, right)
+    return lambda vars_: fn(left(vars_), right(vars_))
+
+
+def multiplication_node(left, right):
+    def multiplication(vars_):
+        value = left(vars_)
+        if value == 0 and isinstance(value, int):
+            return 0
+        return value * right(vars_)
+    return multiplication
+
+
+def comparison_node(operands, operators):
+    def comparison(vars_):
+        left = operands[0](vars_)
+        for fn, operand in zip(operators, operands[1:]):
+            right = operand(vars_)
+            if not fn(left, right):
+                return False
+            left = right
+        return True
+    return comparison
+
+
+class Parser():
+    """Pratt parser building tree of closures from the list of tokens"""
+
+    def __init__(self, string):
+        self.string = string
+        self.tokens = tokenize(string)
+        self.position = 0
+
+    def error(self, message):
+        return ParseException('{}: {}'.format(message, self.string))
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None, None
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self):
+        node = self.expression(0)
+        if self.position != len(self.tokens):
+            raise self.error('Unexpected {}'.format(self.peek()[1]))
+        return node
 
-    def eval(self, vars_):
-        if self.value in vars_:
-            return vars_[self.value]
-        else:
-            try:
-                return int(self.value)
-            except:
-                return float(self.value)
-
-
-class EvalSignOp():
-    "Class to evaluate expressions with a leading + or - sign"
-
-    def __init__(self, tokens):
-        self.sign, self.value = tokens[0]
-
-    def eval(self, vars_):
-        mult = {'+': 1, '-': -1}[self.sign]
-        return mult * self.value.eval(vars_)
-
-
-def operatorOperands(tokenlist):
-    "generator to extract operators and operands in pairs"
-    it = iter(tokenlist)
-    while 1:
-        try:
-            o1 = next(it)
-            o2 = next(it)
-            yield (o1, o2)
-        except StopIteration:
-            break
+    def expression(self, power):
+        node = self.operand()
 
+        while True:
+            kind, value = self.peek()
+            if kind != 'operator' or BINDING_POWER.get(value, 0) <= power:
+                return node
 
-class EvalMultOp():
-    "Class to evaluate multiplication and division expressions"
+            if value in COMPARISON_OPERATORS:
+                node = self.comparison(node)
+            else:
+                self.next()
+                right = self.expression(BINDING_POWER[value])
+                node = binary_node(BINARY_OPERATORS[value], node, right)
+
+    def comparison(self, left):
+        operands = [left]
+        operators = []
 
-    def __init__(self, tokens):
-        self.value = tokens[0]
-
-    def eval(self, vars_):
-        prod = self.value[0].eval(vars_)
-        for op, val in operatorOperands(self.value[1:]):
-            if op == '*':
-                prod *= val.eval(vars_)
-            if op == '/':
-                prod /= val.eval(vars_)
-            if op == '//':
-                prod //= val.eval(vars_)
-            if op == '%':
-                prod %= val.eval(vars_)
-        return prod
+        while True:
+            kind, value = self.peek()
+            if kind != 'operator' or value not in COMPARISON_OPERATORS:
+                break
+            self.next()
+            operators.append(COMPARISON_OPERATORS[value])
+            operands.append(self.expression(COMPARISON_POWER))
+
+        return comparison_node(tuple(operands), tuple(operators))
+
+    def operand(self):
+        kind, value = self.next()
+
+        if kind == 'integer':
+            return constant_node(int(value))
+        if kind == 'real':
+            return constant_node(float(value))
+        if kind == 'variable':
+            return variable_node(value)
+        if value in SIGN_OPERATORS:
+            return sign_node(
+                SIGN_OPERATORS[value],
+                self.expression(SIGN_POWER),
+            )
+        if value == '(':
+            node = self.expression(0)
+            if self.next()[1] != ')':
+                raise self.error('Expected )')
+            return node
 
+        raise self.error('Unexpected {}'.format(value or 'end'))
 
-class EvalAddOp():
-    "Class to evaluate addition and subtraction expressions"
 
-    def __init__(self, tokens):
-        self.value = tokens[0]
+class CompiledExpression():
+    "Expression parsed once, can be evaluated with different variables"
 
-    def eval(self, vars_):
-        sum = self.value[0].eval(vars_)
-        for op, val in operatorOperands(self.value[1:]):
-            if op == '+':
-                sum += val.eval(vars_)
-            if op == '-':
-                sum -= val.eval(vars_)
-        return sum
-
-
-class EvalComparisonOp():
-    "Class to evaluate comparison expressions"
-    opMap = {
-        "<": lambda a, b: a < b,
-        "<=": lambda a, b: a <= b,
-        ">": lambda a, b: a > b,
-        ">=": lambda a, b: a >= b,
-        "==": lambda a, b: a == b,
-        "!=": lambda a, b: a != b,
-    }
-
-    def __init__(self, tokens):
-        self.value = tokens[0]
+    def __init__(self, strExpr):
+        self.tree = Parser(strExpr).parse()
 
     def eval(self, vars_):
-        val1 = self.value[0].eval(vars_)
-        for op, val in operatorOperands(self.value[1:]):
-            fn = self.opMap[op]
-            val2 = val.eval(vars_)
-            if not fn(val1, val2):
-                break
-            val1 = val2
-        else:
-            return True
-        return False
+        return self.tree(vars_)
 
 
 class Arith():
-    # define the parser
-    integer = Word(nums)
-    real = (Combine(Word(nums) + Optional("." + Word(nums))
-                    + oneOf("E e") + Optional(oneOf('+ -')) + Word(nums))
-            | Combine(Word(nums) + "." + Word(nums))
-            )
-
-    variable = Word(alphas)
-    operand = real | integer | variable
-
-    signop = oneOf('+ -')
-    multop = oneOf('* / // %')
-    plusop = oneOf('+ -')
-    comparisonop = oneOf("< <= > >= == != <>")
-
-    # use parse actions to attach EvalXXX constructors to sub-expressions
-    operand.setParseAction(EvalConstant)
-    arith_expr = operatorPrecedence(operand,
-                                    [(signop, 1, opAssoc.RIGHT, EvalSignOp),
-                                     (multop, 2, opAssoc.LEFT, EvalMultOp),
-                                     (plusop, 2, opAssoc.LEFT, EvalAddOp),
-                                     (comparisonop, 2, opAssoc.LEFT,
-                                      EvalComparisonOp),
-                                     ])
-
-    def __init__(self, vars_={}):
-        self.vars_ = vars_
+    def __init__(self, vars_=None):
+        self.vars_ = vars_ if vars_ is not None else {}
 
     def setvars(self, vars_):
         self.vars_ = vars_
 
-    def setvar(var, val):
+    def setvar(self, var, val):
         self.vars_[var] = val
 
     def eval(self, strExpr):
-        ret = self.arith_expr.parseString(strExpr, parseAll=True)[0]
-        result = ret.eval(self.vars_)
-        return result
-
-
-if __name__ == '__main__':
-    def main():
-        # sample expressions posted on comp.lang.python, asking for advice
-        # in safely evaluating them
-        rules = [
-            '( A - B ) == 0',
-            '(A + B + C + D + E + F + G + H + I) == J',
-            '(A + B + C + D + E + F + G + H) == I',
-            '(A + B + C + D + E + F) == G',
-            '(A + B + C + D + E) == (F + G + H + I + J)',
-            '(A + B + C + D + E) == (F + G + H + I)',
-            '(A + B + C + D + E) == F',
-            '(A + B + C + D) == (E + F + G + H)',
-            '(A + B + C) == (D + E + F)',
-            '(A + B) == (C + D + E + F)',
-            '(A + B) == (C + D)',
-            '(A + B) == (C - D + E - F - G + H + I + J)',
-            '(A + B) == C',
-            '(A + B) == 0',
-            '(A+B+C+D+E) == (F+G+H+I+J)',
-            '(A+B+C+D) == (E+F+G+H)',
-            '(A+B+C+D)==(E+F+G+H)',
-            '(A+B+C)==(D+E+F)',
-            '(A+B)==(C+D)',
-            '(A+B)==C',
-            '(A-B)==C',
-            '(A/(B+C))',
-            '(B/(C+D))',
-            '(G + H) == I',
-            '-0.99 <= ((A+B+C)-(D+E+F+G)) <= 0.99',
-            '-0.99 <= (A-(B+C)) <= 0.99',
-            '-1000.00 <= A <= 0.00',
-            '-5000.00 <= A <= 0.00',
-            'A < B',
-            'A < 7000',
-            'A == -(B)',
-            'A == C',
-            'A == 0',
-            'A > 0',
-            'A > 0.00',
-            'A > 7.00',
-            'A <= B',
-            'A < -1000.00',
-            'A < -5000',
-            'A < 0',
-            'A==(B+C+D)',
-            'A==B',
-            'I == (G + H)',
-            '0.00 <= A <= 4.00',
-            '4.00 < A <= 7.00',
-            '0.00 <= A <= 4.00 <= E > D',
-            '123E0 > 1000E-1 > 99.0987',
-            '123E+0',
-            '1000E-1',
-            '99.0987',
-            'abc',
-            '20 % 3',
-            '14 // 3',
-            '12e2 // 3.7',
-        ]
-        vars_ = {'A': 0, 'B': 1.1, 'C': 2.2, 'D': 3.3, 'E': 4.4, 'F': 5.5, 'G':
-            6.6, 'H': 7.7, 'I': 8.8, 'J': 9.9, "abc": 20, }
-
-        # define tests from given rules
-        tests = []
-        for t in rules:
-            tests.append((t, eval(t, vars_)))
-
-        # copy vars_ to EvalConstant lookup dict
-        arith = Arith(vars_)
-        for test, expected in tests:
-            result = arith.eval(test)
-            print(test, expected, result)
-            # print( ret )
-            if expected != result:
-                print("*" * 60)
-
-
-    # main()
+        return compile(strExpr).eval(self.vars_)
+
+
+@lru_cache(maxsize=1024)
+def compile(string):
+    """Parse expression, variables are substituted on evaluation"""
+    return CompiledExpression(string)
 
 
 def eval(string, lookup=None):
@@ -255,4 +248,3 @@ def eval(string, lookup=None):
     res = Arith(lookup).eval(string)
 
     return res
-
@@ -0,0 +1,151 @@
+"""Rejection of updates redelivered by Telegram
+
+Telegram repeats the webhook request if it isn't answered in time, so the
+same update may arrive several times, even concurrently. Received updates
+are added to the seen-set before deserialization and repeated ones are
+rejected right away. Unique ``(bot, update_id)`` of ``Update`` is the
+last line of defence.
+
+"""
+import logging
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = 'questbot:updates:'
+
+_seen_set = None
+
+
+class MemorySeenSet(object):
+    """Seen-set of the process, the oldest keys are evicted"""
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.expires = OrderedDict()
+        self.rejected = 0
+
+    def expire(self, now):
+        # keys are ordered by expiration since ttl is the same
+        while self.expires:
+            key, expires = next(iter(self.expires.items()))
+            if expires > now:
+                break
+            del self.expires[key]
+
+    def add(self, key) -> bool:
+        """Mark key as seen, return ``False`` if it's seen already"""
+        now = time.monotonic()
+        self.expire(now)
+
+        if key in self.expires:
+            return False
+
+        self.expires[key] = now + self.ttl
+        if len(self.expires) > self.maxsize:
+            self.expires.popitem(last=False)
+        return True
+
+    def discard(self, key):
+        self.expires.pop(key, None)
+
+    def count_rejected(self):
+        self.rejected += 1
+
+    def get_rejected(self) -> int:
+        return self.rejected
+
+
+class RedisSeenSet(object):
+    """Seen-set shared by all processes"""
+
+    def __init__(self, ttl, url):
+        self.ttl = ttl
+        self.redis = redis.StrictRedis.from_url(url)
+
+    def add(self, key) -> bool:
+        return bool(self.redis.set(
+            REDIS_PREFIX + 'seen:' + key,
+            1,
+            ex=self.ttl,
+            nx=True,
+        ))
+
+    def discard(self, key):
+        self.redis.delete(REDIS_PREFIX + 'seen:' + key)
+
+    def count_rejected(self):
+        self.redis.incr(REDIS_PREFIX + 'duplicates')
+
+    def get_rejected(self) -> int:
+        return int(self.redis.get(REDIS_PREFIX + 'duplicates') or 0)
+
+
+def get_seen_set():
+    global _seen_set
+
+    if _seen_set is None:
+        if settings.UPDATES_DEDUP_BACKEND == settings.DEDUP_REDIS:
+            _seen_set = RedisSeenSet(
+                ttl=settings.UPDATES_DEDUP_TTL,
+                url=settings.UPDATES_DEDUP_REDIS_URL,
+            )
+        else:
+            _seen_set = MemorySeenSet(
+                ttl=settings.UPDATES_DEDUP_TTL,
+                maxsize=settings.UPDATES_DEDUP_MEMORY_SIZE,
+            )
+
+    return _seen_set
+
+
+def get_key(hook_id, update_id) -> str:
+    return '{}:{}'.format(hook_id, update_id)
+
+
+def is_duplicate(hook_id, update_id) -> bool:
+    """Mark update as received, return ``True`` if it's received already
+
+    Update is not rejected if the seen-set is unavailable
+
+    """
+    if update_id is None:
+        return False
+
+    seen_set = get_seen_set()
+    try:
+        if seen_set.add(get_key(hook_id, update_id)):
+            return False
+        seen_set.count_rejected()
+    except redis.RedisError:
+        logger.exception('Updates seen-set is not available')
+        return False
+
+    return True
+
+
+def forget(hook_id, update_id):
+    """Allow redelivery of the update, i.e. if its processing failed"""
+    try:
+        get_seen_set().discard(get_key(hook_id, update_id))
+    except redis.RedisError:
+        logger.exception('Updates seen-set is not available')
+
+
+def count_rejected():
+    """Count duplicate found not by the seen-set"""
+    try:
+        get_seen_set().count_rejected()
+    except redis.RedisError:
+        logger.exception('Updates seen-set is not available')
+
+
+def get_rejected() -> int:
+    """Return number of rejected duplicates"""
+    return get_seen_set().get_rejected()
@@ -0,0 +1,698 @@
+"""Asynchronous delivery of outgoing messages
+
+With ``MESSAGE_DELIVERY=asyncio`` messages are not sent by celery
+workers, each of which waits for the whole round trip of every message.
+Jobs are put to the Redis list instead, scheduled ones to the sorted set
+by their time, and the delivery service keeps many of them in flight over
+a pool of keep-alive connections to the Bot API. Database and Redis
+calls of the service are made by its threads, so the event loop only
+waits for them.
+
+Messages are sent as by ``Bot.send_message``: text is split to chunks in
+advance, chunks of the chat are sent one after another, all of them keep
+within Telegram limits of ``apps.web.outbound`` and are recorded as
+``Delivery`` by their idempotency keys.
+
+All messages produced by the update are collected by its ``Outbox`` and
+put to the queue after the handling is committed, as a single ordered
+batch per chat, whichever delivery is configured.
+
+"""
+import asyncio
+import json
+import logging
+import queue
+import socket
+import ssl
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import DatabaseError
+
+import redis
+from constance import config
+
+from apps.web import outbound
+from apps.web.bots import get_bot
+from apps.web.models.bot import Bot, split_message_text
+from apps.web.models.delivery import Delivery
+from apps.web.tasks import send_messages_task
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = 'questbot:delivery:'
+
+# jobs moved from the schedule at once
+SCHEDULE_BATCH = 100
+
+# sent chunks are recorded at once every interval, seconds
+RECORD_INTERVAL = 0.1
+
+# options of the job stored with its deliveries
+OPTIONS = (
+    'keyboard',
+    'reply_message_id',
+    'disable_notifications',
+    'disable_links_preview',
+)
+
+_queue = None
+
+
+class RedisJobQueue(object):
+    """Jobs shared by all processes, scheduled ones are kept by time
+
+    Taken job is moved to the processing list of the worker until it's
+    done, jobs left there by the killed worker are returned to the queue
+    on its start
+
+    """
+
+    def __init__(self, url, name=None):
+        self.redis = redis.StrictRedis.from_url(url)
+        self.ready = REDIS_PREFIX + 'ready'
+        self.scheduled = REDIS_PREFIX + 'scheduled'
+        self.processing = REDIS_PREFIX + 'processing:{}'.format(
+            name or socket.gethostname())
+        # raw data of taken jobs by their ids
+        self.taken = {}
+
+    def push(self, job, eta=None):
+        data = json.dumps(job)
+
+        if eta is not None and eta > time.time():
+            self.redis.zadd(self.scheduled, eta, data)
+        else:
+            self.redis.lpush(self.ready, data)
+
+    def pop(self, timeout):
+        """Return the next job, wait for it up to ``timeout`` seconds"""
+        data = self.redis.brpoplpush(
+            self.ready,
+            self.processing,
+            timeout=max(1, int(timeout)),
+        )
+        if data is None:
+            return None
+
+        job = json.loads(data.decode())
+        self.taken[id(job)] = data
+        return job
+
+    def ack(self, job):
+        """Remove the done job from the processing list"""
+        self.redis.lrem(self.processing, 1, self.taken.pop(id(job)))
+
+    def recover(self) -> int:
+        """Return jobs left in the processing list to the queue, they are
+        taken before the others, the oldest one first"""
+        # the newest job is the first one in both lists
+        jobs = self.redis.lrange(self.processing, 0, -1)
+        if jobs:
+            pipe = self.redis.pipeline()
+            pipe.rpush(self.ready, *jobs)
+            pipe.delete(self.processing)
+            pipe.execute()
+        return len(jobs)
+
+    def move_due(self) -> int:
+        """Move jobs which time has come to the ready ones"""
+        due = self.redis.zrangebyscore(
+            self.scheduled, 0, time.time(), start=0, num=SCHEDULE_BATCH)
+
+        moved = 0
+        for data in due:
+            # the job is moved by the process which removed it
+            if self.redis.zrem(self.scheduled, data):
+                self.redis.lpush(self.ready, data)
+                moved += 1
+        return moved
+
+
+class MemoryJobQueue(object):
+    """Jobs of the process, i.e. for benchmarks"""
+
+    def __init__(self):
+        self.ready = queue.Queue()
+        self.scheduled = []
+
+    def push(self, job, eta=None):
+        if eta is not None and eta > time.time():
+            self.scheduled.append((eta, job))
+        else:
+            self.ready.put(job)
+
+    def pop(self, timeout):
+        try:
+            return self.ready.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def ack(self, job):
+        pass
+
+    def recover(self) -> int:
+        return 0
+
+    def move_due(self) -> int:
+        now = time.time()
+        due = [i for i in self.scheduled if i[0] <= now]
+        self.scheduled = [i for i in self.scheduled if i[0] > now]
+
+        for _, job in due:
+            self.ready.put(job)
+        return len(due)
+
+
+def get_queue():
+    global _queue
+
+    if _queue is None:
+        _queue = RedisJobQueue(
+            settings.DELIVERY_REDIS_URL,
+            settings.DELIVERY_WORKER_NAME,
+        )
+
+    return _queue
+
+
+def get_keys(prefix, texts) -> list:
+    """Return idempotency keys of the chunks, random without ``prefix``"""
+    prefix = prefix or uuid.uuid4().hex
+    return ['{}:{}'.format(prefix, i) for i in range(len(texts))]
+
+
+def build_message(text, keyboard=None, reply_message_id=None,
+                  disable_notifications=False, disable_links_preview=False,
+                  key=None, keys=None) -> dict:
+    """Build the message of the batch, text is split to chunks
+
+    Chunk keys are derived from ``key``, i.e. the update and the response,
+    or passed as ``keys``, chunks with the same key are sent once
+
+    """
+    if not isinstance(text, (list, tuple)):
+        text = split_message_text(text)
+
+    return dict(
+        texts=list(text),
+        keys=keys or get_keys(key, text),
+        keyboard=keyboard,
+        reply_message_id=reply_message_id,
+        disable_notifications=disable_notifications,
+        disable_links_preview=disable_links_preview,
+    )
+
+
+def deliver_batch(bot_id, chat_id, messages, queued=None, eta=None):
+    """Send messages to the chat one after another by the configured
+    delivery, it's a single task or job"""
+    if settings.MESSAGE_DELIVERY != settings.DELIVERY_ASYNCIO:
+        send_messages_task.apply_async(
+            (bot_id, chat_id, messages),
+            dict(queued=queued),
+            eta=eta,
+            queue=outbound.get_chat_queue(chat_id),
+        )
+        return
+
+    get_queue().push(
+        dict(
+            bot_id=str(bot_id),
+            chat_id=chat_id,
+            messages=messages,
+            parse_mode=getattr(config, settings.TELEGRAM_PARSE_MODE),
+            queued=queued or time.time(),
+        ),
+        eta=eta.timestamp() if eta else None,
+    )
+
+
+def deliver(bot_id, chat_id, text, queued=None, eta=None, **options):
+    """Send the message to the chat by the configured delivery, options
+    are the ones of ``build_message``"""
+    deliver_batch(
+        bot_id,
+        chat_id,
+        [build_message(text, **options)],
+        queued=queued,
+        eta=eta,
+    )
+
+
+class Outbox(object):
+    """Messages produced by handling of the update
+
+    They are grouped by chats in the order they are added and sent by
+    ``send`` at once, a batch per chat
+
+    """
+
+    def __init__(self, bot_id):
+        self.bot_id = bot_id
+        self.chats = OrderedDict()
+
+    def __len__(self):
+        return sum(len(i) for i in self.chats.values())
+
+    def add(self, chat_id, text, **options):
+        self.chats.setdefault(chat_id, []).append(
+            build_message(text, **options),
+        )
+
+    def send(self):
+        queued = time.time()
+
+        for chat_id, messages in self.chats.items():
+            deliver_batch(self.bot_id, chat_id, messages, queued=queued)
+
+        self.chats.clear()
+
+
+def get_job_messages(job) -> list:
+    """Return messages of the job with their options and keys"""
+    # jobs queued before batches have the only message
+    messages = [
+        dict(job, **message) for message in job.get('messages') or [job]
+    ]
+    for message in messages:
+        message['keys'] = (
+            message.get('keys') or get_keys(None, message['texts'])
+        )
+    return messages
+
+
+def build_payload(job, text) -> dict:
+    """Build ``sendMessage`` parameters like ``telegram.Bot`` does"""
+    payload = {'chat_id': job['chat_id'], 'text': text}
+
+    if job.get('parse_mode'):
+        payload['parse_mode'] = job['parse_mode']
+    if job.get('disable_links_preview'):
+        payload['disable_web_page_preview'] = True
+    if job.get('disable_notifications'):
+        payload['disable_notification'] = True
+    if job.get('reply_message_id'):
+        payload['reply_to_message_id'] = job['reply_message_id']
+    if job.get('keyboard'):
+        payload['reply_markup'] = job['keyboard']
+
+    return payload
+
+
+class ConnectionClosed(ConnectionError):
+    """Connection is closed before the response, the request may be sent
+    again"""
+
+
+class HTTPConnectionPool(object):
+    """Keep-alive HTTP/1.1 connections to the host of ``url``
+
+    Only JSON ``POST`` requests and responses with known length or chunked
+    ones are supported, that's all the Bot API needs
+
+    """
+
+    def __init__(self, url, size, timeout):
+        parts = urlsplit(url)
+        is_https = parts.scheme == 'https'
+
+        self.host = parts.hostname
+        self.port = parts.port or (443 if is_https else 80)
+        self.ssl = ssl.create_default_context() if is_https else None
+        self.timeout = timeout
+        self.available = asyncio.Semaphore(size)
+        self.idle = []
+        # opened connections, for metrics
+        self.connections = 0
+
+    async def open(self):
+        self.connections += 1
+        return await asyncio.open_connection(
+            self.host,
+            self.port,
+            ssl=self.ssl,
+        )
+
+    async def post(self, path, payload) -> (int, bytes):
+        """Return status and body of the response"""
+        body = json.dumps(payload).encode()
+
+        async with self.available:
+            while True:
+                reused = bool(self.idle)
+                if reused:
+                    reader, writer = self.idle.pop()
+                else:
+                    reader, writer = await asyncio.wait_for(
+                        self.open(), self.timeout)
+
+                try:
+                    status, keep_alive, data = await asyncio.wait_for(
+                        self.request(reader, writer, path, body),
+                        self.timeout,
+                    )
+                except ConnectionClosed:
+                    writer.close()
+                    # idle connection may be closed by the server
+                    if reused:
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+
+                if keep_alive:
+                    self.idle.append((reader, writer))
+                else:
+                    writer.close()
+
+                return status, data
+
+    async def request(self, reader, writer, path, body):
+        head = (
+            'POST {} HTTP/1.1\r\n'
+            'Host: {}\r\n'
+            'Content-Type: application/json\r\n'
+            'Content-Length: {}\r\n'
+            'Connection: keep-alive\r\n'
+            '\r\n'
+        ).format(path, self.host, len(body)).encode('latin-1')
+
+        try:
+            writer.write(head + body)
+            await writer.drain()
+            status_line = await reader.readline()
+        except OSError as error:
+            raise ConnectionClosed(str(error))
+        if not status_line:
+            raise ConnectionClosed('Connection is closed by the server')
+
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            data = await self.read_chunked(reader)
+        else:
+            data = await reader.readexactly(
+                int(headers.get('content-length', 0)))
+
+        return status, headers.get('connection') != 'close', data
+
+    @staticmethod
+    async def read_chunked(reader) -> bytes:
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if not size:
+                await reader.readline()
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+class DeliveryService(object):
+    """Send jobs of the queue, up to ``concurrency`` at once"""
+
+    def __init__(self, job_queue=None, concurrency=None, pool_size=None,
+                 api_url=None, threads=None):
+        self.queue = job_queue or get_queue()
+        self.concurrency = concurrency or settings.DELIVERY_CONCURRENCY
+        self.pool_size = pool_size or settings.DELIVERY_POOL_SIZE
+        self.api_url = api_url or settings.TELEGRAM_API_URL
+        self.threads = threads or settings.DELIVERY_THREADS
+        self.running = False
+        self.pool = None
+        self.executor = None
+        # the last job of the chat, the next one waits for it
+        self.chats = {}
+        self.sent = 0
+        self.failed = 0
+        # latencies of sent messages are kept if it's a list
+        self.latencies = None
+        # sent chunks to be recorded
+        self.records = []
+
+    def stop(self):
+        self.running = False
+
+    def call(self, fn, *args):
+        """Call blocking function by the thread of the service"""
+        return asyncio.get_event_loop().run_in_executor(
+            self.executor,
+            partial(fn, *args),
+        )
+
+    async def run(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        jobs = set()
+
+        self.pool = HTTPConnectionPool(
+            self.api_url,
+            self.pool_size,
+            settings.TELEGRAM_READ_TIMEOUT,
+        )
+        self.executor = ThreadPoolExecutor(self.threads)
+
+        # jobs taken before the worker was killed are sent again
+        recovered = await self.call(self.queue.recover)
+        if recovered:
+            logger.warning('{} unfinished jobs are queued again'.format(
+                recovered))
+
+        self.running = True
+        schedule = asyncio.ensure_future(self.schedule())
+        recorder = asyncio.ensure_future(self.record())
+
+        def finish(job):
+            jobs.discard(job)
+            slots.release()
+
+        try:
+            while self.running:
+                await slots.acquire()
+                job = await self.call(self.queue.pop, 1)
+
+                if job is None:
+                    slots.release()
+                    continue
+
+                future = asyncio.ensure_future(self.deliver(job))
+                jobs.add(future)
+                future.add_done_callback(finish)
+
+            if jobs:
+                await asyncio.wait(jobs)
+        finally:
+            schedule.cancel()
+            recorder.cancel()
+            await self.flush_records()
+            self.pool.close()
+            self.executor.shutdown()
+
+    async def schedule(self):
+        while self.running:
+            try:
+                await self.call(self.queue.move_due)
+            except redis.RedisError:
+                logger.exception('Delivery queue is not available')
+            await asyncio.sleep(0.5)
+
+    async def record(self):
+        while self.running:
+            await asyncio.sleep(RECORD_INTERVAL)
+            await self.flush_records()
+
+    async def flush_records(self):
+        records, self.records = self.records, []
+        if records:
+            await self.call(self.write_records, records)
+
+    @staticmethod
+    def write_records(records):
+        """Record sent chunks and count them, ``records`` are arguments of
+        ``Delivery.record_sent`` with the latency"""
+        try:
+            Delivery.record_sent_many([i[:-1] for i in records])
+        except DatabaseError:
+            logger.exception('Sent messages are not recorded')
+
+        metrics = {}
+        for record in records:
+            sent, latency = metrics.get(record[1], (0, 0))
+            metrics[record[1]] = sent + 1, latency + record[-1]
+        for bot_id, (sent, latency) in metrics.items():
+            outbound.count(bot_id, sent=sent, latency=latency)
+
+    async def deliver(self, job):
+        key = (job['bot_id'], job['chat_id'])
+        previous = self.chats.get(key)
+        done = asyncio.get_event_loop().create_future()
+        self.chats[key] = done
+
+        try:
+            if previous is not None:
+                await previous
+
+            try:
+                await self.send_job(job)
+            except Exception as error:
+                self.failed += 1
+                logger.exception('Messages are not sent: {}'.format(job))
+                # sent chunks are skipped by the retried job
+                await self.flush_records()
+                await self.call(self.retry, job, error)
+
+            await self.call(self.queue.ack, job)
+        except Exception:
+            logger.exception(
+                'Job is kept until the service restart: {}'.format(job))
+        finally:
+            done.set_result(None)
+            if self.chats.get(key) is done:
+                del self.chats[key]
+
+    def retry(self, job, error):
+        """Queue the failed job again after backoff, its unsent chunks are
+        moved to dead letters after the last attempt"""
+        attempts = job.get('attempts', 0) + 1
+
+        if attempts < settings.DELIVERY_ATTEMPTS:
+            self.queue.push(
+                dict(job, attempts=attempts),
+                eta=time.time() + outbound.get_backoff(attempts),
+            )
+            return
+
+        messages = get_job_messages(job)
+        bot, sent = self.prepare(job['bot_id'], messages)
+        if bot is None:
+            return
+
+        for message in messages:
+            options = {name: message.get(name) for name in OPTIONS}
+
+            for key, text in zip(message['keys'], message['texts']):
+                if key not in sent:
+                    Delivery.record_failure(
+                        key, bot.id, job['chat_id'], text, options, error,
+                        permanent=True,
+                    )
+
+    async def send_job(self, job):
+        messages = get_job_messages(job)
+
+        bot, sent = await self.call(self.prepare, job['bot_id'], messages)
+        if bot is None:
+            logger.error('Message of unknown bot {} is not sent'.format(
+                job['bot_id']))
+            return
+
+        path = '{}{}/sendMessage'.format(
+            urlsplit(self.api_url).path,
+            bot.token,
+        )
+
+        for message in messages:
+            options = {name: message.get(name) for name in OPTIONS}
+
+            for key, text in zip(message['keys'], message['texts']):
+                if key not in sent:
+                    await self.send(bot, message, path, key, text, options)
+
+    @staticmethod
+    def prepare(bot_id, messages) -> (Bot, set):
+        """Return the bot and keys of already sent chunks of the job"""
+        keys = [key for message in messages for key in message['keys']]
+        return get_bot(bot_id), Delivery.objects.sent_keys(keys)
+
+    async def send(self, bot, job, path, key, text, options):
+        """Send the chunk at its time, repeat it after flood control answer
+        and after network errors with backoff, record the delivery"""
+        chat_id = job['chat_id']
+
+        while True:
+            await self.wait_for_sending(bot, chat_id)
+
+            try:
+                status, data = await self.pool.post(
+                    path,
+                    build_payload(job, text),
+                )
+            except (OSError, asyncio.TimeoutError,
+                    asyncio.IncompleteReadError) as error:
+                status, result = None, {'description': repr(error)}
+            else:
+                try:
+                    result = json.loads(data.decode())
+                except ValueError:
+                    result = {}
+
+            retry_after = (result.get('parameters') or {}).get('retry_after')
+            if retry_after:
+                await self.call(self.throttle, bot.id, chat_id, retry_after)
+                continue
+
+            if result.get('ok'):
+                break
+
+            error = 'status: {}, error: {}'.format(
+                status, result.get('description'))
+            logger.error(
+                'Error on message send has been occurred. chat: {}, '
+                'text: {}, {}'.format(chat_id, text, error)
+            )
+
+            # no answer or server errors are transient, others are not
+            delivery = await self.call(partial(
+                Delivery.record_failure,
+                key, bot.id, chat_id, text, options, error,
+                permanent=status is not None and status < 500,
+            ))
+            if delivery.is_dead:
+                self.failed += 1
+                return
+
+            await asyncio.sleep(outbound.get_backoff(delivery.failures))
+
+        # chunks are recorded in batches, a few of them may be sent again if
+        # the service is killed before
+        latency = time.time() - job['queued']
+        self.records.append((key, bot.id, chat_id, text, options, latency))
+        self.sent += 1
+        if self.latencies is not None:
+            self.latencies.append(latency)
+
+    @staticmethod
+    def throttle(bot_id, chat_id, retry_after):
+        outbound.count(bot_id, throttled=1)
+        outbound.penalize(bot_id, chat_id, retry_after)
+
+    @staticmethod
+    def reserve(bot_id, chat_id) -> float:
+        """Return number of seconds to wait for sending to the chat"""
+        delay = outbound.reserve_chat(bot_id, chat_id)
+        return outbound.reserve_bot(bot_id, delay)
+
+    async def wait_for_sending(self, bot, chat_id):
+        delay = await self.call(self.reserve, bot.id, chat_id)
+
+        if delay > 0:
+            await asyncio.sleep(delay)
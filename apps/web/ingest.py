@@ -0,0 +1,233 @@
+"""Persisting of received updates
+
+Users and chats are upserted, i.e. inserted or updated in one statement,
+and known ones are kept in the identity cache of the process, so updates
+of returning players cause no queries for them.
+
+"""
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from constance import config
+
+from apps.web.api.payloads import (
+    CallbackQueryRecord,
+    ChatRecord,
+    MessageRecord,
+    PayloadError,
+    UpdateRecord,
+    UserRecord,
+    from_validated_data,
+    parse_update,
+)
+from apps.web.api.serializers import UpdateModelSerializer
+from apps.web.bots import get_bot
+from apps.web.dedup import count_rejected
+from apps.web.models import AppUser, CallbackQuery, Chat, Message, Update
+from apps.web.models.message import Photo
+from apps.web.upsert import upsert
+
+
+class IdentityCache(object):
+    """Bounded map of rows known to be stored, least recently used ones
+    are evicted"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+
+    def get(self, key):
+        value = self.items.get(key)
+        if value is not None:
+            self.items.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def discard(self, key):
+        self.items.pop(key, None)
+
+
+# id and received record by username
+_users = IdentityCache(settings.INGEST_IDENTITY_CACHE_SIZE)
+# received record by chat id
+_chats = IdentityCache(settings.INGEST_IDENTITY_CACHE_SIZE)
+
+
+def deserialize_update(hook_id, data) -> UpdateRecord:
+    """Validate raw Telegram update received by the ``hook_id`` webhook
+
+    Common payloads are parsed by the fast path, the rest is validated by
+    the serializer. Return the update record or ``None`` if the format is
+    not valid or the bot is unknown
+
+    """
+    bot = get_bot(hook_id)
+    if bot is None:
+        return None
+
+    try:
+        record = parse_update(data)
+    except PayloadError:
+        pass
+    else:
+        record.bot = bot
+        return record
+
+    serializer = UpdateModelSerializer(data=data, context={'hook_id': hook_id})
+
+    if not serializer.is_valid():
+        return None
+
+    record = from_validated_data(serializer.validated_data)
+    # i.e. channel posts, only messages and callback queries are handled
+    if record.message is None and record.callback_query is None:
+        return None
+    return record
+
+
+def save_update(record: UpdateRecord) -> (Update, bool):
+    """Persist parsed update with all related entities
+
+    Return the update and if it's created, already stored update is not
+    saved again
+
+    """
+    update = Update.objects.filter(
+        bot=record.bot,
+        update_id=record.update_id,
+    ).first()
+
+    if update is not None:
+        count_rejected()
+        return update, False
+
+    if record.message is not None:
+        return handle_message(record), True
+    return handle_callback(record), True
+
+
+def ingest_update(hook_id, data) -> (Update, bool):
+    """Deserialize and persist raw update
+
+    Return the update and if it's created or ``(None, False)`` if the
+    update is invalid
+
+    """
+    record = deserialize_update(hook_id, data)
+
+    if record is None:
+        return None, False
+    return save_update(record)
+
+
+def get_user_id(user: UserRecord) -> int:
+    """Return id of the user, store the user if it's new or changed"""
+    cached = _users.get(user.username)
+
+    if cached is not None and cached[1] == user:
+        return cached[0]
+
+    user_id = upsert(
+        AppUser,
+        'username',
+        user.as_dict(),
+        # as ``AppUserModelSerializer`` sets it, existing password is kept
+        inserted=dict(
+            password=getattr(config, settings.TELEGRAM_DEFAULT_PASS),
+        ),
+    )
+
+    if user_id is None:
+        # changed user keeps the id
+        user_id = cached[0] if cached is not None else (
+            AppUser.objects.values_list('id', flat=True).get(
+                username=user.username,
+            )
+        )
+
+    # only committed rows are cached
+    transaction.on_commit(lambda: _users.set(user.username, (user_id, user)))
+    return user_id
+
+
+def get_chat_id(chat: ChatRecord) -> int:
+    """Return id of the chat, store the chat if it's new or changed"""
+    if _chats.get(chat.id) != chat:
+        upsert(Chat, 'id', chat.as_dict())
+        transaction.on_commit(lambda: _chats.set(chat.id, chat))
+
+    return chat.id
+
+
+def forget_user(user: AppUser):
+    _users.discard(user.username)
+
+
+def forget_chat(chat: Chat):
+    _chats.discard(chat.id)
+
+
+def get_or_create_message(record: MessageRecord) -> (Message, bool):
+    """Return the message with its photos, create it if it's new"""
+    values = dict(
+        message_id=record.message_id,
+        from_user_id=get_user_id(record.from_user),
+        chat_id=get_chat_id(record.chat),
+        date=record.date,
+        text=record.text,
+    )
+
+    message = Message.objects.filter(**values).first()
+    if message is not None:
+        return message, False
+
+    message = Message.objects.create(**values)
+    attach_photo_to_message(record=record, message=message)
+
+    return message, True
+
+
+def handle_message(record: UpdateRecord):
+    message, _ = get_or_create_message(record.message)
+
+    return Update.objects.create(
+        bot=record.bot,
+        message=message,
+        update_id=record.update_id,
+    )
+
+
+def extract_callback_message(callback: CallbackQueryRecord):
+    message, _ = get_or_create_message(callback.message)
+    return message
+
+
+def attach_photo_to_message(record: MessageRecord, message):
+    Photo.objects.bulk_create(
+        Photo(**photo.as_dict(), message=message) for photo in record.photos
+    )
+
+
+def handle_callback(record: UpdateRecord):
+    callback = record.callback_query
+    message = extract_callback_message(callback)
+
+    upsert(CallbackQuery, 'id', dict(
+        id=callback.id,
+        from_user_id=get_user_id(callback.from_user),
+        message_id=message.id,
+        data=callback.data,
+    ))
+
+    return Update.objects.create(
+        bot=record.bot,
+        callback_query_id=callback.id,
+        update_id=record.update_id,
+    )
@@ -0,0 +1,97 @@
+"""Reply keyboards
+
+Keyboard layout is a list of rows of buttons, a button is a label or a
+Telegram ``KeyboardButton`` object:
+
+    [["Left", "Right"], [{"text": "Share phone", "request_contact": true}]]
+
+Layout is written as JSON, Python literals are accepted as well. Built
+keyboard markup is stored to the chat as compact JSON, labels of its
+buttons are kept as a set to recognize pressed buttons.
+
+"""
+import ast
+import json
+from functools import lru_cache
+
+
+def freeze(value):
+    """Convert lists to tuples, so parsed layout can be shared"""
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(i) for i in value)
+    return value
+
+
+def thaw(value):
+    if isinstance(value, tuple):
+        return [thaw(i) for i in value]
+    return value
+
+
+def loads(source):
+    """Parse JSON or Python literal, raise ``ValueError`` if it's invalid"""
+    try:
+        return json.loads(source)
+    except ValueError:
+        pass
+
+    try:
+        return ast.literal_eval(source)
+    except SyntaxError as error:
+        raise ValueError(str(error))
+
+
+@lru_cache(maxsize=1024)
+def parse_layout(source) -> tuple:
+    """Parse keyboard layout, raise ``ValueError`` if it's invalid"""
+    return freeze(list(loads(source)))
+
+
+def build_markup(source, one_time_keyboard):
+    """Build reply keyboard markup from the layout
+
+    Empty layout means no keyboard
+
+    """
+    if not source:
+        return []
+
+    return dict(
+        keyboard=thaw(parse_layout(source)),
+        one_time_keyboard=one_time_keyboard,
+        resize_keyboard=True,
+        selective=False,
+    )
+
+
+def dumps(markup) -> str:
+    """Represent markup to be stored"""
+    return json.dumps(markup, ensure_ascii=False, separators=(',', ':'))
+
+
+def button_label(button) -> str:
+    if isinstance(button, dict):
+        return button.get('text')
+    return str(button)
+
+
+@lru_cache(maxsize=4096)
+def get_labels(stored) -> frozenset:
+    """Return labels of the buttons of the stored markup"""
+    if not stored:
+        return frozenset()
+
+    try:
+        markup = loads(stored)
+    except ValueError:
+        return frozenset()
+
+    if not isinstance(markup, dict):
+        return frozenset()
+
+    labels = set()
+    for row in markup.get('keyboard') or ():
+        buttons = row if isinstance(row, (list, tuple)) else (row,)
+        labels.update(button_label(i) for i in buttons)
+
+    return frozenset(labels)
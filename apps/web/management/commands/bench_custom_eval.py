@@ -0,0 +1,116 @@
+import builtins
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.web.custom_eval import CompiledExpression
+from apps.web.custom_eval import compile as custom_compile
+
+# sample expressions posted on comp.lang.python, asking for advice in
+# safely evaluating them; the former pyparsing evaluator agreed with
+# Python on all of them, so Python is the reference
+RULES = (
+    '( A - B ) == 0',
+    '(A + B + C + D + E + F + G + H + I) == J',
+    '(A + B + C + D + E + F + G + H) == I',
+    '(A + B + C + D + E + F) == G',
+    '(A + B + C + D + E) == (F + G + H + I + J)',
+    '(A + B + C + D + E) == (F + G + H + I)',
+    '(A + B + C + D + E) == F',
+    '(A + B + C + D) == (E + F + G + H)',
+    '(A + B + C) == (D + E + F)',
+    '(A + B) == (C + D + E + F)',
+    '(A + B) == (C + D)',
+    '(A + B) == (C - D + E - F - G + H + I + J)',
+    '(A + B) == C',
+    '(A + B) == 0',
+    '(A+B+C+D+E) == (F+G+H+I+J)',
+    '(A+B+C+D) == (E+F+G+H)',
+    '(A+B+C+D)==(E+F+G+H)',
+    '(A+B+C)==(D+E+F)',
+    '(A+B)==(C+D)',
+    '(A+B)==C',
+    '(A-B)==C',
+    '(A/(B+C))',
+    '(B/(C+D))',
+    '(G + H) == I',
+    '-0.99 <= ((A+B+C)-(D+E+F+G)) <= 0.99',
+    '-0.99 <= (A-(B+C)) <= 0.99',
+    '-1000.00 <= A <= 0.00',
+    '-5000.00 <= A <= 0.00',
+    'A < B',
+    'A < 7000',
+    'A == -(B)',
+    'A == C',
+    'A == 0',
+    'A > 0',
+    'A > 0.00',
+    'A > 7.00',
+    'A <= B',
+    'A < -1000.00',
+    'A < -5000',
+    'A < 0',
+    'A==(B+C+D)',
+    'A==B',
+    'I == (G + H)',
+    '0.00 <= A <= 4.00',
+    '4.00 < A <= 7.00',
+    '0.00 <= A <= 4.00 <= E > D',
+    '123E0 > 1000E-1 > 99.0987',
+    '123E+0',
+    '1000E-1',
+    '99.0987',
+    'abc',
+    '20 % 3',
+    '14 // 3',
+    '12e2 // 3.7',
+)
+
+VARIABLES = {'A': 0, 'B': 1.1, 'C': 2.2, 'D': 3.3, 'E': 4.4, 'F': 5.5,
+             'G': 6.6, 'H': 7.7, 'I': 8.8, 'J': 9.9, 'abc': 20}
+
+
+class Command(BaseCommand):
+    help = ('Measure parsing and evaluation of the sample rules by the '
+            'expression evaluator of handlers, Python eval is the reference')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=100)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+
+        parsed = self.measure(
+            lambda rule: CompiledExpression(rule).eval(VARIABLES),
+            repeat,
+        )
+        cached = self.measure(
+            lambda rule: custom_compile(rule).eval(VARIABLES),
+            repeat,
+        )
+        python = self.measure(
+            lambda rule: builtins.eval(rule, {}, VARIABLES),
+            repeat,
+        )
+
+        self.stdout.write(
+            '{count} rules: parse and eval {parsed:.2f} ms, compiled '
+            '{cached:.2f} ms, Python eval {python:.2f} ms per the whole '
+            'set'.format(
+                count=len(RULES),
+                parsed=parsed,
+                cached=cached,
+                python=python,
+            )
+        )
+
+    @staticmethod
+    def measure(evaluate, repeat) -> float:
+        """Return mean time of evaluating all rules, in milliseconds"""
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for rule in RULES:
+                evaluate(rule)
+        elapsed = time.perf_counter() - started
+
+        return elapsed / repeat * 1000
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from apps.web.bots import get_bot
+from apps.web.clients import ClientPool
+from apps.web.delivery import (
+    DeliveryService,
+    MemoryJobQueue,
+    build_message,
+)
+from apps.web.management.commands.bench_telegram import SENT_MESSAGE
+from apps.web.management.commands.bench_webhook import percentile
+
+RESPONSE_HEAD = (
+    'HTTP/1.1 200 OK\r\n'
+    'Content-Type: application/json\r\n'
+    'Content-Length: {}\r\n'
+    '\r\n'
+).format(len(SENT_MESSAGE)).encode()
+
+# limits far above the benchmark load
+NO_LIMIT = (10 ** 9, 1, 1)
+
+
+class FakeTelegramServer(object):
+    """Bot API answering every request as sent message after ``latency``
+    seconds, it runs its own event loop in a thread"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.connections = 0
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(
+            self.handle, '127.0.0.1', 0, loop=self.loop))
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return 'http://{}:{}/bot'.format(*self.server.sockets[0].getsockname())
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+
+        while True:
+            if not await reader.readline():
+                break
+
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-length':
+                    length = int(value)
+
+            await reader.readexactly(length)
+            await asyncio.sleep(self.latency, loop=self.loop)
+            writer.write(RESPONSE_HEAD + SENT_MESSAGE)
+
+        writer.close()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+
+
+class Command(BaseCommand):
+    help = ('Compare sending messages by the asyncio delivery service with '
+            'a celery worker sending them one by one, against a fake Bot '
+            'API with the given latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('hook_id', help='Hook id of the bot to send as')
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--chats', type=int, default=500)
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=50,
+            help='Response time of the fake Bot API, ms',
+        )
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--pool-size', type=int, default=50)
+        parser.add_argument(
+            '--limits',
+            action='store_true',
+            help='Keep Telegram limits, they are off by default',
+        )
+
+    def handle(self, *args, **options):
+        bot = get_bot(options['hook_id'])
+        if bot is None:
+            raise CommandError('Unknown hook id')
+
+        server = FakeTelegramServer(options['latency'] / 1000)
+        limits = {} if options['limits'] else dict(
+            OUTBOUND_BOT_LIMIT=NO_LIMIT,
+            OUTBOUND_CHAT_LIMIT=NO_LIMIT,
+            OUTBOUND_GROUP_LIMIT=NO_LIMIT,
+        )
+
+        try:
+            with override_settings(**limits):
+                self.measure_service(server, bot, options)
+            self.measure_worker(server, bot, options)
+        finally:
+            server.close()
+
+    def measure_service(self, server, bot, options):
+        job_queue = MemoryJobQueue()
+        for i in range(options['messages']):
+            job_queue.push(dict(
+                bot_id=bot.hook_id,
+                chat_id=10 ** 9 + i % options['chats'],
+                messages=[build_message('Bench')],
+                queued=time.time(),
+            ))
+
+        service = DeliveryService(
+            job_queue=job_queue,
+            concurrency=options['concurrency'],
+            pool_size=options['pool_size'],
+            api_url=server.url,
+        )
+        service.latencies = []
+
+        async def stop_when_sent():
+            while service.sent + service.failed < options['messages']:
+                await asyncio.sleep(0.01)
+            service.stop()
+
+        server.connections = 0
+        loop = asyncio.get_event_loop()
+        started = time.perf_counter()
+        loop.run_until_complete(asyncio.gather(
+            service.run(),
+            stop_when_sent(),
+        ))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            'asyncio service: {count} messages, {rate:.1f} messages/s, '
+            'p50 {p50:.0f} ms, p99 {p99:.0f} ms, {connections} connections, '
+            '{failed} failed'.format(
+                count=service.sent,
+                rate=service.sent / elapsed,
+                p50=percentile(service.latencies, 50) * 1000,
+                p99=percentile(service.latencies, 99) * 1000,
+                connections=server.connections,
+                failed=service.failed,
+            )
+        )
+
+    def measure_worker(self, server, bot, options):
+        # the worker is measured on a sample, it's too slow for all of them
+        count = max(1, min(options['messages'], 100))
+        client = ClientPool(base_url=server.url).get(bot.token)
+
+        server.connections = 0
+        started = time.perf_counter()
+        for i in range(count):
+            client.send_message(
+                chat_id=10 ** 9 + i % options['chats'],
+                text='Bench',
+            )
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            'celery worker: {count} messages, {rate:.1f} messages/s, '
+            '{connections} connections'.format(
+                count=count,
+                rate=count / elapsed,
+                connections=server.connections,
+            )
+        )
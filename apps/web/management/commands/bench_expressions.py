@@ -0,0 +1,115 @@
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+
+from apps.web.custom_eval import compile as custom_compile
+from apps.web.models import Handler
+from apps.web.models.handler import (
+    ConditionsLookup,
+    compile_handler_expression,
+)
+
+
+class Command(BaseCommand):
+    help = ('Compare per-call formatting and parsing of handler expressions '
+            'with evaluation of the compiled ones, results of conditions '
+            'are fixed')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--quest',
+            type=int,
+            help='Quest id, handlers of all quests by default',
+        )
+        parser.add_argument('--repeat', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        handlers = Handler.objects.annotate(
+            conditions_count=Count('conditions'),
+        ).filter(
+            Q(conditions_count__gt=0) | ~Q(ids_expression__in=('', None)),
+        ).prefetch_related('conditions')
+
+        if options['quest']:
+            handlers = handlers.filter(step__quest_id=options['quest'])
+
+        handlers = list(handlers)
+        if not handlers:
+            raise CommandError('No handler expressions to measure')
+
+        formatted = parsed = compiled = 0
+        fallbacks = 0
+
+        for handler in handlers:
+            conditions = list(handler.conditions.all())
+            # conditions are true and false in turn
+            context = SimpleNamespace(results={
+                condition.id: n % 2 for n, condition in enumerate(conditions)
+            })
+
+            def format_expression():
+                return handler.eval_formatted_expression(
+                    context, conditions, True)
+
+            def parse_expression():
+                # formatted expressions are cached by the parser too
+                custom_compile.cache_clear()
+                return format_expression()
+
+            def evaluate():
+                expression, specify_ids = compile_handler_expression(
+                    handler.id,
+                    handler.modified,
+                    handler.ids_expression,
+                    len(conditions),
+                )
+                lookup = ConditionsLookup(context, conditions, specify_ids)
+                return bool(expression.eval(lookup))
+
+            handler_formatted = self.measure(
+                format_expression, options['repeat'])
+            formatted += handler_formatted
+            parsed += self.measure(parse_expression, options['repeat'])
+
+            if compile_handler_expression(
+                    handler.id,
+                    handler.modified,
+                    handler.ids_expression,
+                    len(conditions)) is None:
+                # the handler keeps formatting
+                fallbacks += 1
+                compiled += handler_formatted
+                continue
+
+            if evaluate() != format_expression():
+                raise CommandError('Results of handler {} differ'.format(
+                    handler.id))
+
+            compiled += self.measure(evaluate, options['repeat'])
+
+        count = len(handlers)
+        self.stdout.write(
+            '{count} handlers ({fallbacks} not compiled): formatting '
+            '{formatted:.1f} us ({parsed:.1f} us parsing every time), '
+            'compiled {compiled:.1f} us, {ratio:.1f}x faster than '
+            'parsing'.format(
+                count=count,
+                fallbacks=fallbacks,
+                formatted=formatted / count,
+                parsed=parsed / count,
+                compiled=compiled / count,
+                ratio=parsed / compiled,
+            )
+        )
+
+    @staticmethod
+    def measure(evaluate, repeat) -> float:
+        """Return mean time of the expression evaluation, in microseconds"""
+        started = time.perf_counter()
+        for _ in range(repeat):
+            evaluate()
+        elapsed = time.perf_counter() - started
+
+        return elapsed / repeat * 10 ** 6
@@ -0,0 +1,127 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.web.api.payloads import (
+    PayloadError,
+    from_validated_data,
+    parse_update,
+)
+from apps.web.api.serializers import UpdateModelSerializer
+from apps.web.ingest import deserialize_update
+from apps.web.management.commands.bench_webhook import text_update
+
+
+def photo_update(update_id, chat_id):
+    """Build Telegram photo update payload"""
+    payload = text_update(update_id, chat_id, text=None)
+    del payload['message']['text']
+    payload['message']['photo'] = [
+        {'file_id': f'photo{update_id}{size}', 'width': size,
+         'height': size, 'file_size': size * 100}
+        for size in (90, 320, 800)
+    ]
+    return payload
+
+
+def callback_update(update_id, chat_id):
+    """Build Telegram callback query update payload"""
+    message = text_update(update_id, chat_id, text='Choose')['message']
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': message['from'],
+            'message': message,
+            'data': 'left',
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = ('Compare deserialization of Telegram updates by the fast path '
+            'and by the serializer')
+
+    def add_arguments(self, parser):
+        parser.add_argument('hook_id', help='Hook id of the bot')
+        parser.add_argument(
+            '--file',
+            help='Recorded updates, a JSON payload per line, built-in '
+                 'text, photo and callback updates by default',
+        )
+        parser.add_argument('--repeat', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        payloads = self.load(options['file'])
+        if not payloads:
+            raise CommandError('No payloads to measure')
+
+        fallbacks = sum(self.parse(i) is None for i in payloads)
+
+        parsing = self.measure(
+            self.parse,
+            payloads,
+            options['repeat'],
+        )
+        fast = self.measure(
+            lambda payload: deserialize_update(options['hook_id'], payload),
+            payloads,
+            options['repeat'],
+        )
+        serializer = self.measure(
+            lambda payload: self.serialize(options['hook_id'], payload),
+            payloads,
+            options['repeat'],
+        )
+
+        self.stdout.write(
+            '{count} payloads ({fallbacks} not supported by the fast path): '
+            'fast path {fast:.1f} us (parsing {parsing:.1f} us), '
+            'serializer {serializer:.1f} us, {ratio:.1f}x'.format(
+                count=len(payloads),
+                fallbacks=fallbacks,
+                parsing=parsing,
+                fast=fast,
+                serializer=serializer,
+                ratio=serializer / fast,
+            )
+        )
+
+    def load(self, path):
+        if not path:
+            return [
+                text_update(1, chat_id=10 ** 9, text='/start'),
+                photo_update(2, chat_id=10 ** 9),
+                callback_update(3, chat_id=10 ** 9),
+            ]
+
+        with open(path) as source:
+            return [json.loads(line) for line in source if line.strip()]
+
+    @staticmethod
+    def parse(payload):
+        try:
+            return parse_update(payload)
+        except PayloadError:
+            return None
+
+    @staticmethod
+    def serialize(hook_id, payload):
+        serializer = UpdateModelSerializer(
+            data=payload,
+            context={'hook_id': hook_id},
+        )
+        if serializer.is_valid():
+            return from_validated_data(serializer.validated_data)
+
+    @staticmethod
+    def measure(deserialize, payloads, repeat) -> float:
+        """Return mean time of deserializing a payload, in microseconds"""
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for payload in payloads:
+                deserialize(payload)
+        elapsed = time.perf_counter() - started
+
+        return elapsed / (repeat * len(payloads)) * 10 ** 6
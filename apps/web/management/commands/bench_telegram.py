@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from django.core.management.base import BaseCommand
+
+from telegram.bot import Bot as TelegramBot
+from telegram.utils.request import Request
+
+from apps.web.clients import ClientPool
+
+SENT_MESSAGE = json.dumps({
+    'ok': True,
+    'result': {
+        'message_id': 1,
+        'date': 0,
+        'chat': {'id': 1, 'type': 'private'},
+        'text': 'Bench',
+    },
+}).encode()
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    """Answer every request as sent message, keeping the connection"""
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, they must not wait for ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(SENT_MESSAGE)))
+        self.end_headers()
+        self.wfile.write(SENT_MESSAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeTelegramServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeTelegramHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+
+    @property
+    def url(self) -> str:
+        return 'http://{}:{}/bot'.format(*self.server_address)
+
+
+class Command(BaseCommand):
+    help = ('Measure sending messages through pooled Telegram clients and '
+            'through a new client per message against a fake Bot API')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--bots', type=int, default=3)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--pool-size', type=int, default=8)
+
+    def handle(self, *args, **options):
+        server = FakeTelegramServer()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        tokens = [
+            '{}:bench-token'.format(100000 + i)
+            for i in range(options['bots'])
+        ]
+        pool = ClientPool(
+            base_url=server.url,
+            con_pool_size=options['pool_size'],
+        )
+
+        def new_client(token):
+            # a client is created for every message without the pool
+            return TelegramBot(
+                token,
+                base_url=server.url,
+                request=Request(con_pool_size=1),
+            )
+
+        try:
+            self.measure(server, 'pooled', pool.get, tokens, options)
+            self.measure(server, 'new client', new_client, tokens, options)
+        finally:
+            pool.close()
+            server.shutdown()
+            server.server_close()
+
+    def measure(self, server, name, get_client, tokens, options):
+        messages = options['messages']
+        threads = options['threads']
+        server.connections = 0
+
+        def send(worker):
+            for i in range(worker, messages, threads):
+                client = get_client(tokens[i % len(tokens)])
+                client.send_message(chat_id=1, text='Bench')
+
+        workers = [
+            threading.Thread(target=send, args=(i,)) for i in range(threads)
+        ]
+
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            '{name}: {count} messages, {rate:.1f} messages/s, '
+            '{connections} connections'.format(
+                name=name,
+                count=messages,
+                rate=messages / elapsed,
+                connections=server.connections,
+            )
+        )
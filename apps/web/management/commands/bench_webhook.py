@@ -0,0 +1,191 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from apps.celery import app
+from apps.config.common.webhooks import WEBHOOK_INLINE, WEBHOOK_QUEUED
+from apps.web import dedup, delivery
+from apps.web.delivery import MemoryJobQueue
+from apps.web.tests.utils import create_quest
+
+# created, handled and queued updates
+SUCCESS_STATUSES = (200, 201, 202)
+
+
+def percentile(values, percent):
+    """Return the nearest-rank percentile of the values"""
+    ordered = sorted(values)
+    index = max(0, int(round(percent / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+
+def text_update(update_id, chat_id, text):
+    """Build Telegram text update payload"""
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {
+                'id': chat_id,
+                'type': 'private',
+                'username': f'bench{chat_id}',
+                'first_name': 'Bench',
+            },
+            'from': {
+                'id': chat_id,
+                'is_bot': False,
+                'first_name': 'Bench',
+                'username': f'bench{chat_id}',
+                'language_code': 'en',
+            },
+            'text': text,
+        },
+    }
+
+
+@contextmanager
+def temporary_database():
+    """Create the database of the benchmark and drop it afterwards, SQLite
+    one is a file, so PRAGMAs of profiles take effect"""
+    creation = connection.creation
+    test_settings = connection.settings_dict['TEST']
+    name = test_settings.get('NAME')
+    directory = None
+
+    if connection.vendor == 'sqlite':
+        directory = tempfile.mkdtemp()
+        test_settings['NAME'] = os.path.join(directory, 'bench.sqlite3')
+
+    old_name = creation.create_test_db(
+        verbosity=0,
+        autoclobber=True,
+        serialize=False,
+    )
+    try:
+        yield
+    finally:
+        creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = name
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+@contextmanager
+def local_queues():
+    """Publish tasks to the in-memory broker, put delivery jobs and seen
+    updates to the memory of the process, so nothing is handled or sent
+    outside of the benchmark"""
+    conf = app.conf
+    previous = conf.broker_url, conf.task_always_eager
+    conf.broker_url, conf.task_always_eager = 'memory://', False
+
+    seen_set = dedup.MemorySeenSet(
+        ttl=settings.UPDATES_DEDUP_TTL,
+        maxsize=settings.UPDATES_DEDUP_MEMORY_SIZE,
+    )
+
+    try:
+        with mock.patch.object(delivery, '_queue', MemoryJobQueue()), \
+                mock.patch.object(dedup, '_seen_set', seen_set):
+            yield
+    finally:
+        conf.broker_url, conf.task_always_eager = previous
+
+
+class Command(BaseCommand):
+    help = ('Measure webhook latency (p50/p99) and throughput in inline and '
+            'queued modes with SQLite profiles, updates are posted to the '
+            'test quest in a temporary database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--chats', type=int, default=10)
+        parser.add_argument(
+            '--text',
+            default='hello',
+            help='Text of updates, "hello" is handled by the test quest',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=(WEBHOOK_INLINE, WEBHOOK_QUEUED),
+            action='append',
+            help='Processing mode to measure, both by default',
+        )
+        parser.add_argument(
+            '--sqlite-profile',
+            choices=sorted(settings.SQLITE_PROFILES),
+            action='append',
+            help='SQLite profile to measure, the current one by default',
+        )
+
+    def handle(self, *args, **options):
+        modes = options['mode'] or (WEBHOOK_INLINE, WEBHOOK_QUEUED)
+        profiles = options['sqlite_profile'] or (settings.SQLITE_PROFILE,)
+
+        with temporary_database(), local_queues():
+            bot = create_quest()
+            url = reverse(
+                'web-api:hooks-handler',
+                kwargs={'hook_id': bot.hook_id},
+            )
+            client = Client()
+            update_id = 0
+
+            for profile in profiles:
+                with override_settings(SQLITE_PROFILE=profile):
+                    # PRAGMAs of the profile are applied to the new
+                    # connection
+                    connection.close()
+
+                    for mode in modes:
+                        update_id = self.measure(
+                            client, url, update_id, mode, profile, options)
+
+    def measure(self, client, url, update_id, mode, profile, options):
+        timings = []
+
+        with override_settings(WEBHOOK_PROCESSING_MODE=mode):
+            for i in range(options['requests']):
+                update_id += 1
+                payload = text_update(
+                    update_id,
+                    chat_id=10 ** 9 + i % options['chats'],
+                    text=options['text'],
+                )
+
+                started = time.perf_counter()
+                response = client.post(
+                    url,
+                    json.dumps(payload),
+                    content_type='application/json',
+                )
+                timings.append((time.perf_counter() - started) * 1000)
+
+                if response.status_code not in SUCCESS_STATUSES:
+                    raise CommandError('Update {} is answered with {}'.format(
+                        update_id, response.status_code))
+
+        self.stdout.write(
+            '{mode} ({profile} sqlite): {count} requests, p50 {p50:.2f} ms, '
+            'p99 {p99:.2f} ms, {rate:.1f} updates/s'.format(
+                mode=mode,
+                profile=profile,
+                count=len(timings),
+                p50=percentile(timings, 50),
+                p99=percentile(timings, 99),
+                rate=len(timings) / sum(timings) * 1000,
+            )
+        )
+
+        return update_id
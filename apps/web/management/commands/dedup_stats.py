@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.web.dedup import get_rejected
+
+
+class Command(BaseCommand):
+    help = ('Show number of rejected updates redelivered by Telegram, the '
+            'counter is shared by processes with the redis backend only')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            '{count} duplicate updates rejected ({backend} seen-set)'.format(
+                count=get_rejected(),
+                backend=settings.UPDATES_DEDUP_BACKEND,
+            )
+        )
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.web.models import Bot
+from apps.web.outbound import get_metrics
+
+
+class Command(BaseCommand):
+    help = ('Show throughput and latency of outgoing messages per bot, '
+            'counters are shared by workers with the redis backend')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=10,
+            help='Seconds to measure throughput for',
+        )
+
+    def handle(self, *args, **options):
+        bots = list(Bot.objects.order_by('name'))
+        before = {bot.id: get_metrics(bot.id) for bot in bots}
+
+        time.sleep(options['interval'])
+
+        for bot in bots:
+            metrics = get_metrics(bot.id)
+            sent = metrics['sent'] - before[bot.id]['sent']
+            latency = metrics['latency'] - before[bot.id]['latency']
+
+            self.stdout.write(
+                '{name}: {rate:.1f} messages/s, mean latency {latency:.2f} s, '
+                '{sent:.0f} sent, {throttled:.0f} throttled by Telegram, '
+                '{postponed:.0f} postponed in total'.format(
+                    name=bot.name,
+                    rate=sent / options['interval'],
+                    latency=latency / sent if sent else 0,
+                    sent=metrics['sent'],
+                    throttled=metrics['throttled'],
+                    postponed=metrics['postponed'],
+                )
+            )
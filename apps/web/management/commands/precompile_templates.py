@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.web.templating import precompile_templates
+
+
+class Command(BaseCommand):
+    help = 'Compile response templates of enabled bots to the bytecode cache'
+
+    def handle(self, *args, **options):
+        if not settings.JINJA2_BYTECODE_CACHE_DIR:
+            self.stderr.write('JINJA2_BYTECODE_CACHE_DIR is not set')
+            return
+
+        count = precompile_templates()
+
+        self.stdout.write('{count} responses compiled to {directory}'.format(
+            count=count,
+            directory=settings.JINJA2_BYTECODE_CACHE_DIR,
+        ))
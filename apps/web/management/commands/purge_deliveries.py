@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.web.models import Delivery
+
+
+class Command(BaseCommand):
+    help = 'Delete sent messages older than DELIVERY_RETENTION days'
+
+    def handle(self, *args, **options):
+        count = Delivery.objects.purge()
+
+        self.stdout.write('{count} deliveries older than {days} days '
+                          'deleted'.format(
+                              count=count,
+                              days=settings.DELIVERY_RETENTION,
+                          ))
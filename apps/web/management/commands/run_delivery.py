@@ -0,0 +1,40 @@
+import asyncio
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.web.delivery import DeliveryService
+
+
+class Command(BaseCommand):
+    help = ('Run the asyncio service sending messages queued with '
+            'MESSAGE_DELIVERY=asyncio')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.DELIVERY_CONCURRENCY,
+            help='Messages in flight',
+        )
+        parser.add_argument(
+            '--pool-size',
+            type=int,
+            default=settings.DELIVERY_POOL_SIZE,
+            help='Connections to the Bot API',
+        )
+
+    def handle(self, *args, **options):
+        service = DeliveryService(
+            concurrency=options['concurrency'],
+            pool_size=options['pool_size'],
+        )
+
+        loop = asyncio.get_event_loop()
+        # messages in flight are sent before exit
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, service.stop)
+
+        self.stdout.write('Delivery service is started')
+        loop.run_until_complete(service.run())
@@ -0,0 +1,217 @@
+"""Index of text conditions to match all of them in a single pass
+
+Conditions of a step are grouped by the matched field, each group is
+matched against normalized text of the field at once:
+
+    full coincidence, QR code - hash lookup
+    starts with, ends with - trie of values and trie of reversed values
+    contains - Aho-Corasick automaton
+    match regex - alternation of patterns with a group per condition
+
+"""
+import logging
+import re
+
+from apps.web.models.condition import (
+    CONTAINS,
+    ENDS_WITH,
+    FULL_COINCIDENCE,
+    MATCH_REGEX,
+    QR_CODE,
+    STARTS_WITH,
+)
+
+logger = logging.getLogger(__name__)
+
+INDEXED_RULES = (
+    FULL_COINCIDENCE,
+    QR_CODE,
+    STARTS_WITH,
+    ENDS_WITH,
+    CONTAINS,
+    MATCH_REGEX,
+)
+
+# backreferences and inline flags change their meaning in alternation
+NOT_COMBINED_REGEX = re.compile(r'\\\d|\(\?[aiLmsux-]|\(\?P=')
+
+
+class Trie(object):
+    """Find all keys which are prefixes of the text"""
+
+    def __init__(self):
+        self.children = [{}]
+        self.values = [set()]
+
+    def add(self, key, value):
+        node = 0
+        for char in key:
+            child = self.children[node].get(char)
+            if child is None:
+                child = len(self.children)
+                self.children.append({})
+                self.values.append(set())
+                self.children[node][char] = child
+            node = child
+        self.values[node].add(value)
+
+    def prefixes(self, text):
+        found = set(self.values[0])
+        node = 0
+        for char in text:
+            node = self.children[node].get(char)
+            if node is None:
+                break
+            found |= self.values[node]
+        return found
+
+
+class AhoCorasick(Trie):
+    """Find all keys which are substrings of the text"""
+
+    def __init__(self):
+        super().__init__()
+        self.fail = None
+
+    def build(self):
+        self.fail = [0] * len(self.children)
+        queue = list(self.children[0].values())
+
+        for node in queue:
+            for char, child in self.children[node].items():
+                queue.append(child)
+
+                fail = self.fail[node]
+                while fail and char not in self.children[fail]:
+                    fail = self.fail[fail]
+                fail = self.children[fail].get(char, 0)
+
+                self.fail[child] = fail if fail != child else 0
+                self.values[child] |= self.values[self.fail[child]]
+
+    def search(self, text):
+        found = set(self.values[0])
+        node = 0
+        for char in text:
+            while node and char not in self.children[node]:
+                node = self.fail[node]
+            node = self.children[node].get(char, 0)
+            found |= self.values[node]
+        return found
+
+
+class RegexAlternation(object):
+    """Match text against a set of patterns with as few passes as possible
+
+    The first matched alternative of the combined pattern means that all
+    previous patterns don't match, so next pass starts after it
+
+    """
+
+    def __init__(self):
+        self.patterns = []
+        self.separate = []
+        self.combined = {}
+
+    def add(self, compiled, value):
+        if NOT_COMBINED_REGEX.search(compiled.pattern) or compiled.groupindex:
+            self.separate.append((compiled, value))
+        else:
+            self.patterns.append((compiled.pattern, value))
+
+    def get_combined(self, start):
+        if start not in self.combined:
+            self.combined[start] = re.compile('|'.join(
+                '(?P<_{}>{})'.format(index, pattern)
+                for index, (pattern, _) in enumerate(self.patterns)
+                if index >= start
+            ))
+        return self.combined[start]
+
+    def search(self, text):
+        found = {value for i, value in self.separate if i.match(text)}
+
+        start = 0
+        while start < len(self.patterns):
+            match = self.get_combined(start).match(text)
+            if not match:
+                break
+            index = int(match.lastgroup[1:])
+            found.add(self.patterns[index][1])
+            start = index + 1
+
+        return found
+
+
+class FieldMatcher(object):
+    """Text conditions of one matched field"""
+
+    def __init__(self, conditions):
+        self.condition_ids = frozenset(i.id for i in conditions)
+        self.exact = {}
+        self.prefixes = Trie()
+        self.suffixes = Trie()
+        self.substrings = AhoCorasick()
+        self.regex = RegexAlternation()
+
+        for condition in conditions:
+            value = condition.value.lower()
+
+            if condition.rule in (FULL_COINCIDENCE, QR_CODE):
+                self.exact.setdefault(value, set()).add(condition.id)
+            elif condition.rule == STARTS_WITH:
+                self.prefixes.add(value, condition.id)
+            elif condition.rule == ENDS_WITH:
+                self.suffixes.add(value[::-1], condition.id)
+            elif condition.rule == CONTAINS:
+                # value isn't lowercased for this rule
+                self.substrings.add(condition.value, condition.id)
+            elif condition.rule == MATCH_REGEX:
+                try:
+                    self.regex.add(condition.compiled.pattern, condition.id)
+                except re.error:
+                    logger.error('Invalid regex of condition {}: {}'.format(
+                        condition.id, condition.value))
+
+        self.substrings.build()
+
+    def match(self, text):
+        """Return ids of all conditions matching to the normalized text"""
+        found = set(self.exact.get(text, ()))
+        found |= self.prefixes.prefixes(text)
+        found |= self.suffixes.prefixes(text[::-1])
+        found |= self.substrings.search(text)
+        found |= self.regex.search(text)
+        return found
+
+
+class StepMatcher(object):
+    """Text conditions of all handlers of the step"""
+
+    def __init__(self, conditions):
+        by_field = {}
+        for condition in conditions:
+            if condition.rule in INDEXED_RULES:
+                by_field.setdefault(condition.matched_field, []).append(
+                    condition
+                )
+
+        self.fields = {
+            field: FieldMatcher(items) for field, items in by_field.items()
+        }
+        self.condition_ids = frozenset(
+            i for field in self.fields.values() for i in field.condition_ids
+        )
+
+    def __contains__(self, condition):
+        return condition.id in self.condition_ids
+
+    def check(self, condition, context):
+        """Check all conditions of the same field, store them in results"""
+        field = self.fields[condition.matched_field]
+        matched = field.match(context.get_text(condition.matched_field))
+
+        for condition_id in field.condition_ids:
+            context.results[condition_id] = int(condition_id in matched)
+
+        return context.results[condition.id]
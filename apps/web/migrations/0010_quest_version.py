@@ -0,0 +1,18 @@
+# Generated by Django 2.0.13 on 2026-10-18 05:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0009_auto_20190705_1407'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quest',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Increased on every change of steps, handlers, conditions and responses', verbose_name='Version'),
+        ),
+    ]
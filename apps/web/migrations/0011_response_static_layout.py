@@ -0,0 +1,114 @@
+# Generated by Django 2.0.13 on 2026-10-18 05:49
+
+import ast
+import json
+import textwrap
+
+from django.db import migrations, models
+
+from jinja2 import Environment, TemplateSyntaxError, nodes
+
+# frozen copies of the helpers of the time, later changes of them must not
+# change this migration
+
+
+def clear_redundant_tags(text):
+    return text.replace('<br />', '').replace('&nbsp;', ' ')
+
+
+def is_static_template(environment, source):
+    try:
+        tree = environment.parse(source)
+    except TemplateSyntaxError:
+        return False
+
+    return all(
+        isinstance(node, nodes.Output) and all(
+            isinstance(i, nodes.TemplateData) for i in node.nodes
+        )
+        for node in tree.body
+    )
+
+
+def split_message_text(text):
+    return [
+        part
+        for text in text.strip().split('__')
+        for part in textwrap.wrap(text, 4096, replace_whitespace=False)
+    ]
+
+
+def build_keyboard(source, one_time_keyboard):
+    if not source:
+        return []
+
+    try:
+        layout = json.loads(source)
+    except ValueError:
+        try:
+            layout = ast.literal_eval(source)
+        except SyntaxError as error:
+            raise ValueError(str(error))
+
+    return dict(
+        keyboard=list(layout),
+        one_time_keyboard=one_time_keyboard,
+        resize_keyboard=True,
+        selective=False,
+    )
+
+
+def build_static_layout(environment, text, keyboard, one_time_keyboard):
+    text = clear_redundant_tags(text or '')
+    keyboard = keyboard or ''
+
+    if not (is_static_template(environment, text) and
+            is_static_template(environment, keyboard)):
+        return None
+
+    text = environment.from_string(text).render()
+    keyboard = environment.from_string(keyboard).render()
+
+    try:
+        built_keyboard = build_keyboard(keyboard, one_time_keyboard)
+    except (ValueError, TypeError):
+        return None
+
+    return json.dumps({
+        'text': split_message_text(text),
+        'keyboard': keyboard,
+        'built_keyboard': built_keyboard,
+    })
+
+
+def prepare_static_layouts(apps, schema_editor):
+    Response = apps.get_model('web', 'Response')
+    environment = Environment()
+
+    for response in Response.objects.all():
+        response.static_layout = build_static_layout(
+            environment,
+            response.text,
+            response.keyboard,
+            response.one_time_keyboard,
+        )
+        response.save(update_fields=['static_layout'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0010_quest_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='response',
+            name='static_layout',
+            field=models.TextField(blank=True, editable=False, help_text='Prepared text and keyboard of the response without template syntax, empty for the rendered ones', null=True, verbose_name='Static layout'),
+        ),
+        migrations.RunPython(
+            prepare_static_layouts,
+            migrations.RunPython.noop,
+        ),
+    ]
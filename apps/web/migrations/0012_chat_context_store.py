@@ -0,0 +1,24 @@
+# Generated by Django 2.0.13 on 2026-10-18 05:50
+
+import apps.web.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0011_response_static_layout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='handler',
+            name='context_update',
+            field=models.TextField(blank=True, help_text='Change chat template context if mathematics expression truthful, example: {"$inc": {"score": 1}, "$set": {"level": "cave"}}', null=True, validators=[apps.web.validators.context_update_validator], verbose_name='Context update'),
+        ),
+        migrations.AlterField(
+            model_name='chat',
+            name='template_context',
+            field=models.TextField(blank=True, default='{}', null=True, validators=[apps.web.validators.json_field_validator], verbose_name='Template context'),
+        ),
+    ]
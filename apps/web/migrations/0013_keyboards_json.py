@@ -0,0 +1,58 @@
+# Generated by Django 2.0.13 on 2026-10-18 05:51
+
+import ast
+import json
+
+from django.db import migrations, models
+
+
+# frozen copy of ``apps.web.keyboards`` of the time
+def loads(source):
+    try:
+        return json.loads(source)
+    except ValueError:
+        pass
+
+    try:
+        return ast.literal_eval(source)
+    except SyntaxError as error:
+        raise ValueError(str(error))
+
+
+def dumps(markup):
+    return json.dumps(markup, ensure_ascii=False, separators=(',', ':'))
+
+
+def convert_current_keyboards(apps, schema_editor):
+    """Python literals of current keyboards are stored as JSON"""
+    Chat = apps.get_model('web', 'Chat')
+
+    for chat in Chat.objects.exclude(current_keyboard=None):
+        try:
+            markup = loads(chat.current_keyboard)
+        except ValueError:
+            markup = None
+
+        chat.current_keyboard = (
+            dumps(markup) if markup is not None else None
+        )
+        chat.save(update_fields=['current_keyboard'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0012_chat_context_store'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chat',
+            name='current_keyboard',
+            field=models.TextField(blank=True, editable=False, help_text='Is used to define available command from keyboard, JSON of the keyboard markup', max_length=1000, null=True),
+        ),
+        migrations.RunPython(
+            convert_current_keyboards,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.0.13 on 2026-10-18 05:57
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def delete_duplicates(apps, schema_editor):
+    """Keep the first stored update of redelivered ones"""
+    Update = apps.get_model('web', 'Update')
+
+    duplicates = Update.objects.values('bot', 'update_id').annotate(
+        count=Count('id'),
+        first_id=Min('id'),
+    ).filter(count__gt=1)
+
+    for duplicate in duplicates:
+        Update.objects.filter(
+            bot=duplicate['bot'],
+            update_id=duplicate['update_id'],
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0013_keyboards_json'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='update',
+            unique_together={('bot', 'update_id')},
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 2.0.13 on 2026-10-18 06:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0014_update_unique_bot_update_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadLetter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='Entity created at', null=True, verbose_name='Created at')),
+                ('modified', models.DateTimeField(auto_now=True, help_text='Entity created at', null=True, verbose_name='Updated at')),
+                ('error', models.TextField(verbose_name='Error')),
+            ],
+            options={
+                'verbose_name': 'Dead letter',
+                'verbose_name_plural': 'Dead letters',
+            },
+        ),
+        migrations.CreateModel(
+            name='Delivery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='Entity created at', null=True, verbose_name='Created at')),
+                ('modified', models.DateTimeField(auto_now=True, help_text='Entity created at', null=True, verbose_name='Updated at')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Idempotency key')),
+                ('chat_id', models.BigIntegerField(verbose_name='Chat id')),
+                ('text', models.TextField(verbose_name='Text')),
+                ('options', models.TextField(default='{}', help_text='Keyboard, reply and notification options as JSON', verbose_name='Options')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('dead', 'Dead')], db_index=True, default='pending', max_length=10, verbose_name='Status')),
+                ('failures', models.PositiveIntegerField(default=0, verbose_name='Failed attempts')),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('bot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='web.Bot')),
+            ],
+            options={
+                'verbose_name': 'Delivery',
+                'verbose_name_plural': 'Deliveries',
+            },
+        ),
+        migrations.AddField(
+            model_name='deadletter',
+            name='delivery',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='dead_letter', to='web.Delivery'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.0.13 on 2026-10-18 06:43
+
+import apps.web.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0015_deliveries'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='handler',
+            name='ids_expression',
+            field=models.CharField(blank=True, help_text='A set of math symbols to construct a particular rule, example: {} + {} > 1; example2: {cond_id} == 0; supported: numbers, + - * / // %, comparisons and parentheses; conditions without operators, e.g. {}{}, mean that any of them is true', max_length=500, null=True, validators=[apps.web.validators.condition_validator], verbose_name='Mathematics expression'),
+        ),
+    ]
@@ -12,6 +12,7 @@ from .bot import Bot
 from .chat import Chat
 from .update import Update
 from .callback_query import CallbackQuery
+from .delivery import DeadLetter, Delivery
 
 
 __all__ = (
@@ -29,4 +30,6 @@ __all__ = (
     'Chat',
     'Update',
     'CallbackQuery',
+    'Delivery',
+    'DeadLetter',
 )
@@ -1,5 +1,6 @@
 import logging
 import textwrap
+import time
 import uuid
 
 from django.conf import settings
@@ -9,8 +10,17 @@ from django.utils.translation import ugettext_lazy as _
 
 from constance import config
 from telegram.bot import Bot as TelegramBot
-from telegram.error import InvalidToken, TelegramError
+from telegram.error import (
+    BadRequest,
+    InvalidToken,
+    NetworkError,
+    RetryAfter,
+    TelegramError,
+    TimedOut,
+)
 
+from apps.web import outbound
+from apps.web.clients import get_client
 from apps.web.validators import token_validator
 
 from .abstract import TimeStampModel
@@ -18,6 +28,25 @@ from .abstract import TimeStampModel
 logger = logging.getLogger(__name__)
 
 
+def split_message_text(text: str) -> list:
+    """Split text into messages, ``__`` separates messages explicitly"""
+    msg_texts = []
+
+    # Text of the message to be sent. Max 4096 characters.
+    # Also found as telegram.constants.MAX_MESSAGE_LENGTH
+    for text in text.strip().split('__'):
+        for part in textwrap.wrap(text, 4096, replace_whitespace=False):
+            msg_texts.append(part)
+
+    return msg_texts
+
+
+def is_transient(error: TelegramError) -> bool:
+    """Return if sending may succeed on the next attempt"""
+    return isinstance(error, (NetworkError, TimedOut)) and not isinstance(
+        error, BadRequest)
+
+
 class BotDescriptor(object):
     def __get__(self, instance, owner):
         if not instance._bot:
@@ -89,9 +118,13 @@ class Bot(TimeStampModel):
                 {'token': _('Your token is not valid.')})
 
     def init_bot(self):
-        """Initialize bot instance through Telegram API"""
+        """Initialize bot instance through Telegram API
+
+        Client of the token is shared by the process
+
+        """
 
-        self._bot = TelegramBot(token=self.token)
+        self._bot = get_client(self.token)
 
     def get_file(self, file_id):
         """Download file by link"""
@@ -139,30 +172,118 @@ class Bot(TimeStampModel):
             reply_message_id=None,
             disable_notifications=False,
             disable_links_preview=False,
+            reserved=False,
+            queued=None,
+            keys=None,
     ):
+        """Send text to the chat
+
+        ``text`` is either a string or a list of already split messages,
+        ``keys`` are their idempotency keys, already sent messages are
+        skipped. Messages are delayed to keep within Telegram limits and
+        sent again after network errors, if they can't be sent soon
+        ``Postponed`` is raised. ``reserved`` is what is already reserved
+        for the first unsent message, see ``outbound.Postponed``,
+        ``queued`` is the timestamp the messages were queued at
+
+        """
+        from apps.web.models.delivery import Delivery
+
         parse_mode = getattr(config, settings.TELEGRAM_PARSE_MODE)
 
-        msg_texts = []
+        if isinstance(text, (list, tuple)):
+            msg_texts = text
+        else:
+            msg_texts = split_message_text(text)
+
+        if keys is None:
+            prefix = uuid.uuid4().hex
+            keys = ['{}:{}'.format(prefix, i) for i in range(len(msg_texts))]
 
-        # Text of the message to be sent. Max 4096 characters.
-        # Also found as telegram.constants.MAX_MESSAGE_LENGTH
-        for text in text.strip().split('__'):
-            for part in textwrap.wrap(text, 4096, replace_whitespace=False):
-                msg_texts.append(part)
+        options = dict(
+            keyboard=keyboard,
+            reply_message_id=reply_message_id,
+            disable_notifications=disable_notifications,
+            disable_links_preview=disable_links_preview,
+        )
+        sent = Delivery.objects.sent_keys(keys)
 
-        for msg in msg_texts:
+        try:
+            for key, msg in zip(keys, msg_texts):
+                if key in sent:
+                    continue
+
+                self.wait_for_sending(chat_id, reserved=reserved)
+                reserved = False
+                self.send_chunk(key, chat_id, msg, parse_mode, options, queued)
+        except outbound.Postponed as postponed:
+            postponed.keys = keys
+            raise
+
+    def send_chunk(self, key, chat_id, text, parse_mode, options, queued):
+        """Send the message, record its delivery or the failure"""
+        from apps.web.models.delivery import Delivery
+
+        while True:
             try:
                 self.bot.send_message(
                     chat_id=chat_id,
-                    text=msg,
+                    text=text,
                     parse_mode=parse_mode,
-                    disable_web_page_preview=disable_links_preview,
-                    disable_notification=disable_notifications,
-                    reply_message_id=reply_message_id,
-                    reply_markup=keyboard,
-                    timeout=5000,
+                    disable_web_page_preview=options['disable_links_preview'],
+                    disable_notification=options['disable_notifications'],
+                    reply_to_message_id=options['reply_message_id'],
+                    reply_markup=options['keyboard'],
                 )
+            except RetryAfter as error:
+                outbound.count(self.id, throttled=1)
+                outbound.penalize(self.id, chat_id, error.retry_after)
+                self.wait_for_sending(chat_id)
+                continue
             except TelegramError as error:
-                logger.error("""Error on message send has been occurred. chat:
-                {}, text: {}, reply_message: {}, markup: {}, error: {}
-                """.format(chat_id, msg, reply_message_id, keyboard, error))
+                logger.error(
+                    'Error on message send has been occurred. chat: {}, '
+                    'text: {}, options: {}, error: {}'.format(
+                        chat_id, text, options, error)
+                )
+                delivery = Delivery.record_failure(
+                    key, self.id, chat_id, text, options, error,
+                    permanent=not is_transient(error),
+                )
+                if not delivery.is_dead:
+                    raise outbound.Postponed(
+                        outbound.get_backoff(delivery.failures),
+                        reserved=False,
+                    )
+            else:
+                Delivery.record_sent(key, self.id, chat_id, text, options)
+                outbound.count(
+                    self.id,
+                    sent=1,
+                    latency=time.time() - (queued or time.time()),
+                )
+            return
+
+    def wait_for_sending(self, chat_id, reserved=False):
+        """Reserve sending time of the message and wait for it
+
+        ``reserved`` is what is already reserved for the message, see
+        ``outbound.Postponed``. The message is postponed with its reserved
+        times instead of waiting longer than ``OUTBOUND_MAX_WAIT``
+
+        """
+        if reserved == outbound.RESERVED_BOT:
+            return
+
+        delay = 0 if reserved else outbound.reserve_chat(self.id, chat_id)
+
+        if delay > settings.OUTBOUND_MAX_WAIT:
+            raise outbound.Postponed(delay, reserved=outbound.RESERVED_CHAT)
+
+        delay = outbound.reserve_bot(self.id, delay)
+
+        if delay > settings.OUTBOUND_MAX_WAIT:
+            raise outbound.Postponed(delay, reserved=outbound.RESERVED_BOT)
+
+        if delay > 0:
+            time.sleep(delay)
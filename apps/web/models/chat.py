@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
+from apps.web import keyboards
 from apps.web.validators import json_field_validator
 
 from .abstract import TimeStampModel
@@ -66,7 +67,8 @@ class Chat(TimeStampModel):
     )
     current_keyboard = models.TextField(
         max_length=1000,
-        help_text=_('Is used to define available command from keyboard'),
+        help_text=_('Is used to define available command from keyboard, '
+                    'JSON of the keyboard markup'),
         editable=False,
         null=True,
         blank=True,
@@ -86,7 +88,6 @@ class Chat(TimeStampModel):
     )
     template_context = models.TextField(
         verbose_name=_('Template context'),
-        max_length=3000,
         null=True,
         blank=True,
         default='{}',
@@ -101,4 +102,9 @@ class Chat(TimeStampModel):
         """Represent chat name"""
         if (self.username is not None):
             return ' | '.join([str(self.id), self.username])
-        return ' | '.join([str(self.id), self.title])
\ No newline at end of file
+        return ' | '.join([str(self.id), self.title])
+
+    @property
+    def keyboard_labels(self) -> frozenset:
+        """Labels of the buttons of the current keyboard"""
+        return keyboards.get_labels(self.current_keyboard)
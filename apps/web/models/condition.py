@@ -1,12 +1,13 @@
 import re
+from collections import namedtuple
 from datetime import datetime
-import uuid
+from functools import lru_cache
 
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
 from apps.web.models.constants import DATE_TIME_FORMAT
-from apps.web.models.update import Update
 
 from .abstract import TimeStampModel
 
@@ -54,6 +55,41 @@ FIELD_CHOICES = (
 )
 
 
+CompiledCondition = namedtuple(
+    'CompiledCondition',
+    ('value', 'pattern', 'datetime'),
+)
+
+
+def prepare_condition(rule, value) -> CompiledCondition:
+    """Prepare condition value to be matched
+
+    Raise ``re.error`` or ``ValueError`` if the value isn't valid for the
+    rule
+
+    """
+    value = (value or '').lower()
+    pattern = None
+    dt = None
+
+    if rule == MATCH_REGEX:
+        pattern = re.compile(value)
+    elif rule in (RECEIVED_AFTER, RECEIVED_BEFORE):
+        dt = datetime.strptime(value, DATE_TIME_FORMAT)
+
+    return CompiledCondition(value, pattern, dt)
+
+
+@lru_cache(maxsize=4096)
+def compile_condition(condition_id, modified, rule, value):
+    """Cached ``prepare_condition``
+
+    ``condition_id`` and ``modified`` identify condition's version
+
+    """
+    return prepare_condition(rule, value)
+
+
 class Condition(TimeStampModel):
     value = models.CharField(
         verbose_name='Answer or pattern',
@@ -78,29 +114,48 @@ class Condition(TimeStampModel):
         on_delete=models.CASCADE,
     )
 
-
     def __str__(self):
         return f'{self.rule}'
 
-    def is_match_to_rule(self, update: Update, msg=''):
-        """Check if update object match to the specified rule"""
-
-        cb = update.callback_query
-        mg = update.message
-
-        if self.matched_field == ANY_MESSAGE:
-            msg = update.get_message.text
-        elif self.matched_field == MESSAGE_TEXT and mg:
-            msg = update.message.text
-        elif self.matched_field == CALLBACK_MESSAGE_TEXT and cb:
-            msg = update.callback_query.message.text
-        elif self.matched_field == CALLBACK_DATA and cb:
-            msg = update.callback_query.data
-
-        msg = msg or ''
-
-        msg_text = msg.strip().lower()
-        value = self.value.lower()
+    def clean(self):
+        """Ensure that the value is valid pattern or date for the rule"""
+        try:
+            prepare_condition(self.rule, self.value)
+        except re.error as error:
+            raise ValidationError({'value': ValidationError(
+                _('Regex is not valid: %(error)s'),
+                code='invalid',
+                params={'error': error},
+            )})
+        except ValueError:
+            raise ValidationError({'value': ValidationError(
+                _('Date must be in format %(format)s'),
+                code='invalid',
+                params={'format': DATE_TIME_FORMAT},
+            )})
+
+    def save(self, *args, **kwargs):
+        self.clean()
+        super().save(*args, **kwargs)
+
+        # warm up the cache for the saved version
+        compile_condition(self.id, self.modified, self.rule, self.value)
+
+    @property
+    def compiled(self) -> CompiledCondition:
+        """Compiled value, cached by the worker until condition changed"""
+        return compile_condition(self.id, self.modified, self.rule, self.value)
+
+    def is_match_to_rule(self, context):
+        """Check if update of the ``UpdateContext`` match to the rule"""
+
+        msg_text = context.get_text(self.matched_field)
+        try:
+            compiled = self.compiled
+        except (re.error, ValueError):
+            return False
+
+        value = compiled.value
 
         if self.rule == FULL_COINCIDENCE or self.rule == QR_CODE:
             return msg_text == value
@@ -113,16 +168,10 @@ class Condition(TimeStampModel):
         elif self.rule == ENDS_WITH:
             return msg_text.endswith(value)
         elif self.rule == MATCH_REGEX:
-            return bool(re.match(value, msg_text))
+            return bool(compiled.pattern.match(msg_text))
         elif self.rule == CONTAIN_AN_IMAGE:
-            return update.get_message.photos.count()
-        elif self.rule in [RECEIVED_AFTER, RECEIVED_BEFORE]:
-            try:
-                dt = datetime.strptime(value, DATE_TIME_FORMAT)
-            except ValueError:
-                return False
-
-            if self.rule == RECEIVED_BEFORE:
-                return update.modified < dt
-            elif self.rule == RECEIVED_AFTER:
-                return update.modified > dt
+            return context.has_photos
+        elif self.rule == RECEIVED_BEFORE:
+            return context.received < compiled.datetime
+        elif self.rule == RECEIVED_AFTER:
+            return context.received > compiled.datetime
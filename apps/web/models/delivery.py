@@ -0,0 +1,141 @@
+import json
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from apps.web.querysets import DeadLetterQuerySet, DeliveryQuerySet
+from apps.web.upsert import upsert
+
+from .abstract import TimeStampModel
+
+PENDING = 'pending'
+SENT = 'sent'
+DEAD = 'dead'
+
+
+class Delivery(TimeStampModel):
+    """Outgoing message chunk
+
+    ``key`` is derived from the update, the response and the chunk index,
+    so the chunk is sent once even if the update is handled or the message
+    is retried again
+
+    """
+    STATUSES = (
+        (PENDING, _('Pending')),
+        (SENT, _('Sent')),
+        (DEAD, _('Dead')),
+    )
+
+    key = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name=_('Idempotency key'),
+    )
+    bot = models.ForeignKey(
+        to='Bot',
+        related_name='deliveries',
+        on_delete=models.CASCADE,
+    )
+    chat_id = models.BigIntegerField(verbose_name=_('Chat id'))
+    text = models.TextField(verbose_name=_('Text'))
+    options = models.TextField(
+        default='{}',
+        verbose_name=_('Options'),
+        help_text=_('Keyboard, reply and notification options as JSON'),
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING,
+        db_index=True,
+        verbose_name=_('Status'),
+    )
+    failures = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Failed attempts'),
+    )
+    last_error = models.TextField(blank=True, default='')
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    objects = DeliveryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('Delivery')
+        verbose_name_plural = _('Deliveries')
+
+    def __str__(self):
+        return self.key
+
+    @staticmethod
+    def record_sent(key, bot_id, chat_id, text, options):
+        upsert(Delivery, 'key', dict(
+            key=key,
+            bot_id=bot_id,
+            chat_id=chat_id,
+            text=text,
+            options=json.dumps(options),
+            status=SENT,
+            sent_at=timezone.now(),
+        ))
+
+    @staticmethod
+    def record_sent_many(records):
+        """Record sent chunks in a single transaction, ``records`` are
+        arguments of ``record_sent``"""
+        with transaction.atomic():
+            for record in records:
+                Delivery.record_sent(*record)
+
+    @staticmethod
+    def record_failure(key, bot_id, chat_id, text, options, error,
+                       permanent=False) -> 'Delivery':
+        """Count failed attempt, the chunk is moved to dead letters after
+        the permanent error or the last attempt"""
+        with transaction.atomic():
+            delivery, _ = Delivery.objects.select_for_update().get_or_create(
+                key=key,
+                defaults=dict(
+                    bot_id=bot_id,
+                    chat_id=chat_id,
+                    text=text,
+                    options=json.dumps(options),
+                ),
+            )
+
+            delivery.failures += 1
+            delivery.last_error = str(error)
+            if permanent or delivery.failures >= settings.DELIVERY_ATTEMPTS:
+                delivery.status = DEAD
+                DeadLetter.objects.update_or_create(
+                    delivery=delivery,
+                    defaults=dict(error=delivery.last_error),
+                )
+            delivery.save()
+
+        return delivery
+
+    @property
+    def is_dead(self) -> bool:
+        return self.status == DEAD
+
+
+class DeadLetter(TimeStampModel):
+    """Chunk which can't be sent, it's sent again by replaying"""
+    delivery = models.OneToOneField(
+        to=Delivery,
+        related_name='dead_letter',
+        on_delete=models.CASCADE,
+    )
+    error = models.TextField(verbose_name=_('Error'))
+
+    objects = DeadLetterQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('Dead letter')
+        verbose_name_plural = _('Dead letters')
+
+    def __str__(self):
+        return str(self.delivery)
@@ -1,14 +1,22 @@
+import itertools
+import json
 import re
+from functools import lru_cache, partial
 
-from django.db import models
+from django.db import models, transaction
+from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 
+from apps.web.custom_eval import ParseException
+from apps.web.custom_eval import compile as custom_compile
 from apps.web.custom_eval import eval as custom_eval
+from apps.web.delivery import deliver
 from apps.web.models.constants import HookActions
-from apps.web.models.update import Update
 from apps.web.models.chat import Chat
-from apps.web.tasks import send_message_task
-from apps.web.validators import condition_validator
+from apps.web.validators import (
+    condition_validator,
+    context_update_validator,
+)
 
 from .abstract import TimeStampModel
 
@@ -24,6 +32,111 @@ FIELD_CHOICES = (
     (CALLBACK, _('Callback')),
 )
 
+ID_PREFIX = 'c'
+POSITION_PREFIX = 'p'
+
+
+def condition_variable(prefix, number):
+    """Represent condition id or position as expression variable
+
+    Variables consist only of letters, so digits are replaced with them
+
+    """
+    return prefix + ''.join(chr(ord('a') + int(i)) for i in str(number))
+
+
+@lru_cache(maxsize=1024)
+def compile_handler_expression(handler_id, modified, expression,
+                               conditions_count, specify_ids=True):
+    """Compile handler expression, conditions become variables
+
+    ``handler_id`` and ``modified`` identify handler's version in the cache.
+    Empty expression and the one consisting only of conditions, e.g.
+    ``{}{}{}``, concatenate results of conditions to a number, so it means
+    that any of them must be true; it's compiled to their sum.
+
+    Return compiled expression and flag if conditions are referred by ids
+    or ``None`` if the expression can't be compiled, e.g. ``{}{} > 10``
+
+    """
+    expr = (expression or '').replace(' ', '')
+
+    if not expr:
+        expr = '+'.join(['{}'] * conditions_count)
+    elif re.match(r'^({\d*})+$', expr):
+        expr = expr.replace('}{', '}+{')
+
+    if '}{' in expr:
+        # adjacent conditions are concatenated as digits
+        return None
+
+    if not re.match(r'^.*{\d+}.*$', expr):
+        specify_ids = False
+
+    positions = itertools.count()
+
+    def replace(match):
+        if specify_ids and match.group(1):
+            return condition_variable(ID_PREFIX, match.group(1))
+        return condition_variable(POSITION_PREFIX, next(positions))
+
+    try:
+        compiled = custom_compile(re.sub(r'{(\d*)}', replace, expr))
+    except ParseException:
+        return None
+
+    return compiled, specify_ids
+
+
+def check_condition(condition, context, matcher=None):
+    """Check condition once per update, results are stored by condition id
+    in the ``UpdateContext``
+
+    Text conditions indexed by the step ``matcher`` are checked together
+
+    """
+    results = context.results
+
+    if condition.id not in results:
+        if matcher is not None and condition in matcher:
+            matcher.check(condition, context)
+        else:
+            results[condition.id] = int(condition.is_match_to_rule(context))
+
+    return results[condition.id]
+
+
+class ConditionsLookup(object):
+    """Variables of compiled expression
+
+    Condition is checked only when expression refers to it
+
+    """
+
+    def __init__(self, context, conditions, specify_ids, matcher=None):
+        self.context = context
+        self.matcher = matcher
+
+        if specify_ids:
+            self.conditions = {
+                condition_variable(ID_PREFIX, i.id): i for i in conditions
+            }
+        else:
+            self.conditions = {
+                condition_variable(POSITION_PREFIX, n): i
+                for n, i in enumerate(conditions)
+            }
+
+    def __contains__(self, name):
+        return name in self.conditions
+
+    def __getitem__(self, name):
+        return check_condition(
+            self.conditions[name],
+            self.context,
+            self.matcher,
+        )
+
 
 class Handler(TimeStampModel):
     step = models.ForeignKey(
@@ -43,9 +156,11 @@ class Handler(TimeStampModel):
         max_length=500,
         verbose_name='Mathematics expression',
         help_text=_(
-            "A set of math symbols to construct a particular rule,"
-            "example: {} + {} > 1; example2: {cond_id} == 0;"
-            "More details - http://pyparsing.wikispaces.com/file/view/arith.py/241810293/arith.py"
+            'A set of math symbols to construct a particular rule, '
+            'example: {} + {} > 1; example2: {cond_id} == 0; '
+            'supported: numbers, + - * / // %, comparisons and '
+            'parentheses; conditions without operators, e.g. {}{}, '
+            'mean that any of them is true'
         ),
         null=True,
         blank=True,
@@ -69,6 +184,17 @@ class Handler(TimeStampModel):
         blank=True,
         on_delete=models.CASCADE,
     )
+    context_update = models.TextField(
+        verbose_name=_('Context update'),
+        help_text=_(
+            'Change chat template context if mathematics expression '
+            'truthful, example: {"$inc": {"score": 1}, "$set": {"level": '
+            '"cave"}}'
+        ),
+        null=True,
+        blank=True,
+        validators=[context_update_validator],
+    )
     title = models.CharField(verbose_name="Handler title", max_length=255)
     redirects = models.ManyToManyField(
         to='AppUser',
@@ -84,7 +210,16 @@ class Handler(TimeStampModel):
     def __str__(self):
         return ' | '.join([str(self.step.number), self.title, ])
 
-    def redirect_message(self, bot, chat, message):
+    @cached_property
+    def context_operations(self) -> dict:
+        """Parsed context update, handler is cached with the quest graph"""
+        if not self.context_update:
+            return {}
+        return json.loads(self.context_update)
+
+    def redirect_message(self, bot, chat, message, context=None):
+        """Send received message to the redirect users, in the batch of
+        the update if ``context`` is passed"""
         for user in list(self.redirects.all()):
             chat = Chat.objects.filter(username__iexact=user.username).first()
 
@@ -97,34 +232,74 @@ class Handler(TimeStampModel):
                 text=message.text if message else None,
             )
 
-            if chat:
-                send_message_task(bot.id, chat_id=chat.id, text=fmtd_text)
+            if chat and context is not None:
+                context.outbox.add(chat.id, fmtd_text, key='{}:{}:{}'.format(
+                    context.update.id, self.id, chat.id))
+            elif chat:
+                transaction.on_commit(partial(
+                    deliver,
+                    bot.id,
+                    chat_id=chat.id,
+                    text=fmtd_text,
+                ))
 
     def check_handler_conditions(
             self,
-            update: Update,
+            context,
             specify_ids: bool = True,
+            matcher=None,
     ) -> bool:
         """Responsible for conditions checking
 
-        Ensure that massage fits in with the condition rules
+        Ensure that massage fits in with the condition rules.
+        ``context`` is the ``UpdateContext`` of the handled update,
+        ``matcher`` is an index of text conditions of the step
 
         """
-        conditions = self.conditions
+        conditions = list(self.conditions.all())
+
+        if not self.ids_expression and not conditions:
+            return False
+
+        compiled = compile_handler_expression(
+            self.id,
+            self.modified,
+            self.ids_expression,
+            len(conditions),
+            specify_ids,
+        )
+
+        if compiled is None:
+            return self.eval_formatted_expression(
+                context,
+                conditions,
+                specify_ids,
+                matcher,
+            )
 
+        expression, specify_ids = compiled
+        lookup = ConditionsLookup(context, conditions, specify_ids, matcher)
+
+        return bool(expression.eval(lookup))
+
+    def eval_formatted_expression(self, context, conditions, specify_ids,
+                                  matcher=None):
+        """Substitute results of all conditions into expression and parse it
+
+        Is used for expressions, that can't be compiled
+
+        """
         if self.ids_expression:
             expr = self.ids_expression.replace(' ', '') + ' '
-        elif conditions.count():
-            expr = '{}' * conditions.count() + ' '
         else:
-            return False
+            expr = '{}' * len(conditions) + ' '
 
         if not re.match('^.*{\d+}.*$', expr):
             specify_ids = False
 
         cond_result = {
-            ''.join(['#', str(i.id)]): int(i.is_match_to_rule(update))
-            for i in self.conditions.all()
+            ''.join(['#', str(i.id)]): check_condition(i, context, matcher)
+            for i in conditions
         }
 
         formatted_expr = ''
@@ -1,10 +1,13 @@
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
+from apps.web.querysets import QuestQuerySet
+
 from .abstract import TimeStampModel
 
 
 class Quest(TimeStampModel):
+    objects = QuestQuerySet.as_manager()
     title = models.CharField(verbose_name="Quest name", max_length=255)
     description = models.TextField(
         verbose_name="Quest description",
@@ -18,6 +21,13 @@ class Quest(TimeStampModel):
         blank=True,
         on_delete=models.CASCADE,
     )
+    version = models.PositiveIntegerField(
+        verbose_name=_('Version'),
+        help_text=_('Increased on every change of steps, handlers, '
+                    'conditions and responses'),
+        default=0,
+        editable=False,
+    )
 
     def __str__(self):
         return self.title
@@ -1,17 +1,25 @@
-import ast
+import json
+import time
+from collections import namedtuple
 
-from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 
-from jinja2 import Environment
 from telegram import KeyboardButton
 
-from apps.web.models.bot import Bot
+from apps.web import keyboards
+from apps.web.delivery import deliver
+from apps.web.models.bot import Bot, split_message_text
 from apps.web.models.chat import Chat
 from apps.web.models.message import Message
 from apps.web.querysets import ResponseQuerySet
-from apps.web.tasks import send_message_task
+from apps.web.templating import (
+    CompiledTemplates,
+    compile_response_templates,
+    compile_template,
+    is_static_template,
+)
 from apps.web.utils import clear_redundant_tags, jinja2_template_context
 from apps.web.validators import (
     array_field_validator,
@@ -20,6 +28,40 @@ from apps.web.validators import (
 
 from .abstract import TimeStampModel
 
+StaticLayout = namedtuple(
+    'StaticLayout',
+    ('text', 'keyboard', 'built_keyboard'),
+)
+
+
+def build_static_layout(text, keyboard, one_time_keyboard):
+    """Prepare response without template syntax to be sent as is
+
+    Return JSON with split text, keyboard and built keyboard or ``None`` if
+    the response has to be rendered for every chat
+
+    """
+    text = clear_redundant_tags(text or '')
+    keyboard = keyboard or ''
+
+    if not (is_static_template(text) and is_static_template(keyboard)):
+        return None
+
+    # rendering still matters, i.e. trailing newline is removed
+    text = compile_template(text).render()
+    keyboard = compile_template(keyboard).render()
+
+    try:
+        built_keyboard = Response.build_keyboard(keyboard, one_time_keyboard)
+    except (ValueError, TypeError):
+        return None
+
+    return json.dumps({
+        'text': split_message_text(text),
+        'keyboard': keyboard,
+        'built_keyboard': built_keyboard,
+    })
+
 
 class Response(TimeStampModel):
     objects = ResponseQuerySet.as_manager()
@@ -75,6 +117,14 @@ class Response(TimeStampModel):
         verbose_name=_('Priority in the queue'),
         default=1,
     )
+    static_layout = models.TextField(
+        verbose_name=_('Static layout'),
+        help_text=_('Prepared text and keyboard of the response without '
+                    'template syntax, empty for the rendered ones'),
+        null=True,
+        blank=True,
+        editable=False,
+    )
 
     def __str__(self):
         if self.handler:
@@ -88,67 +138,124 @@ class Response(TimeStampModel):
         if isinstance(element, tuple):
             return KeyboardButton(text=element[0])
 
-    def build_keyboard(self, keyboard, one_time_keyboard):
-        built_keyboard = []
-
-        if keyboard:
-            # since jinja2 template represents for list of buttons
-            # it should be converted into python object via ast library
-            built_keyboard = dict(
-                keyboard=list(ast.literal_eval(keyboard)),
-                one_time_keyboard=one_time_keyboard,
-                resize_keyboard=True,
-                selective=False,
-            )
-        return built_keyboard
-
-    @staticmethod
-    def render_layout(message, keyboard, context):
-        env = Environment(extensions=settings.JINJA2_EXTENTIONS)
-        keyboard_template = env.from_string(keyboard)
-        keyboard = keyboard_template.render(jinja2_template_context(context))
+    def save(self, *args, **kwargs):
+        self.static_layout = build_static_layout(
+            self.text,
+            self.keyboard,
+            self.one_time_keyboard,
+        )
+        self.__dict__.pop('static', None)
 
-        message_template = env.from_string(clear_redundant_tags(message))
-        message = message_template.render(jinja2_template_context(context))
+        super().save(*args, **kwargs)
 
-        return message, keyboard
+    @cached_property
+    def static(self) -> StaticLayout:
+        """Prepared layout of the static response, ``None`` otherwise"""
+        if self.static_layout is None:
+            return None
+        return StaticLayout(**json.loads(self.static_layout))
 
-    def send_response(self, bot: Bot, chat: Chat, message: Message, eta=None):
-        """Method responsible for answer and and related actions"""
+    @staticmethod
+    def build_keyboard(keyboard, one_time_keyboard):
+        return keyboards.build_markup(keyboard, one_time_keyboard)
 
-        text, keyboard = self.render_layout(
+    @property
+    def templates(self) -> CompiledTemplates:
+        """Compiled templates, cached by the process until response changed"""
+        return compile_response_templates(
+            self.id,
+            self.modified,
             self.text,
             self.keyboard,
-            context=chat.template_context,
         )
 
+    def render_layout(self, context: dict):
+        templates = self.templates
+        message = templates.text.render(context)
+        keyboard = templates.keyboard.render(context)
+
+        return message, keyboard
+
+    def send_response(self, bot: Bot, chat: Chat, message: Message, eta=None,
+                      context=None):
+        """Method responsible for answer and and related actions
+
+        Static response is sent as prepared on saving. Template variables
+        of the dynamic one are taken from the ``UpdateContext`` if it's
+        passed, otherwise they are parsed from the chat
+
+        """
+        static = self.static
+
+        if static is not None:
+            text, keyboard = static.text, static.keyboard
+            built_keyboard = static.built_keyboard
+        else:
+            if context is not None:
+                variables = context.chat_context.data
+            else:
+                variables = jinja2_template_context(chat.template_context)
+
+            text, keyboard = self.render_layout(context=variables)
+            built_keyboard = None
+
         if self.inherit_keyboard and chat.default_keyboard:
             keyboard = chat.default_keyboard
+            built_keyboard = None
+
+        changed = []
 
         if self.set_default_keyboard:
             chat.default_keyboard = keyboard
-            chat.save()
+            changed.append('default_keyboard')
 
         if self.delete_previous_keyboard:
             keyboard = {'hide_keyboard': True}
             chat.current_keyboard = None
         else:
-            keyboard = self.build_keyboard(keyboard, self.one_time_keyboard)
-            chat.current_keyboard = keyboard
-
-        # updates chat after keyboard changing
-        chat.save()
-        send_message_task.apply_async(
-            (bot.id,),
-            dict(
-                chat_id=chat.id,
-                reply_message_id=(
-                    message.message_id if message and self.as_reply else None
-                ),
-                keyboard=keyboard,
-                text=text,
-                disable_notifications=chat.no_notifications,
-                disable_links_preview=chat.no_links_preview,
+            if built_keyboard is None:
+                built_keyboard = self.build_keyboard(
+                    keyboard,
+                    self.one_time_keyboard,
+                )
+            keyboard = built_keyboard
+            chat.current_keyboard = keyboards.dumps(keyboard)
+
+        # updates chat after keyboard changing, within the update handling
+        # all changes of the chat are written at once
+        changed.append('current_keyboard')
+        if context is not None:
+            context.mark_changed(chat, *changed)
+        else:
+            chat.save(update_fields=changed + ['modified'])
+
+        options = dict(
+            reply_message_id=(
+                message.message_id if message and self.as_reply else None
             ),
-            eta=eta,
+            keyboard=keyboard,
+            disable_notifications=chat.no_notifications,
+            disable_links_preview=chat.no_links_preview,
         )
+
+        if context is not None:
+            # the response is sent once even if the update is handled
+            # again, in the batch of the update
+            context.outbox.add(
+                chat.id,
+                text,
+                key='{}:{}'.format(context.update.id, self.id),
+                **options
+            )
+            return
+
+        # message is sent only if the changes are committed
+        transaction.on_commit(lambda: deliver(
+            bot.id,
+            chat_id=chat.id,
+            text=text,
+            # latency of scheduled message is counted from its time
+            queued=eta.timestamp() if eta else time.time(),
+            eta=eta,
+            **options
+        ))
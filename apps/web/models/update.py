@@ -2,11 +2,14 @@ from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
 from apps.web.models.constants import HookActions
+from apps.web.querysets import UpdateQuerySet
 
 from .abstract import TimeStampModel
 
 
 class Update(TimeStampModel):
+    objects = UpdateQuerySet.as_manager()
+
     bot = models.ForeignKey(
         to='Bot',
         verbose_name=_('Bot from'),
@@ -37,6 +40,7 @@ class Update(TimeStampModel):
     class Meta:
         verbose_name = _('Update')
         verbose_name_plural = _('Updates')
+        unique_together = ('bot', 'update_id')
 
     def __str__(self):
         return f'{self.id}'
@@ -57,15 +61,19 @@ class Update(TimeStampModel):
             return self.callback_query.from_user
         raise AttributeError
 
+    @property
+    def has_photos(self) -> bool:
+        if hasattr(self, 'message_photos'):
+            # annotated by ``UpdateQuerySet.for_processing``
+            if self.message_id:
+                return self.message_photos
+            return self.callback_photos
+        return self.get_message.photos.exists()
+
     @property
     def is_reply_button(self):
         message = self.get_message
-        keyboard = message.chat.current_keyboard
-
-        if keyboard and (f'\'{message.text}\'' in keyboard):
-            return True
-        else:
-            return False
+        return message.text in message.chat.keyboard_labels
 
     @property
     def action_type(self):
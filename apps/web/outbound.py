@@ -0,0 +1,268 @@
+"""Scheduling of outgoing messages within Telegram limits
+
+Telegram allows about 30 messages per second for a bot, a message per
+second for a chat and 20 messages per minute for a group. Every message
+reserves the sending time in the token bucket of its chat, or group, and
+then in the bucket of the bot, and is delayed until that time instead of
+being dropped by flood control. Times of the chat are reserved one after
+another, so its messages are sent in the order they are scheduled.
+
+Buckets are kept as theoretical arrival times (GCRA) in the memory of the
+process or in Redis, where they are shared by all workers. Flood control
+answer pushes buckets of the message by ``retry_after`` seconds.
+
+Sent messages, flood control answers and the latency from queueing to
+sending are counted per bot.
+
+"""
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = 'questbot:outbound:'
+
+# reserves the time not earlier than ARGV[2] in the KEYS[1] bucket, ARGV
+# are now, the time, interval between messages and burst tolerance
+RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+local at = math.max(tonumber(ARGV[2]), tat - tonumber(ARGV[4]))
+tat = math.max(tat, at) + tonumber(ARGV[3])
+redis.call('SET', KEYS[1], tostring(tat), 'PX',
+           math.ceil((tat - now) * 1000) + 1000)
+return tostring(at)
+"""
+
+# pushes all buckets to ARGV[2] if they are earlier, ARGV[1] is now
+PENALIZE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local until_ = tonumber(ARGV[2])
+for i, key in ipairs(KEYS) do
+    local tat = tonumber(redis.call('GET', key) or now)
+    if tat < until_ then
+        redis.call('SET', key, tostring(until_), 'PX',
+                   math.ceil((until_ - now) * 1000) + 1000)
+    end
+end
+return 1
+"""
+
+METRICS = ('sent', 'throttled', 'postponed', 'latency')
+
+_scheduler = None
+
+
+class MemoryScheduler(object):
+    """Buckets and metrics of the process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tats = {}
+        self.metrics = {}
+
+    def reserve(self, bucket, now, at) -> float:
+        key, interval, tolerance = bucket
+
+        with self.lock:
+            tat = max(self.tats.get(key, now), now)
+            at = max(at, tat - tolerance)
+            self.tats[key] = max(tat, at) + interval
+
+        return at
+
+    def penalize(self, keys, now, until):
+        with self.lock:
+            for key in keys:
+                self.tats[key] = max(self.tats.get(key, now), until)
+
+    def count(self, bot_id, **values):
+        with self.lock:
+            metrics = self.metrics.setdefault(str(bot_id), dict.fromkeys(
+                METRICS, 0))
+            for name, value in values.items():
+                metrics[name] += value
+
+    def get_metrics(self, bot_id) -> dict:
+        return dict(self.metrics.get(str(bot_id)) or dict.fromkeys(
+            METRICS, 0))
+
+
+class RedisScheduler(object):
+    """Buckets and metrics shared by all workers"""
+
+    def __init__(self, url):
+        self.redis = redis.StrictRedis.from_url(url)
+        self.reserve_script = self.redis.register_script(RESERVE_SCRIPT)
+        self.penalize_script = self.redis.register_script(PENALIZE_SCRIPT)
+
+    def reserve(self, bucket, now, at) -> float:
+        key, interval, tolerance = bucket
+
+        return float(self.reserve_script(
+            keys=[REDIS_PREFIX + key],
+            args=[now, at, interval, tolerance],
+        ))
+
+    def penalize(self, keys, now, until):
+        self.penalize_script(
+            keys=[REDIS_PREFIX + key for key in keys],
+            args=[now, until],
+        )
+
+    def count(self, bot_id, **values):
+        key = REDIS_PREFIX + 'metrics:{}'.format(bot_id)
+        pipe = self.redis.pipeline(transaction=False)
+        for name, value in values.items():
+            if isinstance(value, float):
+                pipe.hincrbyfloat(key, name, value)
+            else:
+                pipe.hincrby(key, name, value)
+        pipe.execute()
+
+    def get_metrics(self, bot_id) -> dict:
+        stored = self.redis.hgetall(REDIS_PREFIX + 'metrics:{}'.format(
+            bot_id))
+        return {
+            name: float(stored.get(name.encode(), 0)) for name in METRICS
+        }
+
+
+def get_scheduler():
+    global _scheduler
+
+    if _scheduler is None:
+        if settings.OUTBOUND_BACKEND == settings.OUTBOUND_REDIS:
+            _scheduler = RedisScheduler(settings.OUTBOUND_REDIS_URL)
+        else:
+            _scheduler = MemoryScheduler()
+
+    return _scheduler
+
+
+def get_bucket(key, limit) -> tuple:
+    """Return key, interval between messages and burst tolerance"""
+    messages, period, burst = limit
+    interval = period / messages
+    return key, interval, interval * (burst - 1)
+
+
+def get_bot_bucket(bot_id) -> tuple:
+    return get_bucket('bot:{}'.format(bot_id), settings.OUTBOUND_BOT_LIMIT)
+
+
+def get_chat_bucket(bot_id, chat_id) -> tuple:
+    # ids of groups, supergroups and channels are negative
+    if int(chat_id) < 0:
+        limit = settings.OUTBOUND_GROUP_LIMIT
+    else:
+        limit = settings.OUTBOUND_CHAT_LIMIT
+
+    return get_bucket('chat:{}:{}'.format(bot_id, chat_id), limit)
+
+
+def reserve(bucket, delay=0) -> float:
+    """Reserve the time in the bucket not earlier than in ``delay``
+    seconds, return number of seconds to wait for it
+
+    Message is not delayed if the scheduler is unavailable
+
+    """
+    now = time.time()
+
+    try:
+        return get_scheduler().reserve(bucket, now, now + delay) - now
+    except redis.RedisError:
+        logger.exception('Outbound scheduler is not available')
+        return delay
+
+
+def reserve_chat(bot_id, chat_id) -> float:
+    """Reserve the time of the message in the chat, so messages of the chat
+    keep their order, return number of seconds to wait for it"""
+    return reserve(get_chat_bucket(bot_id, chat_id))
+
+
+def reserve_bot(bot_id, delay=0) -> float:
+    """Reserve the time of the message of the bot not earlier than in
+    ``delay`` seconds, return number of seconds to wait for it
+
+    It's reserved after the chat, so messages delayed by their chats
+    don't hold messages to other chats
+
+    """
+    return reserve(get_bot_bucket(bot_id), delay)
+
+
+def penalize(bot_id, chat_id, retry_after):
+    """Delay messages of the bot to the chat after flood control answer"""
+    now = time.time()
+    keys = [
+        get_bot_bucket(bot_id)[0],
+        get_chat_bucket(bot_id, chat_id)[0],
+    ]
+
+    try:
+        get_scheduler().penalize(keys, now, now + retry_after)
+    except redis.RedisError:
+        logger.exception('Outbound scheduler is not available')
+
+
+def count(bot_id, **values):
+    """Add values to the metrics of the bot, i.e. ``sent=1``"""
+    try:
+        get_scheduler().count(bot_id, **values)
+    except redis.RedisError:
+        logger.exception('Outbound scheduler is not available')
+
+
+def get_metrics(bot_id) -> dict:
+    """Return sent, throttled and postponed messages of the bot and their
+    total latency in seconds"""
+    return get_scheduler().get_metrics(bot_id)
+
+
+def get_chat_queue(chat_id):
+    """Return celery queue of messages to the chat, ``None`` is the
+    default one"""
+    if not settings.DELIVERY_CHAT_QUEUES:
+        return None
+
+    return '{}{}'.format(
+        settings.DELIVERY_QUEUE_PREFIX,
+        int(chat_id) % settings.DELIVERY_CHAT_QUEUES,
+    )
+
+
+# the first postponed message has reserved time in its chat, or both in
+# the chat and of the bot, and is sent at that time without reserving again
+RESERVED_CHAT = 'chat'
+RESERVED_BOT = 'bot'
+
+
+def get_backoff(failures) -> float:
+    """Return seconds to wait before the next attempt, exponential backoff
+    with full jitter"""
+    delay = min(
+        settings.DELIVERY_BACKOFF * 2 ** (failures - 1),
+        settings.DELIVERY_BACKOFF_MAX,
+    )
+    return random.uniform(0, delay)
+
+
+class Postponed(Exception):
+    """Messages have to be sent later, ``reserved`` is what is reserved for
+    the first unsent one, ``RESERVED_CHAT`` or ``RESERVED_BOT``"""
+
+    def __init__(self, delay, reserved=RESERVED_CHAT):
+        super().__init__('Messages are postponed for {:.2f} s'.format(delay))
+        self.delay = delay
+        self.reserved = reserved
+        # idempotency keys of the messages
+        self.keys = None
@@ -1,4 +1,11 @@
-from django.db import models
+import json
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
 
 
 class StepQuerySet(models.QuerySet):
@@ -10,7 +17,107 @@ class StepQuerySet(models.QuerySet):
         return self.filter(status=NOT_STARTED)
 
 
+class QuestQuerySet(models.QuerySet):
+    def increase_version(self):
+        """Mark compiled quest graphs outdated for all workers"""
+        return self.update(version=F('version') + 1)
+
+
 class ResponseQuerySet(models.QuerySet):
     def send_response(self, bot, chat, message=None):
         for response in self.order_by('priority').all():
             response.send_response(bot, chat, message)
+
+
+class UpdateQuerySet(models.QuerySet):
+    def for_processing(self):
+        """Load updates with everything required to handle them at once
+
+        Bot with its quest, message or callback query with the chat and the
+        sender with current session are joined, photos presence is
+        annotated as ``message_photos`` and ``callback_photos``
+
+        """
+        from apps.web.models.message import Photo
+
+        return self.select_related(
+            'bot__quest',
+            'message__chat',
+            'message__from_user__current_session',
+            'callback_query__from_user__current_session',
+            'callback_query__message__chat',
+        ).annotate(
+            message_photos=Exists(
+                Photo.objects.filter(message=OuterRef('message_id'))
+            ),
+            callback_photos=Exists(
+                Photo.objects.filter(
+                    message=OuterRef('callback_query__message_id')
+                )
+            ),
+        )
+
+
+class DeliveryQuerySet(models.QuerySet):
+    def sent_keys(self, keys) -> set:
+        """Return keys of already sent chunks"""
+        from apps.web.models.delivery import SENT
+
+        return set(self.filter(key__in=keys, status=SENT).values_list(
+            'key',
+            flat=True,
+        ))
+
+    def expired(self):
+        """Sent chunks older than ``DELIVERY_RETENTION`` days, their keys
+        don't protect from duplicates anymore"""
+        from apps.web.models.delivery import SENT
+
+        return self.filter(
+            status=SENT,
+            sent_at__lt=timezone.now() - timedelta(
+                days=settings.DELIVERY_RETENTION),
+        )
+
+    def purge(self, batch_size=1000) -> int:
+        """Delete expired chunks by batches, return number of them"""
+        count = 0
+
+        while True:
+            ids = list(self.expired().values_list('id', flat=True)[
+                :batch_size])
+            if not ids:
+                return count
+
+            self.filter(id__in=ids).delete()
+            count += len(ids)
+
+
+class DeadLetterQuerySet(models.QuerySet):
+    def replay(self) -> int:
+        """Send chunks again with their keys, return number of them"""
+        from apps.web.delivery import deliver
+        from apps.web.models.delivery import PENDING, Delivery
+
+        letters = list(self.select_related('delivery'))
+        deliveries = [i.delivery for i in letters]
+
+        # messages are queued only if their dead letters are gone
+        with transaction.atomic():
+            Delivery.objects.filter(id__in=[i.id for i in deliveries]).update(
+                status=PENDING,
+                failures=0,
+            )
+            self.model.objects.filter(id__in=[i.id for i in letters]).delete()
+
+            for delivery in deliveries:
+                transaction.on_commit(partial(
+                    deliver,
+                    delivery.bot_id,
+                    chat_id=delivery.chat_id,
+                    text=[delivery.text],
+                    keys=[delivery.key],
+                    **json.loads(delivery.options)
+                ))
+
+        return len(deliveries)
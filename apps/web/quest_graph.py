@@ -0,0 +1,108 @@
+"""Compiled, read-only representation of quests
+
+Quest definition (steps, handlers, conditions and responses) is loaded
+once per worker and kept in memory. Every change of the definition
+increases ``Quest.version``, the graph is rebuilt as soon as a worker sees
+the quest with another version.
+
+"""
+import logging
+from types import MappingProxyType
+
+from django.db.models import Prefetch
+
+from apps.web.matchers import StepMatcher
+from apps.web.models import Handler, Quest, Response, Step
+
+logger = logging.getLogger(__name__)
+
+_graphs = {}
+
+
+class CompiledHandler(object):
+    __slots__ = ('handler', 'conditions', 'responses')
+
+    def __init__(self, handler: Handler):
+        self.handler = handler
+        self.conditions = tuple(handler.conditions.all())
+        responses = handler.responses.all()
+        self.responses = MappingProxyType({
+            True: tuple(i for i in responses if i.on_true),
+            False: tuple(i for i in responses if not i.on_true),
+        })
+
+
+class CompiledStep(object):
+    __slots__ = ('step', 'handlers', 'matcher')
+
+    def __init__(self, step: Step, handlers):
+        self.step = step
+        self.matcher = StepMatcher(
+            i for handler in handlers for i in handler.conditions
+        )
+
+        indexed = {}
+        for handler in handlers:
+            indexed.setdefault(handler.handler.enabled_on, []).append(handler)
+
+        self.handlers = MappingProxyType({
+            key: tuple(value) for key, value in indexed.items()
+        })
+
+    def get_handlers(self, action_type):
+        return self.handlers.get(action_type, ())
+
+
+class CompiledQuest(object):
+    __slots__ = ('quest_id', 'version', 'steps', 'initial_step_id')
+
+    def __init__(self, quest: Quest):
+        self.quest_id = quest.id
+        self.version = quest.version
+
+        handlers = Handler.objects.filter(step__quest=quest).prefetch_related(
+            'conditions',
+            'redirects',
+            Prefetch(
+                'responses',
+                queryset=Response.objects.order_by('priority', 'id'),
+            ),
+        )
+
+        by_step = {}
+        for handler in handlers:
+            by_step.setdefault(handler.step_id, []).append(
+                CompiledHandler(handler)
+            )
+
+        steps = {}
+        self.initial_step_id = None
+        for step in quest.steps.all():
+            steps[step.id] = CompiledStep(step, by_step.get(step.id, ()))
+            # the first one in the order, as ``steps.initial()`` returns
+            if step.is_initial and self.initial_step_id is None:
+                self.initial_step_id = step.id
+
+        self.steps = MappingProxyType(steps)
+
+    def get_step(self, step_id) -> CompiledStep:
+        return self.steps.get(step_id)
+
+
+def get_quest_graph(quest: Quest) -> CompiledQuest:
+    """Return compiled graph of the quest, rebuild it if it's outdated"""
+    graph = _graphs.get(quest.id)
+
+    if graph is None or graph.version != quest.version:
+        graph = CompiledQuest(quest)
+        _graphs[quest.id] = graph
+        logger.debug('Quest {} graph compiled, version {}'.format(
+            quest.id, quest.version))
+
+    return graph
+
+
+def get_step_graph(step_id) -> CompiledStep:
+    """Return compiled step of any quest, i.e. if user moved between quests"""
+    quest = Quest.objects.get(steps=step_id)
+    return get_quest_graph(quest).get_step(step_id)
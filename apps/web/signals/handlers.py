@@ -2,13 +2,30 @@ import logging
 
 from django.conf import settings
 from django.contrib.sites.models import Site
-from django.db.models.signals import pre_save
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_save,
+)
 from django.dispatch import receiver
 from django.urls import reverse
 
 from constance import config
 from constance.signals import config_updated
 
+from apps.web.bots import forget_bots
+from apps.web.ingest import forget_chat, forget_user
+from apps.web.models import (
+    AppUser,
+    Chat,
+    Condition,
+    Handler,
+    Quest,
+    Response,
+    Step,
+)
 from apps.web.models.bot import Bot
 
 from .signals import update_webhook_signal
@@ -16,6 +33,19 @@ from .signals import update_webhook_signal
 logger = logging.getLogger(__name__)
 
 
+@receiver(connection_created)
+def sqlite_profile_handler(sender, connection, **kwargs):
+    """Apply PRAGMAs of ``SQLITE_PROFILE`` to the new SQLite connection"""
+    if connection.vendor != 'sqlite':
+        return
+
+    pragmas = settings.SQLITE_PROFILES.get(settings.SQLITE_PROFILE, {})
+
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+
 @receiver(pre_save, sender=Site)
 @receiver(config_updated)
 def dispatcher(sender, *args, **kwargs):
@@ -67,3 +97,93 @@ def setup_hooks(sender, instance, *args, **kwargs):
     logging.debug('Set up webhook for Telegram Bot - {}'.format(url))
 
     # logging.error('Error on webhook setup for Telegram Bot'.format(url))
+
+
+def get_owner_field(instance):
+    """Return field referencing the parent of the quest definition"""
+    return 'quest_id' if isinstance(instance, Step) else (
+        'step_id' if isinstance(instance, Handler) else 'handler_id')
+
+
+def get_owner_quests(instance, owners):
+    """Return quests of the ``owners`` ids of the quest definition"""
+    owners = [i for i in owners if i is not None]
+
+    if isinstance(instance, Step):
+        return Quest.objects.filter(id__in=owners)
+    if isinstance(instance, Handler):
+        return Quest.objects.filter(steps__in=owners)
+    return Quest.objects.filter(steps__handlers__in=owners)
+
+
+@receiver(pre_save, sender=Step)
+@receiver(pre_save, sender=Handler)
+@receiver(pre_save, sender=Condition)
+@receiver(pre_save, sender=Response)
+def quest_definition_owner_handler(sender, instance, *args, **kwargs):
+    """Remember the parent of the saved definition, it may be moved to
+    another quest"""
+    instance._previous_owner = None
+
+    if instance.pk is not None:
+        instance._previous_owner = sender.objects.filter(
+            pk=instance.pk,
+        ).values_list(get_owner_field(instance), flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Step)
+@receiver([post_save, post_delete], sender=Handler)
+@receiver([post_save, post_delete], sender=Condition)
+@receiver([post_save, post_delete], sender=Response)
+def quest_definition_handler(sender, instance, *args, **kwargs):
+    """Increase quest version, so workers rebuild compiled quest graph
+
+    Previous quest of the moved definition is increased too, its graph
+    still has the definition
+
+    """
+    owners = {
+        getattr(instance, get_owner_field(instance)),
+        getattr(instance, '_previous_owner', None),
+    }
+
+    get_owner_quests(instance, owners).increase_version()
+
+
+@receiver(m2m_changed, sender=Handler.redirects.through)
+def handler_redirects_handler(sender, instance, action, reverse, pk_set,
+                              *args, **kwargs):
+    """Increase quest version on handler redirects changing"""
+
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        handlers = [instance.id]
+    elif action == 'pre_clear':
+        handlers = Handler.objects.filter(redirects=instance)
+    else:
+        handlers = pk_set
+
+    Quest.objects.filter(steps__handlers__in=handlers).increase_version()
+
+
+@receiver(post_save, sender=AppUser)
+@receiver(post_delete, sender=AppUser)
+def user_identity_handler(sender, instance, **kwargs):
+    """Changed users are read again by ingest"""
+    forget_user(instance)
+
+
+@receiver(post_save, sender=Chat)
+@receiver(post_delete, sender=Chat)
+def chat_identity_handler(sender, instance, **kwargs):
+    """Changed chats are read again by ingest"""
+    forget_chat(instance)
+
+
+@receiver(post_save, sender=Bot)
+@receiver(post_delete, sender=Bot)
+def bot_registry_handler(sender, instance, **kwargs):
+    """Changed bots are loaded again by the registry"""
+    forget_bots()
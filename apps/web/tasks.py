@@ -1,20 +1,35 @@
 from __future__ import absolute_import, unicode_literals
 
+import logging
+
+from django.db import transaction
+
 from celery import shared_task
 
+from apps.web import outbound
+from apps.web.bots import get_bot
 from apps.web.models.bot import Bot
+from apps.web.models.delivery import Delivery
+from apps.web.models.quest import Quest
 from apps.web.models.update import Update
 from apps.web.models.user import AppUser
 from apps.web.models.session import Session
 
+logger = logging.getLogger(__name__)
+
 
 @shared_task
 def handle_message_task(update_id: int):
-    update = Update.objects.get(id=update_id)
-    bot: Bot = update.bot
-    user: AppUser = update.get_sender
-    chat = update.get_message.chat
-    message = update.get_message
+    # imported here since compiled graph depends on models importing this
+    from apps.web.context import UpdateContext
+    from apps.web.quest_graph import get_quest_graph, get_step_graph
+
+    update = Update.objects.for_processing().get(id=update_id)
+    context = UpdateContext(update)
+    bot: Bot = context.bot
+    user: AppUser = context.sender
+    chat = context.chat
+    message = context.message
 
     if not user.current_session:
         user.current_session, _ = Session.objects.get_or_create(
@@ -23,35 +38,161 @@ def handle_message_task(update_id: int):
         )
         user.save()
 
+    try:
+        graph = get_quest_graph(bot.quest)
+    except Quest.DoesNotExist:
+        graph = None
+
     session = user.current_session
-    if not session.step:
-        bot.quest.initialize_user(user)
-    step = session.step
-    handlers = step.handlers.filter(enabled_on=update.action_type)
+    if not session.step_id:
+        if graph is None or graph.initial_step_id is None:
+            logger.warning(
+                'Update {} is not handled, bot {} has no quest or its quest '
+                'has no initial step'.format(update_id, bot.id)
+            )
+            return
 
-    for handler in handlers:
-        is_true = handler.check_handler_conditions(update)
-        responses = handler.responses.filter(on_true=is_true)
+        session.step_id = graph.initial_step_id
+        context.mark_changed(session, 'step')
+
+    step = graph.get_step(session.step_id) if graph is not None else None
+    if step is None:
+        # user moved to the step of another quest
+        step = get_step_graph(session.step_id)
+
+    for compiled in step.get_handlers(context.action_type):
+        handler = compiled.handler
+        is_true = handler.check_handler_conditions(
+            context,
+            matcher=step.matcher,
+        )
 
         if is_true:
-            next_step = handler.step_on_success
+            next_step = handler.step_on_success_id
+
+            if handler.context_operations:
+                context.chat_context.update(handler.context_operations)
 
             # send received message to specified users
-            handler.redirect_message(bot, chat, message)
+            handler.redirect_message(bot, chat, message, context=context)
         else:
-            next_step = handler.step_on_error
+            next_step = handler.step_on_error_id
 
         if next_step:
-            session.step = next_step
-            session.save()
+            session.step_id = next_step
+            context.mark_changed(session, 'step')
+
+        for response in compiled.responses[is_true]:
+            response.send_response(bot, chat, message, context=context)
+
+    writes = context.flush()
+    logger.debug('Update {} handled, {} rows written, {} messages'.format(
+        update_id, writes, len(context.outbox)))
+
+    # messages of the update are queued at once, after it's committed
+    transaction.on_commit(context.outbox.send)
+
+
+@shared_task(acks_late=True)
+def process_update_task(hook_id, data):
+    """Ingest raw update queued by the webhook and handle it
+
+    Task is acknowledged after execution, so the update is not lost if the
+    worker goes down in the middle of processing. Update is saved and
+    handled in a single transaction
+
+    """
+    # imported here since ingest depends on models importing this module
+    from apps.web.ingest import ingest_update
+
+    with transaction.atomic():
+        update, created = ingest_update(hook_id, data)
 
-        responses.send_response(bot, chat, message)
+        if update is None:
+            logger.error('Queued update has invalid format: {}'.format(data))
+            return
+
+        if not created:
+            logger.info('Update {} is already handled'.format(update.id))
+            return
+
+        handle_message_task(update.id)
 
 
 @shared_task
 def send_message_task(bot_id, *args, **kwargs):
-    """Proxy method wrapped by celery tasks"""
+    """Proxy method wrapped by celery tasks, messages are queued by
+    ``send_messages_task`` now, it sends the ones queued before
+
+    Messages which can't be sent soon because of Telegram limits are sent
+    by the task scheduled at their reserved time, the ones failed because
+    of network are sent again after backoff
+
+    """
+
+    bot = get_bot(bot_id)
+    if bot is None:
+        logger.error('Message of unknown bot {} is not sent'.format(bot_id))
+        return
 
-    bot = Bot.objects.get(id=bot_id)
-    print(bot_id, args, kwargs)
-    bot.send_message(*args, **kwargs)
+    logger.debug('Sending message of bot {}: {} {}'.format(
+        bot_id, args, kwargs))
+    try:
+        bot.send_message(*args, **kwargs)
+    except outbound.Postponed as postponed:
+        outbound.count(bot_id, postponed=1)
+        # sent messages are skipped by their keys
+        send_message_task.apply_async(
+            (bot_id,) + args,
+            dict(kwargs, keys=postponed.keys, reserved=postponed.reserved),
+            countdown=postponed.delay,
+        )
+
+
+@shared_task
+def send_messages_task(bot_id, chat_id, messages, queued=None,
+                       reserved=False):
+    """Send the batch of messages to the chat one after another
+
+    Messages are built by ``apps.web.delivery.build_message``. The rest
+    of the batch is sent by the task scheduled at the reserved time of its
+    first message, if it can't be sent soon, so the order is kept
+
+    """
+
+    bot = get_bot(bot_id)
+    if bot is None:
+        logger.error('Message of unknown bot {} is not sent'.format(bot_id))
+        return
+
+    for index, message in enumerate(messages):
+        options = dict(message)
+        try:
+            bot.send_message(
+                chat_id,
+                options.pop('texts'),
+                keys=options.pop('keys'),
+                reserved=reserved,
+                queued=queued,
+                **options
+            )
+        except outbound.Postponed as postponed:
+            outbound.count(bot_id, postponed=1)
+            # sent messages are skipped by their keys
+            send_messages_task.apply_async(
+                (bot_id, chat_id, messages[index:]),
+                dict(queued=queued, reserved=postponed.reserved),
+                countdown=postponed.delay,
+                queue=outbound.get_chat_queue(chat_id),
+            )
+            return
+
+        reserved = False
+
+
+@shared_task
+def purge_deliveries_task():
+    """Delete sent chunks older than the retention period, it's scheduled
+    by celery beat"""
+    count = Delivery.objects.purge()
+    logger.info('{} expired deliveries purged'.format(count))
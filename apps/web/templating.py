@@ -0,0 +1,172 @@
+"""Shared Jinja2 environment and cache of compiled response templates
+
+Compilation of a template is much more expensive than its rendering, so
+templates of a response are compiled once per process and kept until the
+response is changed. Workers compile templates of the enabled bots on
+start.
+
+Compiled code is also stored to ``JINJA2_BYTECODE_CACHE_DIR`` by the hash
+of the template source, so new workers load it instead of compiling. Run
+``precompile_templates`` command on deploy to fill the cache.
+
+"""
+import hashlib
+import logging
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from jinja2 import (
+    BaseLoader,
+    Environment,
+    FileSystemBytecodeCache,
+    TemplateError,
+    TemplateSyntaxError,
+    nodes,
+)
+
+from apps.web.utils import clear_redundant_tags
+
+logger = logging.getLogger(__name__)
+
+_environment = None
+
+CompiledTemplates = namedtuple('CompiledTemplates', ('text', 'keyboard'))
+
+
+class SourceLoader(BaseLoader):
+    """Load templates from strings through the bytecode cache
+
+    ``Environment.from_string`` never uses the bytecode cache, so the
+    template is named by the hash of its source and loaded like a file
+
+    """
+
+    def load_source(self, environment, source):
+        name = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        bcc = environment.bytecode_cache
+        code = None
+
+        if bcc is not None:
+            bucket = bcc.get_bucket(environment, name, None, source)
+            code = bucket.code
+
+        if code is None:
+            code = environment.compile(source, name)
+
+            if bcc is not None:
+                bucket.code = code
+                bcc.set_bucket(bucket)
+
+        return environment.template_class.from_code(
+            environment,
+            code,
+            environment.make_globals(None),
+        )
+
+
+def get_bytecode_cache():
+    directory = settings.JINJA2_BYTECODE_CACHE_DIR
+
+    if not directory:
+        return None
+
+    os.makedirs(directory, exist_ok=True)
+    return FileSystemBytecodeCache(directory)
+
+
+def get_environment() -> Environment:
+    """Return process-wide Jinja2 environment"""
+    global _environment
+
+    if _environment is None:
+        _environment = Environment(
+            extensions=settings.JINJA2_EXTENTIONS,
+            loader=SourceLoader(),
+            bytecode_cache=get_bytecode_cache(),
+        )
+
+    return _environment
+
+
+def is_static_template(source) -> bool:
+    """Check if the template consists only of plain text
+
+    Invalid template is considered dynamic, it fails on rendering
+
+    """
+    try:
+        tree = get_environment().parse(source)
+    except TemplateSyntaxError:
+        return False
+
+    return all(
+        isinstance(node, nodes.Output) and all(
+            isinstance(i, nodes.TemplateData) for i in node.nodes
+        )
+        for node in tree.body
+    )
+
+
+def compile_template(source):
+    """Compile template from the string, use bytecode cache if possible"""
+    env = get_environment()
+    return env.loader.load_source(env, source)
+
+
+@lru_cache(maxsize=settings.RESPONSE_TEMPLATES_CACHE_SIZE)
+def compile_response_templates(response_id, modified, text, keyboard):
+    """Compile text and keyboard templates of the response
+
+    ``response_id`` and ``modified`` identify response's version
+
+    """
+    return CompiledTemplates(
+        text=compile_template(clear_redundant_tags(text or '')),
+        keyboard=compile_template(keyboard or ''),
+    )
+
+
+def precompile_templates() -> int:
+    """Compile templates of all responses of the enabled bots
+
+    Response with invalid template is skipped, it fails on rendering.
+    Return number of compiled responses
+
+    """
+    # imported here since models depend on this module
+    from apps.web.models import Response
+
+    responses = Response.objects.filter(
+        handler__step__quest__bot__enabled=True,
+    ).only('id', 'modified', 'text', 'keyboard')
+
+    count = 0
+    for response in responses.iterator():
+        try:
+            compile_response_templates(
+                response.id,
+                response.modified,
+                response.text,
+                response.keyboard,
+            )
+        except TemplateError:
+            logger.exception('Templates of response {} are invalid'.format(
+                response.id))
+            continue
+        count += 1
+
+    return count
+
+
+def warm_up_templates():
+    """Precompile templates on worker start, failure doesn't stop it"""
+    try:
+        count = precompile_templates()
+    except DatabaseError:
+        logger.exception('Response templates are not compiled')
+    else:
+        logger.info('{} response templates compiled'.format(count))
@@ -0,0 +1,80 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.web.context import UpdateContext
+from apps.web.ingest import ingest_update
+from apps.web.models import Chat, Condition, Handler, Session, Step, Update
+from apps.web.models.condition import CALLBACK_DATA
+from apps.web.models.constants import HookActions
+from apps.web.tasks import handle_message_task
+from apps.web.tests.utils import (
+    CHAT_ID,
+    callback_update,
+    create_quest,
+    message_update,
+)
+
+
+class UpdateContextTestCase(TestCase):
+    def setUp(self):
+        self.bot = create_quest()
+
+    def handle(self, data) -> Update:
+        update, _ = ingest_update(self.bot.hook_id, data)
+        handle_message_task(update.id)
+        return update
+
+    def get_context(self, data) -> UpdateContext:
+        update, _ = ingest_update(self.bot.hook_id, data)
+        return UpdateContext(Update.objects.for_processing().get(
+            id=update.id))
+
+    def test_flush(self):
+        self.handle(message_update(1, 'Hi'))
+        context = self.get_context(message_update(2, 'Hi'))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(context.flush(), 0)
+
+        session = context.sender.current_session
+        session.step = Step.objects.get(number=2)
+        context.mark_changed(session, 'step')
+        context.mark_changed(context.chat, 'current_keyboard')
+        context.chat_context.set('level', 'two')
+
+        # changes of the chat and its context are a single row
+        self.assertEqual(context.flush(), 2)
+        self.assertEqual(context.flush(), 2)
+
+        self.assertEqual(Session.objects.get().step.number, 2)
+        self.assertIn('level', Chat.objects.get(id=CHAT_ID).template_context)
+
+    def test_no_changes(self):
+        # handler without next step, context operations and responses
+        handler = Handler.objects.create(
+            step=Step.objects.get(number=1),
+            title='Nothing',
+            enabled_on=HookActions.CALLBACK,
+        )
+        Condition.objects.create(
+            handler=handler, value='nothing', rule='full_coincidence',
+            matched_field=CALLBACK_DATA)
+        self.handle(message_update(1, 'Hi'))
+
+        update, _ = ingest_update(
+            self.bot.hook_id, callback_update(2, 'nothing'))
+        with CaptureQueriesContext(connection) as queries, mock.patch.object(
+                Handler, 'redirect_message') as redirect_message:
+            handle_message_task(update.id)
+
+        # the handler is matched
+        redirect_message.assert_called_once()
+
+        writes = [
+            i['sql'] for i in queries.captured_queries
+            if not i['sql'].startswith('SELECT')
+        ]
+        self.assertEqual(writes, [])
@@ -0,0 +1,78 @@
+import builtins
+import itertools
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from apps.web.custom_eval import CompiledExpression, ParseException, eval
+from apps.web.management.commands.bench_custom_eval import RULES, VARIABLES
+from apps.web.models import Condition, Handler
+from apps.web.models.handler import (
+    ConditionsLookup,
+    compile_handler_expression,
+)
+
+
+class CompiledExpressionTestCase(SimpleTestCase):
+    def test_rules(self):
+        for rule in RULES:
+            with self.subTest(rule=rule):
+                expected = builtins.eval(rule, {}, VARIABLES)
+                result = CompiledExpression(rule).eval(VARIABLES)
+                self.assertEqual(result, expected)
+                self.assertIs(type(result), type(expected))
+
+    def test_precedence(self):
+        self.assertEqual(eval('-2 * 3 + 4 // 3 - 7 % 4'), -8)
+        self.assertEqual(eval('2 * (3 + 4)'), 14)
+        self.assertIs(eval('1 + 1 == 2 != 3'), True)
+        self.assertIs(eval('1 <> 1'), False)
+
+    def test_compiled_once(self):
+        expression = CompiledExpression('A * 2 > B')
+        self.assertIs(expression.eval({'A': 1, 'B': 1}), True)
+        self.assertIs(expression.eval({'A': 0, 'B': 1}), False)
+
+    def test_short_circuit(self):
+        # departure from the pyparsing evaluator, which raised
+        # ZeroDivisionError: the right operand of multiplication isn't
+        # evaluated if the left one is integer zero
+        self.assertEqual(eval('0*(1/0)'), 0)
+        self.assertIs(eval('1 > 2 > A'), False)
+
+        with self.assertRaises(ZeroDivisionError):
+            eval('0.0*(1/0)')
+
+    def test_errors(self):
+        for expression in ('', 'A +', '(A', 'A)', '2 ** 3', 'A; B', '1 2'):
+            with self.subTest(expression=expression):
+                with self.assertRaises(ParseException):
+                    CompiledExpression(expression)
+
+        with self.assertRaises(ValueError):
+            eval('A + 1')
+
+
+class HandlerExpressionTestCase(SimpleTestCase):
+    def test_compiled_as_formatted(self):
+        conditions = [Condition(id=i) for i in (11, 12, 13)]
+        expressions = (None, '', '{}{}{}', '{11}{13}', '{} + {} > 1',
+                       '{11} * ({12} + {13}) == 1', '-{} < {}')
+
+        for expression, results in itertools.product(
+                expressions, itertools.product((0, 1), repeat=3)):
+            handler = Handler(id=1, ids_expression=expression)
+            context = SimpleNamespace(results={
+                i.id: result for i, result in zip(conditions, results)
+            })
+
+            with self.subTest(expression=expression, results=results):
+                compiled, specify_ids = compile_handler_expression(
+                    handler.id, None, expression, len(conditions))
+                lookup = ConditionsLookup(context, conditions, specify_ids)
+
+                self.assertEqual(
+                    bool(compiled.eval(lookup)),
+                    handler.eval_formatted_expression(
+                        context, conditions, True),
+                )
@@ -0,0 +1,152 @@
+import asyncio
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from apps.web.delivery import (
+    DeliveryService,
+    HTTPConnectionPool,
+    MemoryJobQueue,
+    build_message,
+)
+from apps.web.management.commands.bench_delivery import FakeTelegramServer
+from apps.web.models import DeadLetter, Delivery
+from apps.web.models.delivery import DEAD, PENDING, SENT
+from apps.web.tests.utils import CHAT_ID, create_quest
+
+
+class DeliveryServiceTestCase(TransactionTestCase):
+    def setUp(self):
+        self.bot = create_quest()
+        self.server = FakeTelegramServer(latency=0)
+        self.addCleanup(self.server.close)
+
+    def run_service(self, *jobs):
+        job_queue = MemoryJobQueue()
+        for job in jobs:
+            job_queue.push(job)
+
+        service = DeliveryService(
+            job_queue=job_queue,
+            api_url=self.server.url,
+        )
+
+        async def stop_when_done():
+            while job_queue.ready.qsize() or service.chats:
+                await asyncio.sleep(0.01)
+            service.stop()
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.addCleanup(loop.close)
+        loop.run_until_complete(asyncio.gather(
+            service.run(),
+            stop_when_done(),
+        ))
+        return service
+
+    def get_job(self, *messages):
+        return dict(
+            bot_id=self.bot.hook_id,
+            chat_id=CHAT_ID,
+            messages=list(messages),
+            queued=0,
+        )
+
+    def test_batch(self):
+        job = self.get_job(
+            build_message('First__Second', key='1:1'),
+            build_message('Third', key='1:2'),
+        )
+
+        service = self.run_service(job)
+        self.assertEqual(service.sent, 3)
+        self.assertEqual(
+            Delivery.objects.sent_keys(['1:1:0', '1:1:1', '1:2:0']),
+            {'1:1:0', '1:1:1', '1:2:0'},
+        )
+
+        # redelivered job is skipped by its keys
+        service = self.run_service(job)
+        self.assertEqual(service.sent, 0)
+        self.assertEqual(Delivery.objects.count(), 3)
+
+    @mock.patch.object(DeliveryService, 'prepare', side_effect=DatabaseError)
+    def test_retry(self, prepare):
+        job = self.get_job(build_message('Hi', key='1:1'))
+        started = time.time()
+        job_queue = self.run_service(job).queue
+
+        # failed job is scheduled after backoff
+        self.assertEqual(len(job_queue.scheduled), 1)
+        eta, retried = job_queue.scheduled[0]
+        self.assertGreater(eta, started)
+        self.assertEqual(retried, dict(job, attempts=1))
+
+    @mock.patch.object(HTTPConnectionPool, 'post', side_effect=ValueError)
+    def test_dead_letters(self, post):
+        job = dict(
+            self.get_job(build_message('First__Second', key='1:1')),
+            attempts=settings.DELIVERY_ATTEMPTS - 1,
+        )
+        service = self.run_service(job)
+
+        self.assertEqual(service.queue.scheduled, [])
+        self.assertEqual(
+            set(DeadLetter.objects.values_list('delivery__key', flat=True)),
+            {'1:1:0', '1:1:1'},
+        )
+
+
+class DeliveryRetentionTestCase(TransactionTestCase):
+    def setUp(self):
+        self.bot = create_quest()
+
+    def record(self, key, days_ago, status=SENT):
+        Delivery.objects.create(
+            key=key,
+            bot=self.bot,
+            chat_id=CHAT_ID,
+            text='Hi',
+            status=status,
+            sent_at=timezone.now() - timedelta(days=days_ago),
+        )
+
+    def test_purge(self):
+        self.record('old', days_ago=settings.DELIVERY_RETENTION + 1)
+        self.record('new', days_ago=settings.DELIVERY_RETENTION - 1)
+        self.record('dead', days_ago=settings.DELIVERY_RETENTION + 1,
+                    status=DEAD)
+
+        self.assertEqual(Delivery.objects.purge(batch_size=1), 1)
+        self.assertEqual(
+            set(Delivery.objects.values_list('key', flat=True)),
+            {'new', 'dead'},
+        )
+
+    @mock.patch('apps.web.delivery.deliver')
+    def test_replay(self, deliver):
+        self.record('dead', days_ago=0, status=DEAD)
+        DeadLetter.objects.create(
+            delivery=Delivery.objects.get(key='dead'),
+            error='Bad request',
+        )
+
+        with transaction.atomic():
+            self.assertEqual(DeadLetter.objects.replay(), 1)
+            # message is queued only after the commit
+            deliver.assert_not_called()
+
+        deliver.assert_called_once_with(
+            self.bot.id,
+            chat_id=CHAT_ID,
+            text=['Hi'],
+            keys=['dead'],
+        )
+        self.assertFalse(DeadLetter.objects.exists())
+        self.assertEqual(Delivery.objects.get(key='dead').status, PENDING)
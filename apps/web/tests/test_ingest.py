@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase
+
+from constance import config
+
+from apps.web.api.payloads import UserRecord
+from apps.web.ingest import deserialize_update, get_user_id, save_update
+from apps.web.models import AppUser
+from apps.web.tests.utils import create_quest, message_update
+from apps.web.upsert import supports_returning
+
+
+class GetUserIdTestCase(TestCase):
+    def test_upsert(self):
+        record = UserRecord(username='ann', first_name='Ann')
+        # id is returned by the upsert itself if it's supported
+        with self.assertNumQueries(1 if supports_returning() else 2):
+            user_id = get_user_id(record)
+
+        user = AppUser.objects.get(username='ann')
+        self.assertEqual(user.id, user_id)
+        self.assertEqual(
+            user.password,
+            getattr(config, settings.TELEGRAM_DEFAULT_PASS),
+        )
+
+        record = UserRecord(username='ann', first_name='Anna')
+        self.assertEqual(get_user_id(record), user_id)
+        self.assertEqual(AppUser.objects.get(id=user_id).first_name, 'Anna')
+
+    def test_existing_password(self):
+        AppUser.objects.create_user(username='admin', password='secret')
+
+        get_user_id(UserRecord(username='admin', first_name='Admin'))
+
+        user = AppUser.objects.get(username='admin')
+        self.assertEqual(user.first_name, 'Admin')
+        self.assertTrue(user.check_password('secret'))
+
+    @mock.patch('apps.web.upsert.supports_on_conflict', return_value=False)
+    def test_update_or_create(self, supports_on_conflict):
+        AppUser.objects.create_user(username='admin', password='secret')
+
+        get_user_id(UserRecord(username='admin', first_name='Admin'))
+        get_user_id(UserRecord(username='ann', first_name='Ann'))
+
+        self.assertTrue(
+            AppUser.objects.get(username='admin').check_password('secret'))
+        self.assertEqual(
+            AppUser.objects.get(username='ann').password,
+            getattr(config, settings.TELEGRAM_DEFAULT_PASS),
+        )
+
+
+class SaveUpdateTestCase(TestCase):
+    def test_repeated_update(self):
+        bot = create_quest()
+        record = deserialize_update(bot.hook_id, message_update(1, 'Hello'))
+
+        update, created = save_update(record)
+        self.assertTrue(created)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(save_update(record), (update, False))
@@ -0,0 +1,123 @@
+import itertools
+import random
+import re
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from apps.web.context import normalize_text
+from apps.web.matchers import INDEXED_RULES, RegexAlternation, StepMatcher
+from apps.web.models import Condition
+from apps.web.models.condition import (
+    ANY_MESSAGE,
+    CALLBACK_DATA,
+    CONTAINS,
+    ENDS_WITH,
+    FULL_COINCIDENCE,
+    MATCH_REGEX,
+    QR_CODE,
+    STARTS_WITH,
+    TO_BE_IN,
+)
+
+VALUES = {
+    FULL_COINCIDENCE: ('ab', 'Abc', ''),
+    QR_CODE: ('ba',),
+    STARTS_WITH: ('a', 'ab', 'AB', 'abcab', ''),
+    ENDS_WITH: ('b', 'cab', 'aB', ''),
+    # the value isn't lowercased, so 'Bc' never matches
+    CONTAINS: ('b', 'bc', 'Bc', 'abca', 'cc', ''),
+    MATCH_REGEX: (
+        'a+b', 'b|c', '.*c$', '[ab]{2}', 'x?', 'A',
+        # patterns which are matched separately
+        r'(a)\1', r'(?i)A.*', r'(?s)a.c',
+        # invalid patterns never match, named groups are invalid too since
+        # the value is lowercased
+        '(a', r'(?P<first>a)b',
+    ),
+    TO_BE_IN: ('a,b',),
+}
+
+TEXTS = ('', 'a', 'ab', 'abc', 'abcab', 'aab', 'ba', 'bcb', 'Abc ',
+         'cab', 'acc', 'a\nc')
+
+
+class StepMatcherTestCase(SimpleTestCase):
+    def setUp(self):
+        ids = itertools.count(1)
+        self.conditions = [
+            Condition(id=next(ids), rule=rule, value=value,
+                      matched_field=field)
+            for rule, values in VALUES.items()
+            for value in values
+            for field in (ANY_MESSAGE, CALLBACK_DATA)
+        ]
+        with self.assertLogs('apps.web.matchers', 'ERROR'):
+            self.matcher = StepMatcher(self.conditions)
+
+    def get_context(self, text, data):
+        texts = {
+            ANY_MESSAGE: normalize_text(text),
+            CALLBACK_DATA: normalize_text(data),
+        }
+        return SimpleNamespace(results={}, get_text=texts.get)
+
+    def assertMatchesRules(self, text, data):
+        context = self.get_context(text, data)
+        expected = self.get_context(text, data)
+
+        for condition in self.conditions:
+            if condition.rule not in INDEXED_RULES:
+                self.assertNotIn(condition, self.matcher)
+                continue
+
+            self.assertIn(condition, self.matcher)
+            if condition.id not in context.results:
+                self.matcher.check(condition, context)
+
+            self.assertEqual(
+                context.results[condition.id],
+                int(condition.is_match_to_rule(expected)),
+                (condition.rule, condition.value, text),
+            )
+
+    def test_texts(self):
+        for text, data in itertools.product(TEXTS, repeat=2):
+            with self.subTest(text=text, data=data):
+                self.assertMatchesRules(text, data)
+
+    def test_random_texts(self):
+        generator = random.Random(0)
+
+        for _ in range(500):
+            text, data = (
+                ''.join(generator.choice('abcAB \n') for _ in range(
+                    generator.randint(0, 8)))
+                for _ in range(2)
+            )
+            with self.subTest(text=text, data=data):
+                self.assertMatchesRules(text, data)
+
+
+class RegexAlternationTestCase(SimpleTestCase):
+    def test_search(self):
+        combined = ('a+b', 'b|c', '.*c$', '[ab]{2}', 'x?')
+        separate = (r'(a)\1', r'(?i)A.*', r'(?s)a.c', r'(?P<x>[ab])c(?P=x)',
+                    r'(?P<first>a)b')
+        patterns = [re.compile(i) for i in combined + separate]
+
+        alternation = RegexAlternation()
+        for index, pattern in enumerate(patterns):
+            alternation.add(pattern, index)
+
+        self.assertEqual(
+            [i.pattern for i, _ in alternation.separate],
+            [i.pattern for i in patterns[len(combined):]],
+        )
+
+        for text in TEXTS + ('aa', 'bcb', 'acb', 'a\nc', 'ABC'):
+            with self.subTest(text=text):
+                self.assertEqual(alternation.search(text), {
+                    index for index, pattern in enumerate(patterns)
+                    if pattern.match(text)
+                })
@@ -0,0 +1,61 @@
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from apps.web import outbound
+from apps.web.models import Bot
+from apps.web.tests.utils import CHAT_ID
+
+
+@override_settings(OUTBOUND_BOT_LIMIT=(10, 1, 1), OUTBOUND_MAX_WAIT=0.25)
+@mock.patch('apps.web.models.bot.time.sleep')
+class WaitForSendingTestCase(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(
+            outbound, '_scheduler', outbound.MemoryScheduler())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.bot = Bot(id=1)
+
+    def test_bot_delay(self, sleep):
+        # messages to different chats wait only for the bot
+        for chat_id in range(CHAT_ID, CHAT_ID + 3):
+            self.bot.wait_for_sending(chat_id)
+
+        with self.assertRaises(outbound.Postponed) as context:
+            self.bot.wait_for_sending(CHAT_ID + 3)
+
+        postponed = context.exception
+        self.assertEqual(postponed.reserved, outbound.RESERVED_BOT)
+        self.assertGreater(postponed.delay, settings.OUTBOUND_MAX_WAIT)
+        self.assertTrue(all(
+            i[0][0] <= settings.OUTBOUND_MAX_WAIT for i in sleep.call_args_list
+        ))
+
+        # postponed message keeps its time and is sent without waiting
+        sleep.reset_mock()
+        tats = dict(outbound.get_scheduler().tats)
+        self.bot.wait_for_sending(CHAT_ID + 3, reserved=postponed.reserved)
+        self.assertEqual(outbound.get_scheduler().tats, tats)
+        sleep.assert_not_called()
+
+    @override_settings(OUTBOUND_BOT_LIMIT=(1000, 1, 1))
+    def test_chat_delay(self, sleep):
+        for _ in range(3):
+            self.bot.wait_for_sending(CHAT_ID)
+
+        with self.assertRaises(outbound.Postponed) as context:
+            self.bot.wait_for_sending(CHAT_ID)
+
+        self.assertEqual(context.exception.reserved, outbound.RESERVED_CHAT)
+
+        # the bot time is reserved when the chat time comes
+        tats = dict(outbound.get_scheduler().tats)
+        self.bot.wait_for_sending(CHAT_ID, reserved=outbound.RESERVED_CHAT)
+
+        changed = {
+            key for key, tat in outbound.get_scheduler().tats.items()
+            if tats[key] != tat
+        }
+        self.assertEqual(changed, {outbound.get_bot_bucket(self.bot.id)[0]})
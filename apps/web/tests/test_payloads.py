@@ -0,0 +1,132 @@
+import copy
+from unittest import mock
+
+from django.test import TestCase
+
+from apps.web.api.payloads import (
+    PayloadError,
+    from_validated_data,
+    parse_update,
+)
+from apps.web.api.serializers import UpdateModelSerializer
+from apps.web.ingest import deserialize_update
+from apps.web.management.commands.bench_payloads import photo_update
+from apps.web.tests.utils import (
+    CHAT_ID,
+    callback_update,
+    create_quest,
+    message_update,
+)
+
+
+def group_update(update_id):
+    payload = message_update(update_id, '  Hello  ')
+    payload['message']['chat'] = {
+        'id': -CHAT_ID, 'type': 'group', 'title': 'Group'}
+    del payload['message']['from']['language_code']
+    payload['message']['from']['last_name'] = 'Doe'
+    return payload
+
+
+def without_text(update_id):
+    payload = message_update(update_id, None)
+    del payload['message']['text']
+    return payload
+
+
+def string_ids(update_id):
+    payload = message_update(update_id, 'Hello')
+    payload['update_id'] = str(update_id)
+    payload['message']['message_id'] = str(update_id)
+    payload['message']['chat']['id'] = str(CHAT_ID)
+    return payload
+
+
+def number_text(update_id):
+    return message_update(update_id, 5)
+
+
+def channel_post(update_id):
+    payload = message_update(update_id, 'News')
+    payload['channel_post'] = payload.pop('message')
+    del payload['channel_post']['from']
+    payload['channel_post']['chat']['type'] = 'channel'
+    return payload
+
+
+def without_sender(update_id):
+    payload = message_update(update_id, 'Hello')
+    del payload['message']['from']
+    return payload
+
+
+def long_text(update_id):
+    return message_update(update_id, 'a' * 3000)
+
+
+def long_name(update_id):
+    payload = message_update(update_id, 'Hello')
+    payload['message']['from']['first_name'] = 'J' * 31
+    return payload
+
+
+class ParseUpdateTestCase(TestCase):
+    def setUp(self):
+        self.bot = create_quest()
+
+    def serialize(self, payload):
+        serializer = UpdateModelSerializer(
+            data=copy.deepcopy(payload),
+            context={'hook_id': self.bot.hook_id},
+        )
+        if serializer.is_valid():
+            return from_validated_data(serializer.validated_data)
+
+    def test_as_serializer(self):
+        payloads = (
+            message_update(1, 'Hello'),
+            callback_update(2, 'back'),
+            photo_update(3, CHAT_ID),
+            group_update(4),
+            without_text(5),
+        )
+
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                record = parse_update(payload)
+                record.bot = self.bot
+                self.assertEqual(record, self.serialize(payload))
+
+    @mock.patch(
+        'apps.web.ingest.UpdateModelSerializer',
+        wraps=UpdateModelSerializer,
+    )
+    def test_fallback(self, serializer):
+        payloads = (
+            # accepted by the serializer only
+            (string_ids(1), True),
+            (number_text(2), True),
+            # not supported by both
+            (channel_post(3), False),
+            (without_sender(4), False),
+            (long_text(5), False),
+            (long_name(6), False),
+        )
+
+        for payload, is_valid in payloads:
+            with self.subTest(payload=payload):
+                with self.assertRaises(PayloadError):
+                    parse_update(payload)
+
+                serializer.reset_mock()
+                record = deserialize_update(self.bot.hook_id, payload)
+                serializer.assert_called_once_with(
+                    data=payload,
+                    context={'hook_id': self.bot.hook_id},
+                )
+
+                if is_valid:
+                    self.assertIsNotNone(record)
+                    self.assertEqual(record, self.serialize(payload))
+                else:
+                    self.assertIsNone(record)
@@ -0,0 +1,46 @@
+from django.test import TestCase
+
+from apps.web.models import Condition, Handler, Quest, Response, Step
+from apps.web.tests.utils import create_quest
+
+
+class QuestVersionTestCase(TestCase):
+    def setUp(self):
+        self.quest = create_quest().quest
+        self.other = Quest.objects.create(title='Other', description='')
+        self.step = Step.objects.create(
+            quest=self.other, title='Other', number=1, is_initial=True)
+        self.handler = Handler.objects.create(
+            step=self.step, title='Other')
+
+    def assertIncreased(self, move):
+        versions = {
+            i.id: i.version for i in Quest.objects.all()
+        }
+        move()
+        for quest in Quest.objects.all():
+            self.assertGreater(quest.version, versions[quest.id])
+
+    def test_move_step(self):
+        step = Step.objects.get(quest=self.quest, number=2)
+        step.quest = self.other
+
+        self.assertIncreased(step.save)
+
+    def test_move_handler(self):
+        handler = Handler.objects.get(title='Hello')
+        handler.step = self.step
+
+        self.assertIncreased(handler.save)
+
+    def test_move_condition(self):
+        condition = Condition.objects.get(value='hello')
+        condition.handler = self.handler
+
+        self.assertIncreased(condition.save)
+
+    def test_move_response(self):
+        response = Response.objects.get(title='Hi')
+        response.handler = self.handler
+
+        self.assertIncreased(response.save)
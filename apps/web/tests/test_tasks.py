@@ -0,0 +1,36 @@
+from django.test import TestCase
+
+from apps.web.ingest import ingest_update
+from apps.web.models import Session
+from apps.web.tasks import handle_message_task
+from apps.web.tests.utils import callback_update, create_quest, message_update
+
+
+class HandleMessageTaskTestCase(TestCase):
+    def setUp(self):
+        self.bot = create_quest()
+
+    def ingest(self, data):
+        update, created = ingest_update(self.bot.hook_id, data)
+        self.assertTrue(created)
+        return update
+
+    def test_queries(self):
+        update = self.ingest(message_update(1, 'Hello'))
+        # the update with related rows, the session is created, the quest
+        # graph is compiled, the chat context is loaded and changes of the
+        # chat and the session are written
+        with self.assertNumQueries(14):
+            handle_message_task(update.id)
+
+        # the update, then the chat keyboard and the step are written
+        update = self.ingest(callback_update(2, 'back'))
+        with self.assertNumQueries(3):
+            handle_message_task(update.id)
+
+        # template variables are read again, the chat context has changed
+        update = self.ingest(message_update(3, 'Hello'))
+        with self.assertNumQueries(4):
+            handle_message_task(update.id)
+
+        self.assertEqual(Session.objects.get().step.number, 2)
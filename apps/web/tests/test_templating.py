@@ -0,0 +1,25 @@
+from django.test import TestCase
+
+from apps.web.models import Handler, Response
+from apps.web.templating import (
+    compile_response_templates,
+    precompile_templates,
+)
+from apps.web.tests.utils import create_quest
+
+
+class PrecompileTemplatesTestCase(TestCase):
+    def setUp(self):
+        create_quest()
+        compile_response_templates.cache_clear()
+
+    def test_invalid_template(self):
+        handler = Handler.objects.get(title='Hello')
+        invalid = Response.objects.create(
+            handler=handler, title='Invalid', text='Hi', keyboard='{% if %}')
+        valid = Response.objects.count() - 1
+
+        with self.assertLogs('apps.web.templating', 'ERROR') as logs:
+            self.assertEqual(precompile_templates(), valid)
+
+        self.assertIn('response {}'.format(invalid.id), logs.output[0])
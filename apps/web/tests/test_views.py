@@ -0,0 +1,62 @@
+import json
+from unittest import mock
+
+from django.test import TestCase
+
+from apps.web.dedup import forget, get_rejected
+from apps.web.tests.utils import create_quest, message_update
+
+
+class ProcessWebHookAPIViewTestCase(TestCase):
+    def setUp(self):
+        self.bot = create_quest()
+        self.url = '/api/v1/webhook/{}/'.format(self.bot.hook_id)
+
+    def post(self, data):
+        return self.client.post(
+            self.url,
+            json.dumps(data),
+            content_type='application/json',
+        )
+
+    def test_update(self):
+        response = self.post(message_update(1, 'Hello'))
+        self.assertEqual(response.status_code, 201)
+
+        # update redelivered by Telegram
+        response = self.post(message_update(1, 'Hello'))
+        self.assertEqual(response.status_code, 200)
+
+    @mock.patch('apps.web.api.views.handle_message_task')
+    def test_redelivered_update(self, handle_message_task):
+        rejected = get_rejected()
+
+        response = self.post(message_update(1, 'Hello'))
+        self.assertEqual(response.status_code, 201)
+        response = self.post(message_update(1, 'Hello'))
+        self.assertEqual(response.status_code, 200)
+
+        # the stored update is found if the seen-set has lost it
+        forget(self.bot.hook_id, 1)
+        response = self.post(message_update(1, 'Hello'))
+        self.assertEqual(response.status_code, 200)
+
+        handle_message_task.assert_called_once_with(mock.ANY)
+        self.assertEqual(get_rejected(), rejected + 2)
+
+    def test_invalid_update(self):
+        with self.assertLogs('apps.web.api.views', 'WARNING'):
+            response = self.post({'update_id': 1, 'message': {}})
+        self.assertEqual(response.status_code, 204)
+
+    def test_channel_post(self):
+        payload = message_update(1, 'News')
+        payload['channel_post'] = payload.pop('message')
+
+        with self.assertLogs('apps.web.api.views', 'WARNING'):
+            response = self.post(payload)
+        self.assertEqual(response.status_code, 204)
+
+    def test_not_object(self):
+        response = self.post([message_update(1, 'Hello')])
+        self.assertEqual(response.status_code, 400)
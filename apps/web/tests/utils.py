@@ -0,0 +1,107 @@
+"""Quest and raw updates shared by the tests"""
+from apps.web import quest_graph
+from apps.web.bots import forget_bots
+from apps.web.models import (
+    Bot,
+    Condition,
+    Handler,
+    Quest,
+    Response,
+    Step,
+)
+from apps.web.models.condition import CALLBACK_DATA
+from apps.web.models.constants import HookActions
+
+CHAT_ID = 42
+
+
+def create_quest() -> Bot:
+    """Create the bot with two steps quest: ``hello`` message moves user to
+    the second step, ``back`` callback returns to the first one"""
+    # saving of the bot sets its webhook, rows are inserted without it
+    Bot.objects.bulk_create([Bot(name='Test bot', token='123:abc')])
+    bot = Bot.objects.get(token='123:abc')
+    quest = Quest.objects.create(title='Quest', description='', bot=bot)
+    first = Step.objects.create(
+        quest=quest, title='First', number=1, is_initial=True)
+    second = Step.objects.create(
+        quest=quest, title='Second', number=2, is_initial=False)
+
+    handler = Handler.objects.create(
+        step=first,
+        title='Hello',
+        enabled_on=HookActions.MESSAGE,
+        step_on_success=second,
+        context_update='{"$inc": {"score": 10}}',
+    )
+    Condition.objects.create(
+        handler=handler, value='hello', rule='full_coincidence')
+    Response.objects.create(
+        handler=handler, title='Score', priority=2,
+        text='Score {{ score }}', keyboard='[["A", "B"]]')
+    Response.objects.create(
+        handler=handler, title='Hi', priority=1, text='Hi', keyboard='')
+    Response.objects.create(
+        handler=handler, title='Wrong', on_true=False, text='Wrong',
+        keyboard='')
+
+    handler = Handler.objects.create(
+        step=second,
+        title='Back',
+        enabled_on=HookActions.CALLBACK,
+        step_on_success=first,
+    )
+    Condition.objects.create(
+        handler=handler, value='back', rule='full_coincidence',
+        matched_field=CALLBACK_DATA)
+    Response.objects.create(
+        handler=handler, title='Back', text='Back to 1', keyboard='')
+
+    # process caches keyed by ids, which are reused by the test database
+    quest_graph._graphs.clear()
+    forget_bots()
+
+    return bot
+
+
+def get_user(user_id=7, username='joe'):
+    return {
+        'id': user_id,
+        'is_bot': False,
+        'first_name': 'Joe',
+        'username': username,
+        'language_code': 'en',
+    }
+
+
+def get_message(message_id, text, chat_id=CHAT_ID):
+    return {
+        'message_id': message_id,
+        'date': 1500000000,
+        'chat': {
+            'id': chat_id,
+            'type': 'private',
+            'username': 'joe',
+            'first_name': 'Joe',
+        },
+        'from': get_user(),
+        'text': text,
+    }
+
+
+def message_update(update_id, text) -> dict:
+    return {'update_id': update_id, 'message': get_message(update_id, text)}
+
+
+def callback_update(update_id, data) -> dict:
+    message = get_message(update_id, 'Choose')
+    message['from'] = get_user(1, 'testbot')
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': update_id,
+            'data': data,
+            'from': get_user(),
+            'message': message,
+        },
+    }
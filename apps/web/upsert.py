@@ -0,0 +1,93 @@
+"""Insert or update a row in a single statement
+
+``INSERT ... ON CONFLICT DO UPDATE`` is used by PostgreSQL and SQLite
+3.24+, other backends fall back to ``update_or_create``. Primary key of
+the row is returned by the same statement with ``RETURNING`` on
+PostgreSQL and SQLite 3.35+.
+
+"""
+import sqlite3
+
+from django.db import connection
+from django.db.models import AutoField
+
+
+def supports_on_conflict() -> bool:
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 24, 0)
+    return False
+
+
+def supports_returning() -> bool:
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 35, 0)
+    return False
+
+
+def upsert(model, conflict_field, values: dict, inserted: dict = None):
+    """Insert the row or update ``values`` of the one with the same
+    ``conflict_field``, which must be unique
+
+    ``inserted`` values are set only on inserting. Fields absent in both
+    get defaults on inserting and are kept on updating, ``auto_now`` fields
+    are always set. Return primary key of the row or ``None`` if the
+    backend can't return it at once
+
+    """
+    inserted = inserted or {}
+
+    if not supports_on_conflict():
+        lookup = {conflict_field: values[conflict_field]}
+        defaults = {k: v for k, v in values.items() if k != conflict_field}
+        instance, created = model.objects.update_or_create(
+            defaults=defaults,
+            **lookup
+        )
+        if created and inserted:
+            model.objects.filter(pk=instance.pk).update(**inserted)
+        return instance.pk
+
+    instance = model(**dict(inserted, **values))
+    quote = connection.ops.quote_name
+
+    fields = [
+        i for i in model._meta.concrete_fields if not isinstance(i, AutoField)
+    ]
+    params = [
+        i.get_db_prep_save(i.pre_save(instance, True), connection)
+        for i in fields
+    ]
+    updated = [
+        i.column for i in fields
+        if (i.name in values and i.name != conflict_field)
+        or getattr(i, 'auto_now', False)
+    ]
+
+    sql = (
+        'INSERT INTO {table} ({columns}) VALUES ({values}) '
+        'ON CONFLICT ({conflict}) DO {action}'
+    ).format(
+        table=quote(model._meta.db_table),
+        columns=', '.join(quote(i.column) for i in fields),
+        values=', '.join(['%s'] * len(fields)),
+        conflict=quote(model._meta.get_field(conflict_field).column),
+        action='UPDATE SET {}'.format(', '.join(
+            '{0} = excluded.{0}'.format(quote(i)) for i in updated
+        )) if updated else 'NOTHING',
+    )
+
+    # row isn't returned if nothing is updated
+    returning = bool(updated) and supports_returning()
+    if returning:
+        sql += ' RETURNING {}'.format(quote(model._meta.pk.column))
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        if returning:
+            return cursor.fetchone()[0]
+
+    return None
@@ -1,4 +1,5 @@
 import ast
+import json
 
 from django.http import HttpResponse
 
@@ -7,9 +8,15 @@ from rest_framework import status
 
 def jinja2_template_context(context):
     try:
-        value = ast.literal_eval(context)
-        assert isinstance(value, dict)
-    except ValueError:
+        value = json.loads(context)
+    except (TypeError, ValueError):
+        # contexts saved before JSON validation was introduced
+        try:
+            value = ast.literal_eval(context)
+        except (ValueError, SyntaxError):
+            value = {}
+
+    if not isinstance(value, dict):
         value = {}
 
     return value
@@ -1,20 +1,19 @@
-import ast
 import json
 import re
 
-from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext_lazy as _
 
-from jinja2 import Environment, TemplateSyntaxError
+from jinja2 import TemplateSyntaxError
 
+from apps.web import keyboards
 from apps.web.custom_eval import eval as custom_eval
+from apps.web.templating import compile_template
 
 
 def jinja2_template_validator(value: str):
     try:
-        env = Environment(extensions=settings.JINJA2_EXTENTIONS)
-        env.from_string(value)
+        compile_template(value)
     except TemplateSyntaxError:
         raise ValidationError(_("Jinja error: %(error)s"),
                               params={'error': value})
@@ -40,11 +39,30 @@ def json_field_validator(value: str):
         )
 
 
+def context_update_validator(value: str):
+    try:
+        value = json.loads(value)
+        assert isinstance(value, dict)
+        assert set(value) <= {'$inc', '$set'}
+        assert all(isinstance(i, dict) for i in value.values())
+        assert all(
+            isinstance(i, (int, float)) and not isinstance(i, bool)
+            for i in value.get('$inc', {}).values()
+        )
+    except (ValueError, AssertionError):
+        raise ValidationError(
+            _('%(value)s is not a valid context update, example: '
+              '{"$inc": {"score": 1}, "$set": {"level": "cave"}}'),
+            code='invalid',
+            params={'value': value},
+        )
+
+
 def array_field_validator(value: str):
     try:
-        value = ast.literal_eval(value)
+        value = keyboards.loads(value)
         assert isinstance(value, list)
-    except (ValueError, AssertionError, SyntaxError):
+    except (ValueError, AssertionError):
         raise ValidationError(
             _('It is not a valid keyboard layout, example: [["one"]]'),
             code='invalid',